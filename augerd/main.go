@@ -0,0 +1,96 @@
+// augerd is a long-lived Auger worker. It is built inside the Auger source
+// tree (see the service Dockerfiles) and serves encode/decode requests over a
+// framed stdin/stdout protocol, so the Python services do not have to fork
+// the auger CLI for every object.
+//
+// Request frame:  op (1 byte) | payload length (uint32, big endian) | payload
+// Response frame: status (1 byte, 0 = ok, 1 = error) | length | payload
+//
+// Ops:
+//
+//	'Y' decode a storage value to YAML
+//	'J' decode a storage value to JSON
+//	'E' encode a YAML (or JSON) document to the kube-apiserver storage format
+package main
+
+import (
+	"bufio"
+	"bytes"
+	"encoding/binary"
+	"fmt"
+	"io"
+	"os"
+
+	"github.com/etcd-io/auger/pkg/encoding"
+	"github.com/etcd-io/auger/pkg/scheme"
+)
+
+const (
+	opDecodeYaml = 'Y'
+	opDecodeJson = 'J'
+	opEncode     = 'E'
+
+	statusOk    = 0
+	statusError = 1
+)
+
+func handle(op byte, in []byte) ([]byte, error) {
+	if len(in) == 0 {
+		return nil, fmt.Errorf("no input data")
+	}
+
+	out := &bytes.Buffer{}
+	var err error
+	switch op {
+	case opDecodeYaml:
+		_, err = encoding.DetectAndConvert(scheme.Codecs, encoding.YamlMediaType, in, out)
+	case opDecodeJson:
+		_, err = encoding.DetectAndConvert(scheme.Codecs, encoding.JsonMediaType, in, out)
+	case opEncode:
+		_, err = encoding.Convert(scheme.Codecs, encoding.YamlMediaType, encoding.StorageBinaryMediaType, in, out)
+	default:
+		err = fmt.Errorf("unknown op %q", op)
+	}
+	return out.Bytes(), err
+}
+
+func writeFrame(w *bufio.Writer, status byte, payload []byte) error {
+	header := make([]byte, 5)
+	header[0] = status
+	binary.BigEndian.PutUint32(header[1:], uint32(len(payload)))
+	if _, err := w.Write(header); err != nil {
+		return err
+	}
+	if _, err := w.Write(payload); err != nil {
+		return err
+	}
+	return w.Flush()
+}
+
+func main() {
+	r := bufio.NewReader(os.Stdin)
+	w := bufio.NewWriter(os.Stdout)
+	header := make([]byte, 5)
+
+	for {
+		if _, err := io.ReadFull(r, header); err != nil {
+			// EOF means the parent closed our stdin: shut down quietly.
+			return
+		}
+		payload := make([]byte, binary.BigEndian.Uint32(header[1:]))
+		if _, err := io.ReadFull(r, payload); err != nil {
+			return
+		}
+
+		out, err := handle(header[0], payload)
+		if err != nil {
+			err = writeFrame(w, statusError, []byte(err.Error()))
+		} else {
+			err = writeFrame(w, statusOk, out)
+		}
+		if err != nil {
+			fmt.Fprintln(os.Stderr, "augerd write error:", err)
+			return
+		}
+	}
+}
@@ -0,0 +1,3 @@
+"""
+Code shared by the API server, scheduler and controller services.
+"""
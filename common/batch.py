@@ -0,0 +1,60 @@
+"""
+Multi-key etcd reads and writes.
+
+etcd has no multi-get, but a transaction can carry many range, put and
+delete operations, so N keys cost one round trip instead of N. etcd rejects
+transactions with more than --max-txn-ops operations (128 by default), so
+larger batches are split into chunks of that size.
+"""
+import os
+
+ETCD_MAX_TXN_OPS = int(os.environ.get("ETCD_MAX_TXN_OPS", "128"))
+
+
+def chunked(items, size=ETCD_MAX_TXN_OPS):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def get_many(etcd, keys):
+    """
+    Read many keys. Returns {key: (value, metadata)} for the keys that exist.
+    """
+    found = {}
+    for chunk in chunked(keys):
+        _, responses = etcd.transaction(
+            compare=[],
+            success=[etcd.transactions.get(key) for key in chunk]
+        )
+        for key, kvs in zip(chunk, responses):
+            if kvs:
+                found[key] = kvs[0]
+    return found
+
+
+def put_many(etcd, items):
+    """
+    Write many (key, value) pairs, one transaction per chunk.
+    """
+    for chunk in chunked(items):
+        etcd.transaction(
+            compare=[],
+            success=[etcd.transactions.put(key, value) for key, value in chunk]
+        )
+
+
+def delete_many(etcd, keys):
+    """
+    Delete many keys, one transaction per chunk. Returns the keys that existed.
+    """
+    deleted = []
+    for chunk in chunked(keys):
+        _, responses = etcd.transaction(
+            compare=[],
+            success=[etcd.transactions.delete(key) for key in chunk]
+        )
+        for key, response in zip(chunk, responses):
+            if response.response_delete_range.deleted:
+                deleted.append(key)
+    return deleted
@@ -0,0 +1,125 @@
+"""
+Bounded LRU cache of decoded etcd objects, keyed by etcd key and mod_revision.
+
+Decoding a Protobuf value goes through Auger, so services that read the same
+pods over and over keep the parsed result here. An entry is only returned when
+the caller presents the same mod_revision it was stored with, so a cached
+object is never stale. Objects are kept as compact JSON and parsed on every
+hit, which gives callers their own copy to mutate.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from common import metrics
+from common.codec import detect_and_parse, parallel_map
+
+CACHE_MAX_ENTRIES = int(os.environ.get("OBJECT_CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_BYTES = int(os.environ.get("OBJECT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+class ObjectCache:
+    """
+    LRU cache holding one entry (the latest seen revision) per etcd key.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (mod_revision, encoded JSON)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, mod_revision):
+        """
+        Return a copy of the object stored for key at mod_revision, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != mod_revision:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            encoded = entry[1]
+        return json.loads(encoded)
+
+    def put(self, key, mod_revision, obj):
+        encoded = json.dumps(obj, default=str)
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                # Never replace a newer revision with an older one
+                if previous[0] > mod_revision:
+                    self._entries[key] = previous
+                    return
+                self._bytes -= len(previous[1])
+
+            self._entries[key] = (mod_revision, encoded)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= len(entry[1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Shared by everything in the process
+object_cache = ObjectCache()
+metrics.cache_metrics("object_cache", "decoded object cache", object_cache.stats)
+
+
+def parse_cached(key, value, mod_revision):
+    """
+    detect_and_parse() with the shared revision-keyed cache in front of it.
+    """
+    if isinstance(key, bytes):
+        key = key.decode()
+
+    obj = object_cache.get(key, mod_revision)
+    if obj is not None:
+        return obj
+
+    obj = detect_and_parse(value)
+    if obj is not None:
+        object_cache.put(key, mod_revision, obj)
+    return obj
+
+
+def parse_cached_many(items):
+    """
+    parse_cached() for many (key, value, mod_revision) tuples, decoding the
+    cache misses in parallel. Returns the objects in the same order.
+    """
+    return parallel_map(lambda item: parse_cached(*item), items)
@@ -0,0 +1,151 @@
+"""
+Compare-and-swap writes to etcd.
+
+A read-modify-write is only safe if nobody wrote the key in between, e.g.
+another scheduler replica binding the same pod. Every write here is a
+transaction that only succeeds if the key is still at the mod_revision that
+was read (0 means the key must not exist). After a conflict the latest
+version is read and the change is applied to it again, a bounded number of
+times. Conflicts are counted so they can be watched.
+"""
+import os
+import threading
+
+from common import metrics
+from common.batch import chunked
+from common.cache import object_cache, parse_cached
+from common.codec import CodecError, encode
+
+CAS_MAX_RETRIES = int(os.environ.get("CAS_MAX_RETRIES", "5"))
+
+
+class ConflictError(Exception):
+    """Raised when a key kept changing during a read-modify-write."""
+
+
+class ConflictStats:
+    """
+    Counters of compare-and-swap writes in this process.
+    """
+
+    def __init__(self):
+        self.writes = 0
+        self.conflicts = 0
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    def record(self, writes=0, conflicts=0, exhausted=0):
+        with self._lock:
+            self.writes += writes
+            self.conflicts += conflicts
+            self.exhausted += exhausted
+
+    def stats(self):
+        with self._lock:
+            attempts = self.writes + self.conflicts
+            return {
+                "writes": self.writes,
+                "conflicts": self.conflicts,
+                "retries_exhausted": self.exhausted,
+                "conflict_ratio": self.conflicts / attempts if attempts else 0.0,
+            }
+
+
+# Shared by everything in the process
+conflict_stats = ConflictStats()
+metrics.callback_counter(
+    "cas_writes", "Compare-and-swap writes that succeeded.", lambda: conflict_stats.stats()["writes"]
+)
+metrics.callback_counter(
+    "cas_conflicts", "Compare-and-swap writes that lost to another writer.", lambda: conflict_stats.stats()["conflicts"]
+)
+metrics.callback_gauge(
+    "cas_conflict_ratio", "Share of compare-and-swap writes that conflicted.",
+    lambda: conflict_stats.stats()["conflict_ratio"],
+)
+
+
+def put_if_unchanged(etcd, key, value, mod_revision):
+    """
+    Write value if key is still at mod_revision. Returns (succeeded, current)
+    where current is the (value, metadata) found on conflict, or None if the
+    key does not exist.
+    """
+    succeeded, responses = etcd.transaction(
+        compare=[etcd.transactions.mod(key) == mod_revision],
+        success=[etcd.transactions.put(key, value)],
+        failure=[etcd.transactions.get(key)]
+    )
+    if succeeded:
+        conflict_stats.record(writes=1)
+        return True, None
+    conflict_stats.record(conflicts=1)
+    return False, responses[0][0] if responses[0] else None
+
+
+def put_many_if_unchanged(etcd, items):
+    """
+    Write many (key, value, mod_revision) items, one transaction per chunk.
+    A transaction fails as a whole if any of its keys changed, so the
+    unchanged items of a failed chunk are written again without the others.
+    Returns {key: current (value, metadata) or None} for the keys that changed.
+    """
+    conflicts = {}
+    for chunk in chunked(items):
+        while chunk:
+            succeeded, responses = etcd.transaction(
+                compare=[etcd.transactions.mod(key) == mod_revision for key, _, mod_revision in chunk],
+                success=[etcd.transactions.put(key, value) for key, value, _ in chunk],
+                failure=[etcd.transactions.get(key) for key, _, _ in chunk]
+            )
+            if succeeded:
+                conflict_stats.record(writes=len(chunk))
+                break
+
+            # The failure branch read the keys in the same transaction, so at
+            # least one of them is found changed and the loop makes progress
+            unchanged = []
+            for item, kvs in zip(chunk, responses):
+                current = kvs[0] if kvs else None
+                if (current[1].mod_revision if current else 0) == item[2]:
+                    unchanged.append(item)
+                else:
+                    conflicts[item[0]] = current
+            conflict_stats.record(conflicts=len(chunk) - len(unchanged))
+            chunk = unchanged
+    return conflicts
+
+
+def update_object(etcd, key, obj, mod_revision, apply, max_retries=CAS_MAX_RETRIES):
+    """
+    Read-modify-write of one object with optimistic concurrency.
+
+    apply(obj) changes obj in place and returns False if there is nothing
+    to write (e.g. the change is already there). It is called with obj as
+    read at mod_revision and, after every conflict, with the latest version.
+    Returns the object as it is stored, or None if the key was deleted.
+    Raises ConflictError after max_retries conflicts.
+    """
+    for _ in range(max_retries + 1):
+        if not apply(obj):
+            return obj
+
+        value = encode(key, obj)
+        if value is None:
+            raise CodecError(f"Failed to encode {key}")
+
+        succeeded, current = put_if_unchanged(etcd, key, value, mod_revision)
+        object_cache.invalidate(key)
+        if succeeded:
+            return obj
+        if current is None:
+            return None
+
+        value, metadata = current
+        mod_revision = metadata.mod_revision
+        obj = parse_cached(key, value, mod_revision)
+        if obj is None:
+            raise CodecError(f"Failed to decode {key}")
+
+    conflict_stats.record(exhausted=1)
+    raise ConflictError(f"{key} kept changing, gave up after {max_retries} retries")
@@ -0,0 +1,466 @@
+"""
+Codec engine shared by all services.
+
+Objects are stored in etcd in the kube-apiserver protobuf format, which we
+convert with Auger. Forking the auger CLI for every object is expensive, so
+encode/decode requests are sent to a pool of long-lived `augerd` workers
+(see `augerd/main.go`) that speak a framed stdin/stdout protocol. When the
+worker binary is not available we fall back to the one-shot CLI.
+
+Resource types that Kubernetes itself does not need to read can be stored
+in a compact format instead, JSON or msgpack, which the services encode
+and decode in process:
+
+    STORAGE_CODEC    codec of all resource types: protobuf (default), json
+                     or msgpack
+    STORAGE_CODECS   per resource type overrides, e.g.
+                     `replicasets=json,example.com/widgets=msgpack`
+
+Stored values are decoded by the codec their first bytes identify, so
+values written in different formats can be read side by side.
+"""
+import json
+import os
+import queue
+import struct
+import subprocess
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from common import metrics, tracing
+
+# Auger binaries (built into the service images)
+AUGER_BIN = os.environ.get("AUGER_BIN", "./auger/build/auger")
+AUGERD_BIN = os.environ.get("AUGERD_BIN", "./auger/build/augerd")
+
+# Number of long-lived workers, 0 disables the pool
+AUGER_WORKERS = int(os.environ.get("AUGER_WORKERS", "4"))
+
+OP_DECODE_YAML = b"Y"
+OP_DECODE_JSON = b"J"
+OP_ENCODE = b"E"
+
+STATUS_OK = 0
+
+_HEADER = struct.Struct(">cI")
+_RESPONSE_HEADER = struct.Struct(">BI")
+
+
+class CodecError(Exception):
+    """Raised when Auger rejects an encode or decode request."""
+
+
+class AugerWorker:
+    """
+    A single `augerd` process. A worker serves one request at a time, the pool
+    makes sure it is only used by one thread.
+    """
+
+    def __init__(self, binary):
+        self.process = subprocess.Popen(
+            [binary],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def request(self, op, payload):
+        """
+        Send one framed request and wait for the response payload.
+        Raises CodecError if Auger failed, OSError if the worker died.
+        """
+        self.process.stdin.write(_HEADER.pack(op, len(payload)))
+        self.process.stdin.write(payload)
+        self.process.stdin.flush()
+
+        header = self._read_exactly(_RESPONSE_HEADER.size)
+        status, length = _RESPONSE_HEADER.unpack(header)
+        body = self._read_exactly(length)
+
+        if status != STATUS_OK:
+            raise CodecError(body.decode("utf-8", errors="replace"))
+        return body
+
+    def _read_exactly(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.process.stdout.read(size - len(data))
+            if not chunk:
+                raise OSError("augerd worker exited unexpectedly")
+            data += chunk
+        return data
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=1)
+        except Exception:
+            self.process.kill()
+
+
+class AugerPool:
+    """
+    A bounded pool of `augerd` workers. Workers are started lazily and
+    replaced when they die.
+    """
+
+    def __init__(self, binary, size):
+        self.binary = binary
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return AugerWorker(self.binary)
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        return self._idle.get()
+
+    def _discard(self, worker):
+        worker.close()
+        with self._lock:
+            self._created -= 1
+
+    def call(self, op, payload):
+        """
+        Run one request on an idle worker. A request that fails because the
+        worker died is retried once on a fresh worker.
+        """
+        for attempt in range(2):
+            worker = self._checkout()
+            try:
+                result = worker.request(op, payload)
+            except CodecError:
+                self._idle.put(worker)
+                raise
+            except (OSError, ValueError):
+                self._discard(worker)
+                if attempt == 1:
+                    raise
+                continue
+            self._idle.put(worker)
+            return result
+
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Return the shared worker pool, or None if `augerd` is not available.
+    """
+    global _pool
+    if _pool is None and AUGER_WORKERS > 0 and os.path.exists(AUGERD_BIN):
+        with _pool_lock:
+            if _pool is None:
+                _pool = AugerPool(AUGERD_BIN, AUGER_WORKERS)
+    return _pool
+
+
+def _run_auger_cli(args, data):
+    """
+    Run the auger CLI once (one fork+exec per call).
+    """
+    process = subprocess.run(
+        [AUGER_BIN] + args,
+        input=data,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if process.returncode != 0:
+        raise CodecError(process.stderr.decode("utf-8", errors="replace"))
+    return process.stdout
+
+
+def _convert(op, cli_args, data):
+    pool = get_pool()
+    if pool is not None:
+        try:
+            return pool.call(op, data)
+        except OSError:
+            traceback.print_exc()
+    return _run_auger_cli(cli_args, data)
+
+
+def auger_decode(data: bytes) -> str:
+    """
+    Decode a Protobuf value from etcd to a YAML document.
+    """
+    try:
+        with metrics.CODEC_DURATION.time("decode"), tracing.span("codec.decode"):
+            return _convert(OP_DECODE_YAML, ["decode"], data).decode("utf-8")
+    except CodecError as e:
+        print("Auger error:", e)
+        return None
+
+
+def auger_encode(data_dict: dict) -> bytes:
+    """
+    Encode a Python dictionary to Protobuf format using Auger.
+    The dictionary is passed to Auger as JSON, which is valid YAML input.
+    """
+    try:
+        with metrics.CODEC_DURATION.time("encode"), tracing.span("codec.encode"):
+            document = json.dumps(data_dict, default=str).encode("utf-8")
+            return _convert(OP_ENCODE, ["encode"], document)
+    except CodecError as e:
+        print("Auger encoding error:", e)
+        return None
+
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _pool_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(AUGER_WORKERS, 1), thread_name_prefix="auger")
+    return _executor
+
+
+def parallel_map(function, items):
+    """
+    Call function on every item, in parallel with one thread per Auger
+    worker. Returns the results in the same order.
+    """
+    items = list(items)
+    if len(items) < 2:
+        return [function(item) for item in items]
+    return list(_get_executor().map(tracing.bind(function), items))
+
+
+def auger_encode_many(data_dicts):
+    """
+    Encode several dictionaries in parallel, one per Auger worker.
+    Returns the encoded values in the same order (None for failures).
+    """
+    return parallel_map(auger_encode, data_dicts)
+
+
+def decode_object(data: bytes) -> dict:
+    """
+    Decode a Protobuf value from etcd to a Python dictionary. The workers
+    return JSON, which is much cheaper to parse than YAML.
+    """
+    with metrics.CODEC_DURATION.time("decode_object"), tracing.span("codec.decode_object"):
+        return _decode_object(data)
+
+
+def _decode_object(data):
+    pool = get_pool()
+    if pool is not None:
+        try:
+            return json.loads(pool.call(OP_DECODE_JSON, data))
+        except OSError:
+            traceback.print_exc()
+    import yaml
+
+    # Prefer the libyaml bindings when they are installed
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    return yaml.load(_run_auger_cli(["decode"], data), Loader=loader)
+
+
+# Prefixes that identify the format of a stored value. kube-apiserver writes
+# protobuf behind PROTOBUF_MAGIC and JSON (e.g. custom resources) as is.
+PROTOBUF_MAGIC = b"k8s\x00"
+MSGPACK_MAGIC = b"mpk\x00"
+
+STORAGE_CODEC = os.environ.get("STORAGE_CODEC", "protobuf")
+STORAGE_CODECS = os.environ.get("STORAGE_CODECS", "")
+
+
+class ProtobufCodec:
+    """
+    kube-apiserver protobuf through Auger, the format Kubernetes reads.
+    """
+
+    name = "protobuf"
+    magic = PROTOBUF_MAGIC
+
+    def encode(self, obj):
+        return auger_encode(obj)
+
+    def decode(self, value):
+        return decode_object(value)
+
+
+class JSONCodec:
+    """
+    Compact JSON, as kube-apiserver stores custom resources.
+    """
+
+    name = "json"
+    magic = b"{"
+
+    def encode(self, obj):
+        with metrics.CODEC_DURATION.time("json_encode"):
+            return json.dumps(obj, separators=(",", ":"), default=str).encode("utf-8")
+
+    def decode(self, value):
+        with metrics.CODEC_DURATION.time("json_decode"):
+            return json.loads(value)
+
+
+class MsgpackCodec:
+    """
+    msgpack behind MSGPACK_MAGIC, smaller than JSON but only readable by
+    these services. Needs the msgpack package.
+    """
+
+    name = "msgpack"
+    magic = MSGPACK_MAGIC
+
+    def encode(self, obj):
+        import msgpack
+
+        with metrics.CODEC_DURATION.time("msgpack_encode"):
+            return MSGPACK_MAGIC + msgpack.packb(obj, default=str)
+
+    def decode(self, value):
+        import msgpack
+
+        with metrics.CODEC_DURATION.time("msgpack_decode"):
+            return msgpack.unpackb(value[len(MSGPACK_MAGIC):])
+
+
+CODECS = {}
+
+
+def register_codec(codec):
+    """
+    Make a codec available to STORAGE_CODEC(S) and to the format detection.
+    """
+    CODECS[codec.name] = codec
+    return codec
+
+
+register_codec(ProtobufCodec())
+register_codec(JSONCodec())
+register_codec(MsgpackCodec())
+
+
+def parse_codec_settings(default, overrides):
+    """
+    Return (default codec name, {resource type: codec name}) of the
+    STORAGE_CODEC and STORAGE_CODECS settings.
+    """
+    names = {}
+    for entry in overrides.split(","):
+        if not entry.strip():
+            continue
+        resource_type, _, name = entry.partition("=")
+        names[resource_type.strip().strip("/")] = name.strip()
+
+    for name in [default] + list(names.values()):
+        if name not in CODECS:
+            raise ValueError(f"Unknown storage codec '{name}', expected one of {sorted(CODECS)}")
+        if name == "msgpack":
+            import importlib.util
+
+            if importlib.util.find_spec("msgpack") is None:
+                raise ImportError("The msgpack storage codec needs the msgpack package")
+    return default, names
+
+
+_default_codec, _codec_names = parse_codec_settings(STORAGE_CODEC, STORAGE_CODECS)
+
+
+def codec_for_key(key):
+    """
+    Codec that new values of key are written in. Types are matched by the
+    key's first segment after /registry/ (`pods`), or the first two for
+    custom resources (`example.com/widgets`).
+    """
+    if isinstance(key, bytes):
+        key = key.decode()
+    parts = key.split("/")
+    if len(parts) > 3 and parts[1] == "registry":
+        name = _codec_names.get(f"{parts[2]}/{parts[3]}") or _codec_names.get(parts[2])
+        if name:
+            return CODECS[name]
+    return CODECS[_default_codec]
+
+
+def codec_for_value(value):
+    """
+    Codec of a stored value, by its prefix. Values without a known prefix
+    are read as JSON.
+    """
+    for codec in CODECS.values():
+        if value.startswith(codec.magic):
+            return codec
+    return CODECS["json"]
+
+
+def encode(key, obj):
+    """
+    Encode an object for storage under key, in the codec of its resource
+    type. Returns None if encoding fails.
+    """
+    codec = codec_for_key(key)
+    try:
+        return codec.encode(obj)
+    except (TypeError, ValueError) as e:
+        print(f"Failed to encode {key} as {codec.name}:", e)
+        return None
+
+
+def encode_many(items):
+    """
+    Encode many (key, object) pairs. Returns the values in the same order
+    (None for failures).
+    """
+    items = list(items)
+    # Only Auger calls leave the process, the other codecs gain nothing from threads
+    if any(codec_for_key(key) is CODECS["protobuf"] for key, _ in items):
+        return parallel_map(lambda item: encode(*item), items)
+    return [encode(key, obj) for key, obj in items]
+
+
+def detect_and_parse(value):
+    """
+    Decode a stored value with the codec its prefix identifies.
+    Returns a Python dictionary or None if parsing fails.
+    """
+    try:
+        return codec_for_value(value).decode(value)
+    except Exception:
+        traceback.print_exc()
+        return None
+
+
+def decode_yaml(value):
+    """
+    A stored value as a YAML document, or None if it cannot be decoded.
+    """
+    if value.startswith(PROTOBUF_MAGIC):
+        return auger_decode(value)
+    obj = detect_and_parse(value)
+    if obj is None:
+        return None
+    import yaml
+
+    return yaml.safe_dump(obj)
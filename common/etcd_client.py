@@ -0,0 +1,127 @@
+"""
+etcd client that connects on first use.
+
+Importing etcd3 pulls in grpc and the generated protobuf modules, which is
+a large part of a service's import time. Services create their client at
+import, so the client is a stand-in that imports etcd3 and connects the
+first time it is used, e.g. by the warm-up after the server started.
+
+STORAGE_BACKEND selects what the client talks to: `etcd` (the default) or
+`memory`, the in-process store of common.memory_etcd, which lets the
+services run without an etcd cluster.
+
+The key-value calls are timed into the etcd_request_duration_seconds
+histogram of /metrics and recorded as spans of the current trace.
+"""
+import os
+import threading
+
+from common import metrics, tracing
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "etcd")
+BACKENDS = ("etcd", "memory")
+
+
+class RevisionCompacted(Exception):
+    """The requested revision has been compacted."""
+
+
+class LazyClient:
+    """
+    Behaves like the etcd3 client created with the given arguments, or like
+    the shared in-memory store with the memory backend.
+    """
+
+    def __init__(self, backend=STORAGE_BACKEND, **kwargs):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown storage backend '{backend}', expected one of {BACKENDS}")
+        self.backend = backend
+        self._kwargs = kwargs
+        self._client = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """
+        Create the real client if that did not happen yet, and return it.
+        """
+        if self._client is None:
+            with self._lock:
+                if self._client is None and self.backend == "memory":
+                    from common.memory_etcd import shared_store
+                    self._client = shared_store()
+                elif self._client is None:
+                    import etcd3
+                    self._client = etcd3.client(**self._kwargs)
+        return self._client
+
+    def ping(self):
+        """
+        Connect and make one read, so that the channel and TLS session are
+        set up before the first request needs them.
+        """
+        self.connect().get("/")
+
+    def get(self, key, **kwargs):
+        with metrics.ETCD_DURATION.time("get"), tracing.span("etcd.get", key=key):
+            return self.connect().get(key, **kwargs)
+
+    def put(self, key, value, **kwargs):
+        with metrics.ETCD_DURATION.time("put"), tracing.span("etcd.put", key=key):
+            return self.connect().put(key, value, **kwargs)
+
+    def delete(self, key, **kwargs):
+        with metrics.ETCD_DURATION.time("delete"), tracing.span("etcd.delete", key=key):
+            return self.connect().delete(key, **kwargs)
+
+    def transaction(self, compare, success=None, failure=None):
+        with metrics.ETCD_DURATION.time("txn"), tracing.span("etcd.txn"):
+            return self.connect().transaction(compare, success, failure)
+
+    def get_prefix_response(self, key_prefix, **kwargs):
+        with metrics.ETCD_DURATION.time("range"), tracing.span("etcd.range", key=key_prefix):
+            return self.connect().get_prefix_response(key_prefix, **kwargs)
+
+    def range(self, start, end, limit=0, revision=0, keys_only=False):
+        """
+        Read up to `limit` keys (0 for no limit) in [start, end) at
+        `revision` (0 for the latest). Returns the RangeResponse, with kvs,
+        more, count and header. Raises RevisionCompacted if revision is gone.
+        """
+        client = self.connect()
+        with metrics.ETCD_DURATION.time("range"), tracing.span("etcd.range", key=start, limit=limit):
+            if self.backend == "memory":
+                return client.range(start, end, limit, revision, keys_only)
+            return _etcd3_range(client, start, end, limit, revision, keys_only)
+
+    def get_prefix(self, key_prefix, **kwargs):
+        # A generator: the range request is made when the first item is taken
+        items = self.connect().get_prefix(key_prefix, **kwargs)
+        with metrics.ETCD_DURATION.time("range"), tracing.span("etcd.range", key=key_prefix):
+            first = next(items, None)
+        if first is None:
+            return
+        yield first
+        yield from items
+
+    def __getattr__(self, name):
+        return getattr(self.connect(), name)
+
+
+def _etcd3_range(client, start, end, limit, revision, keys_only):
+    # etcd3 0.12 silently drops the `limit` and `revision` arguments of its
+    # range calls, so the RangeRequest is built here
+    import grpc
+    from etcd3 import etcdrpc
+
+    request = etcdrpc.RangeRequest(key=start, range_end=end, limit=limit, revision=revision, keys_only=keys_only)
+    try:
+        return client.kvstub.Range(
+            request,
+            client.timeout,
+            credentials=client.call_credentials,
+            metadata=client.metadata
+        )
+    except grpc.RpcError as e:
+        if e.code() == grpc.StatusCode.OUT_OF_RANGE:
+            raise RevisionCompacted(f"Revision {revision} has been compacted")
+        raise
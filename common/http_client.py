@@ -0,0 +1,266 @@
+"""
+Pooled HTTP client for calls between the services.
+
+There is one client per target service. Each keeps a keep-alive connection
+pool, applies connect/read deadlines to every call, retries idempotent calls
+with jittered exponential backoff, and trips a circuit breaker when the
+service keeps failing so callers fail fast instead of piling up on it.
+requests is imported, and the pool created, on the first call, so creating
+the clients at import costs nothing at startup.
+"""
+import os
+import random
+import threading
+import time
+
+from common import metrics, tracing
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "2"))
+# Generous by default: a call can land on a Knative cold start
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "30"))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.environ.get("HTTP_BACKOFF", "0.1"))
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "32"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get("CIRCUIT_RESET_TIMEOUT", "10"))
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+# Responses that mean the service is overloaded or unavailable
+RETRYABLE_STATUS = {502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit breaker is open."""
+
+
+def not_sent(error):
+    """
+    Whether a failed call certainly never reached the service: the breaker
+    was open or no connection could be made. After a read timeout or a
+    dropped connection the service may have done the work.
+    """
+    import requests
+    from urllib3.exceptions import NewConnectionError
+
+    if isinstance(error, (CircuitOpenError, requests.ConnectTimeout)):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. After `reset_timeout`
+    seconds one trial call is let through (half-open): success closes the
+    circuit again, failure keeps it open for another period.
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class ServiceClient:
+    """
+    HTTP client for one downstream service.
+    """
+
+    def __init__(self, base_url, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 retries=HTTP_RETRIES, pool_size=HTTP_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.breaker = CircuitBreaker()
+
+        self.pool_size = pool_size
+        self.adapter = None
+        self.session = None
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.retried = 0
+        self.rejected = 0
+
+    def request(self, method, path, idempotent=None, timeout=None, **kwargs):
+        """
+        Call the service and return the requests.Response.
+
+        Calls are retried only if idempotent (by default: GET, HEAD, PUT,
+        DELETE, OPTIONS). Raises CircuitOpenError when the breaker is open and
+        requests.RequestException when every attempt failed.
+        """
+        import requests
+
+        session = self._session()
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempts = 1 + (self.retries if idempotent else 0)
+        headers = kwargs.pop("headers", None) or {}
+
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                with self._lock:
+                    self.rejected += 1
+                raise CircuitOpenError(f"Circuit open for {self.base_url}")
+
+            with self._lock:
+                self.in_flight += 1
+                self.requests += 1
+            start = time.perf_counter()
+            status = "error"
+            call_span = tracing.span(
+                f"HTTP {method} {path.split('?', 1)[0]}", tracing.CLIENT, service=self.base_url, attempt=attempt
+            )
+            try:
+                with call_span as current:
+                    # Pass the trace on, with this call as the parent of the remote span
+                    traceparent = tracing.current_traceparent()
+                    call_headers = {**headers, "traceparent": traceparent} if traceparent else headers
+                    response = session.request(
+                        method, f"{self.base_url}{path}", timeout=timeout or self.timeout, headers=call_headers, **kwargs
+                    )
+                    status = response.status_code
+                    if current is not None:
+                        current.set("http.status_code", status)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record_failure()
+                if attempt == attempts - 1:
+                    raise
+            except requests.RequestException:
+                self._record_failure()
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS:
+                    self.breaker.record_success()
+                    return response
+                self._record_failure()
+                if attempt == attempts - 1:
+                    return response
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+                self._observe(path, status, time.perf_counter() - start)
+
+            with self._lock:
+                self.retried += 1
+            # Full jitter: spread retries from many callers over the backoff window
+            time.sleep(random.uniform(0, HTTP_BACKOFF * 2 ** attempt))
+
+    def _session(self):
+        if self.session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            with self._lock:
+                if self.session is None:
+                    self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                    session = requests.Session()
+                    session.mount("http://", self.adapter)
+                    session.mount("https://", self.adapter)
+                    self.session = session
+        return self.session
+
+    def _observe(self, path, status, duration):
+        # Every attempt counts; the query string is left out to bound the label values
+        path = path.split("?", 1)[0]
+        metrics.HTTP_CLIENT_DURATION.observe(duration, self.base_url, path)
+        metrics.HTTP_CLIENT_REQUESTS.inc(self.base_url, path, status)
+
+    def _record_failure(self):
+        self.breaker.record_failure()
+        with self._lock:
+            self.failures += 1
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def stats(self):
+        pools = []
+        if self.adapter is not None:
+            # urllib3 refuses to iterate its pool container without holding its lock
+            container = self.adapter.poolmanager.pools
+            with container.lock:
+                pools = list(container._container.values())
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "failures": self.failures,
+                "retries": self.retried,
+                "rejected": self.rejected,
+                "in_flight": self.in_flight,
+                "circuit": self.breaker.state,
+                "connections_opened": sum(pool.num_connections for pool in pools),
+                "connections_in_use": sum(pool.pool.maxsize - pool.pool.qsize() for pool in pools if pool.pool is not None),
+            }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url):
+    """
+    Return the shared client for a service, creating it on first use.
+    """
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None:
+            client = _clients[base_url] = ServiceClient(base_url)
+        return client
+
+
+def stats():
+    """
+    Stats of every client in this process, by base URL.
+    """
+    with _clients_lock:
+        clients = dict(_clients)
+    return {base_url: client.stats() for base_url, client in clients.items()}
+
+
+metrics.callback_gauge(
+    "http_client_requests_in_flight",
+    "Calls to other services waiting for a response.",
+    lambda: {(base_url,): client_stats["in_flight"] for base_url, client_stats in stats().items()},
+    ["service"],
+)
+metrics.callback_gauge(
+    "http_client_circuit_open",
+    "1 while the circuit breaker of a service is open.",
+    lambda: {(base_url,): int(client_stats["circuit"] == "open") for base_url, client_stats in stats().items()},
+    ["service"],
+)
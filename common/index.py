@@ -0,0 +1,137 @@
+"""
+In-memory secondary indexes over etcd keys, fed by an Informer.
+"""
+import threading
+
+from common.selector import matches, object_fields, object_labels
+
+
+def namespace_of(key):
+    """
+    Extract the namespace from a `/registry/<resource>/<namespace>/<name>` key.
+    """
+    parts = key.split("/")
+    return parts[3] if len(parts) > 4 else ""
+
+
+class LabelIndex:
+    """
+    Index of keys by namespace and the value of a single label, e.g. all pods
+    in `default` with `replicaset=web`.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self._by_value = {}  # (namespace, value) -> {key: mod_revision}
+        self._by_key = {}  # key -> (namespace, value)
+        self._lock = threading.Lock()
+
+    def on_put(self, key, obj, mod_revision):
+        labels = (obj.get("metadata") or {}).get("labels") or {}
+        value = labels.get(self.label)
+
+        with self._lock:
+            self._remove(key)
+            if value is None:
+                return
+            entry = (namespace_of(key), value)
+            self._by_value.setdefault(entry, {})[key] = mod_revision
+            self._by_key[key] = entry
+
+    def on_delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def lookup(self, namespace, value):
+        """
+        Return {key: mod_revision} for every indexed key that matches.
+        """
+        with self._lock:
+            return dict(self._by_value.get((namespace, value), {}))
+
+    def _remove(self, key):
+        entry = self._by_key.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_value.get(entry)
+        if keys is not None:
+            keys.pop(key, None)
+            if not keys:
+                del self._by_value[entry]
+
+
+class SelectorIndex:
+    """
+    Index of keys by namespace, every label and the selectable fields, so
+    that label and field selectors are answered without scanning or decoding
+    objects.
+    """
+
+    def __init__(self):
+        self._by_term = {}  # (namespace, kind, name, value) -> {key: mod_revision}
+        self._by_namespace = {}  # namespace -> {key: mod_revision}
+        self._by_key = {}  # key -> (namespace, labels, fields, mod_revision)
+        self._lock = threading.Lock()
+
+    def on_put(self, key, obj, mod_revision):
+        namespace = namespace_of(key)
+        labels = object_labels(obj)
+        fields = object_fields(key, obj)
+
+        with self._lock:
+            self._remove(key)
+            self._by_key[key] = (namespace, labels, fields, mod_revision)
+            self._by_namespace.setdefault(namespace, {})[key] = mod_revision
+            for term in self._terms(namespace, labels, fields):
+                self._by_term.setdefault(term, {})[key] = mod_revision
+
+    def on_delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def select(self, namespace, label_requirements, field_requirements):
+        """
+        Return {key: mod_revision} of the keys in namespace that match every
+        requirement.
+        """
+        with self._lock:
+            # Start from the smallest set that equality requirements allow
+            candidates = self._by_namespace.get(namespace, {})
+            for kind, requirements in (("label", label_requirements), ("field", field_requirements)):
+                for name, op, values in requirements:
+                    if op not in ("=", "in"):
+                        continue
+                    keys = {}
+                    for value in values:
+                        keys.update(self._by_term.get((namespace, kind, name, value), {}))
+                    if len(keys) < len(candidates):
+                        candidates = keys
+
+            selected = {}
+            for key, mod_revision in candidates.items():
+                _, labels, fields, _ = self._by_key[key]
+                if matches(label_requirements, field_requirements, labels, fields):
+                    selected[key] = mod_revision
+            return selected
+
+    def _terms(self, namespace, labels, fields):
+        for name, value in labels.items():
+            yield (namespace, "label", name, value)
+        for name, value in fields.items():
+            yield (namespace, "field", name, value)
+
+    def _remove(self, key):
+        entry = self._by_key.pop(key, None)
+        if entry is None:
+            return
+        namespace, labels, fields, _ = entry
+        self._discard(self._by_namespace, namespace, key)
+        for term in self._terms(namespace, labels, fields):
+            self._discard(self._by_term, term, key)
+
+    def _discard(self, index, entry, key):
+        keys = index.get(entry)
+        if keys is not None:
+            keys.pop(key, None)
+            if not keys:
+                del index[entry]
@@ -0,0 +1,169 @@
+"""
+Keep an in-memory view of an etcd prefix up to date.
+
+An Informer lists the prefix once and then follows it with an etcd watch that
+starts right after the listed revision, so no change is missed in between.
+Registered handlers are called for every object that is added, modified or
+deleted. If the watch fails (for example because the revision was compacted)
+the prefix is listed again and handlers are brought back in sync.
+"""
+import threading
+import time
+import traceback
+
+from common.cache import parse_cached
+
+
+class Informer:
+    """
+    List-then-watch helper for one etcd prefix.
+
+    Handlers are called from the etcd watch thread:
+        on_put(key, obj, mod_revision)
+        on_delete(key)
+    While a handler runs, `revision` is the revision of the change it sees.
+    """
+
+    def __init__(self, etcd, prefix):
+        self.etcd = etcd
+        self.prefix = prefix
+        self.revision = 0
+        self._handlers = []
+        self._known = {}  # key -> mod_revision
+        self._watch_id = None
+        self._generation = 0
+        self._started = False
+        # _sync_lock serializes list/watch setup, _lock guards the local view.
+        # Watches are never registered while holding _lock: etcd3 confirms new
+        # watches on the same thread that runs our callbacks.
+        self._sync_lock = threading.Lock()
+        self._lock = threading.RLock()
+
+    def add_handler(self, on_put=None, on_delete=None):
+        with self._lock:
+            self._handlers.append((on_put, on_delete))
+
+    def start(self):
+        """
+        Seed the handlers and start watching. Safe to call more than once.
+        """
+        with self._sync_lock:
+            if self._started:
+                return
+            self._resync()
+            self._started = True
+
+    def stop(self):
+        with self._sync_lock:
+            self._cancel_watch()
+            with self._lock:
+                self._generation += 1
+            self._started = False
+
+    def keys(self):
+        with self._lock:
+            return dict(self._known)
+
+    def has(self, key):
+        with self._lock:
+            return key in self._known
+
+    def _cancel_watch(self):
+        if self._watch_id is not None:
+            try:
+                self.etcd.cancel_watch(self._watch_id)
+            except Exception:
+                traceback.print_exc()
+            self._watch_id = None
+
+    def _resync(self):
+        """
+        List the prefix, reconcile handlers with it and (re)start the watch.
+        Must be called with _sync_lock held.
+        """
+        self._cancel_watch()
+
+        response = self.etcd.get_prefix_response(self.prefix)
+        with self._lock:
+            # Responses from the previous watch are ignored from now on
+            self._generation += 1
+            generation = self._generation
+
+            live = set()
+            for kv in response.kvs:
+                key = kv.key.decode()
+                live.add(key)
+                self.revision = kv.mod_revision
+                self._handle_put(key, kv.value, kv.mod_revision)
+            self.revision = response.header.revision
+            for key in set(self._known) - live:
+                self._handle_delete(key)
+
+        self._watch_id = self.etcd.add_watch_prefix_callback(
+            self.prefix,
+            lambda watch_response: self._on_watch_response(generation, watch_response),
+            start_revision=response.header.revision + 1
+        )
+
+    def _on_watch_response(self, generation, response):
+        # Imported here, etcd3 is only loaded once the client connects
+        if getattr(self.etcd, "backend", "etcd") == "memory":
+            from common.memory_etcd import DeleteEvent
+        else:
+            from etcd3.events import DeleteEvent
+
+        with self._lock:
+            if generation != self._generation:
+                return
+
+            if isinstance(response, Exception):
+                print(f"Watch on {self.prefix} failed, resyncing: {response}")
+                self._generation += 1
+                threading.Thread(target=self._resync_safely, daemon=True).start()
+                return
+
+            for event in response.events:
+                key = event.key.decode()
+                self.revision = max(self.revision, event.mod_revision)
+                if isinstance(event, DeleteEvent):
+                    self._handle_delete(key)
+                else:
+                    self._handle_put(key, event.value, event.mod_revision)
+
+    def _resync_safely(self):
+        delay = 0.5
+        while True:
+            with self._sync_lock:
+                if not self._started:
+                    return
+                try:
+                    self._resync()
+                    return
+                except Exception:
+                    traceback.print_exc()
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def _handle_put(self, key, value, mod_revision):
+        if self._known.get(key) == mod_revision:
+            return
+        obj = parse_cached(key, value, mod_revision)
+        if obj is None:
+            return
+        self._known[key] = mod_revision
+        for on_put, _ in self._handlers:
+            if on_put is not None:
+                self._call(on_put, key, obj, mod_revision)
+
+    def _handle_delete(self, key):
+        if self._known.pop(key, None) is None:
+            return
+        for _, on_delete in self._handlers:
+            if on_delete is not None:
+                self._call(on_delete, key)
+
+    def _call(self, handler, *args):
+        try:
+            handler(*args)
+        except Exception:
+            traceback.print_exc()
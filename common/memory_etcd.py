@@ -0,0 +1,628 @@
+"""
+In-memory stand-in for etcd.
+
+Implements the part of the etcd3 client API that the services use on a
+multi-version key-value store inside the process: get, put and delete,
+prefix and range reads with limits and revisions, transactions with
+compare-and-swap, watches that replay from a revision, and leases. Every
+client of a process shares one store (see shared_store()), so the API server,
+scheduler and controller can run together in one process without an etcd
+cluster, e.g. for throughput benchmarks and profiling (see demo/run_local.py).
+
+Like etcd, every write gets the next revision and older revisions stay
+readable until they are compacted, which happens automatically once
+MEMORY_ETCD_HISTORY revisions have piled up. Reads or watches at a
+compacted revision raise (or deliver) RevisionCompacted. Watch callbacks
+run on one dispatcher thread, never on the thread of the write.
+"""
+import bisect
+import itertools
+import os
+import queue
+import threading
+import time
+import traceback
+
+from common.etcd_client import RevisionCompacted
+
+# Revisions kept for reads and watches at an older revision
+MEMORY_ETCD_HISTORY = int(os.environ.get("MEMORY_ETCD_HISTORY", "100000"))
+
+
+def to_bytes(value):
+    if value is None:
+        return None
+    return value if isinstance(value, bytes) else str(value).encode("utf-8")
+
+
+def value_bytes(value):
+    # The etcd3 client cannot send a None value either, so it is the caller's
+    # bug (e.g. an encode that failed) and must not be stored as a deletion
+    if value is None:
+        raise TypeError("etcd values must be bytes or str, not None")
+    return to_bytes(value)
+
+
+class Header:
+    def __init__(self, revision):
+        self.revision = revision
+
+
+class KeyValue:
+    """
+    One version of a key, like etcd's mvccpb.KeyValue. A deletion is
+    stored as a version with value None.
+    """
+
+    __slots__ = ("key", "value", "create_revision", "mod_revision", "version", "lease")
+
+    def __init__(self, key, value, create_revision, mod_revision, version, lease=0):
+        self.key = key
+        self.value = value
+        self.create_revision = create_revision
+        self.mod_revision = mod_revision
+        self.version = version
+        self.lease = lease
+
+
+class KVMetadata:
+    """
+    Metadata returned with a value, like etcd3.client.KVMetadata.
+    """
+
+    def __init__(self, kv, revision):
+        self.key = kv.key
+        self.create_revision = kv.create_revision
+        self.mod_revision = kv.mod_revision
+        self.version = kv.version
+        self.lease_id = kv.lease
+        self.response_header = Header(revision)
+
+
+class RangeResponse:
+    def __init__(self, kvs, more, count, revision):
+        self.kvs = kvs
+        self.more = more
+        self.count = count
+        self.header = Header(revision)
+
+
+class Event:
+    def __init__(self, kv):
+        self.key = kv.key
+        self.value = kv.value
+        self.create_revision = kv.create_revision
+        self.mod_revision = kv.mod_revision
+        self.version = kv.version
+        self.lease = kv.lease
+
+    def __repr__(self):
+        return f"{type(self).__name__}(key={self.key!r}, mod_revision={self.mod_revision})"
+
+
+class PutEvent(Event):
+    pass
+
+
+class DeleteEvent(Event):
+    pass
+
+
+class WatchResponse:
+    def __init__(self, events, revision):
+        self.events = events
+        self.header = Header(revision)
+
+
+class WriteResponse:
+    def __init__(self, revision, deleted=0):
+        self.header = Header(revision)
+        self.deleted = deleted
+
+
+class ResponseOp:
+    """
+    Result of a put or delete inside a transaction, like etcdrpc.ResponseOp.
+    """
+
+    def __init__(self, revision, deleted=0):
+        self.response_put = WriteResponse(revision)
+        self.response_delete_range = WriteResponse(revision, deleted)
+
+
+class Compare:
+    """
+    One condition of a transaction, e.g. `transactions.mod(key) == 5`.
+    """
+
+    def __init__(self, key, target):
+        self.key = to_bytes(key)
+        self.target = target
+        self.op = None
+        self.operand = None
+
+    def _set(self, op, operand):
+        self.op = op
+        self.operand = to_bytes(operand) if self.target == "value" else operand
+        return self
+
+    def __eq__(self, other):
+        return self._set("==", other)
+
+    def __ne__(self, other):
+        return self._set("!=", other)
+
+    def __lt__(self, other):
+        return self._set("<", other)
+
+    def __gt__(self, other):
+        return self._set(">", other)
+
+    __hash__ = None
+
+    def holds(self, kv):
+        if self.target == "value":
+            # As in etcd, a value never compares equal to a missing key
+            if kv is None:
+                return False
+            actual = kv.value
+        elif kv is None:
+            actual = 0
+        else:
+            actual = {"mod": kv.mod_revision, "create": kv.create_revision, "version": kv.version}[self.target]
+        if self.op == "==":
+            return actual == self.operand
+        if self.op == "!=":
+            return actual != self.operand
+        if self.op == "<":
+            return actual < self.operand
+        if self.op == ">":
+            return actual > self.operand
+        raise ValueError(f"Compare on {self.key!r} has no operator")
+
+
+class Transactions:
+    """
+    Builders for transaction compares and operations, like etcd3.transactions.
+    """
+
+    def value(self, key):
+        return Compare(key, "value")
+
+    def version(self, key):
+        return Compare(key, "version")
+
+    def create(self, key):
+        return Compare(key, "create")
+
+    def mod(self, key):
+        return Compare(key, "mod")
+
+    def put(self, key, value, lease=None, prev_kv=False):
+        return ("put", to_bytes(key), value_bytes(value), lease_id(lease))
+
+    def get(self, key, range_end=None):
+        return ("get", to_bytes(key), to_bytes(range_end), None)
+
+    def delete(self, key, range_end=None, prev_kv=False):
+        return ("delete", to_bytes(key), to_bytes(range_end), None)
+
+
+def lease_id(lease):
+    if lease is None:
+        return 0
+    return getattr(lease, "id", lease)
+
+
+class LeaseKeepAlive:
+    def __init__(self, lease_id, ttl):
+        self.ID = lease_id
+        self.TTL = ttl
+
+
+class Lease:
+    """
+    A lease granted by MemoryEtcd, with the methods of etcd3.Lease.
+    """
+
+    def __init__(self, lease_id, ttl, store):
+        self.id = lease_id
+        self.ttl = ttl
+        self._store = store
+
+    def revoke(self):
+        self._store.revoke_lease(self.id)
+
+    def refresh(self):
+        return self._store.refresh_lease(self.id)
+
+    @property
+    def remaining_ttl(self):
+        return self._store.lease_remaining(self.id)
+
+    @property
+    def granted_ttl(self):
+        return self.ttl
+
+    @property
+    def keys(self):
+        return self._store.lease_keys(self.id)
+
+
+class MemoryEtcd:
+    """
+    Process-local store with the interface of an etcd3 client.
+    """
+
+    transactions = Transactions()
+
+    def __init__(self, history=MEMORY_ETCD_HISTORY):
+        self.history = history
+        self._lock = threading.RLock()
+        self._revision = 1
+        self._compacted = 0
+        self._versions = {}  # key -> [KeyValue] in revision order
+        self._keys = []  # sorted keys that have versions
+        self._events = []  # (revision, [Event]) of the revisions not compacted
+        self._watches = {}  # watch id -> (start, end, callback)
+        self._watch_ids = itertools.count(1)
+        self._deliveries = queue.Queue()
+        self._dispatcher = None
+        self._leases = {}  # lease id -> [ttl, deadline, keys]
+        self._lease_ids = itertools.count(1)
+        self._reaper = None
+
+    # Reads
+
+    def _latest(self, key):
+        versions = self._versions.get(key)
+        if not versions or versions[-1].value is None:
+            return None
+        return versions[-1]
+
+    def _at(self, key, revision):
+        versions = self._versions.get(key)
+        if not versions:
+            return None
+        if not revision:
+            kv = versions[-1]
+        else:
+            index = bisect.bisect_right([kv.mod_revision for kv in versions], revision) - 1
+            if index < 0:
+                return None
+            kv = versions[index]
+        return kv if kv.value is not None else None
+
+    def _check_revision(self, revision):
+        if revision and revision <= self._compacted:
+            raise RevisionCompacted(f"Revision {revision} has been compacted (compacted at {self._compacted})")
+        if revision > self._revision:
+            raise ValueError(f"Revision {revision} is a future revision (current is {self._revision})")
+
+    def _range(self, start, end, limit=0, revision=0):
+        """
+        Versions visible at revision in [start, end), or the single key start
+        if end is None. Returns (kvs, count).
+        """
+        if end is None:
+            kv = self._at(start, revision)
+            return ([kv], 1) if kv is not None else ([], 0)
+        low = bisect.bisect_left(self._keys, start)
+        high = bisect.bisect_left(self._keys, end) if end != b"\0" else len(self._keys)
+        kvs = []
+        count = 0
+        for key in self._keys[low:high]:
+            kv = self._at(key, revision)
+            if kv is None:
+                continue
+            count += 1
+            if not limit or len(kvs) < limit:
+                kvs.append(kv)
+        return kvs, count
+
+    def get(self, key, **kwargs):
+        with self._lock:
+            kv = self._latest(to_bytes(key))
+            if kv is None:
+                return None, None
+            return kv.value, KVMetadata(kv, self._revision)
+
+    def range(self, start, end, limit=0, revision=0, keys_only=False):
+        """
+        Keys in [start, end) at revision (0 for the latest), up to limit
+        (0 for no limit), as a response with kvs, more, count and header.
+        """
+        with self._lock:
+            self._check_revision(revision)
+            kvs, count = self._range(to_bytes(start), to_bytes(end), limit, revision)
+            current = self._revision
+        if keys_only:
+            kvs = [KeyValue(kv.key, b"", kv.create_revision, kv.mod_revision, kv.version, kv.lease) for kv in kvs]
+        return RangeResponse(kvs, count > len(kvs), count, current)
+
+    def get_prefix_response(self, key_prefix, keys_only=False, **kwargs):
+        prefix = to_bytes(key_prefix)
+        return self.range(prefix, prefix_end(prefix), keys_only=keys_only)
+
+    def get_prefix(self, key_prefix, keys_only=False, **kwargs):
+        response = self.get_prefix_response(key_prefix, keys_only=keys_only)
+        for kv in response.kvs:
+            yield kv.value, KVMetadata(kv, response.header.revision)
+
+    def get_all(self, **kwargs):
+        response = self.range(b"\0", b"\0")
+        for kv in response.kvs:
+            yield kv.value, KVMetadata(kv, response.header.revision)
+
+    # Writes
+
+    def _put(self, key, value, lease, events):
+        previous = self._latest(key)
+        lease = lease_id(lease)
+        if lease and lease not in self._leases:
+            raise ValueError(f"Lease {lease} not found")
+        if previous is None:
+            kv = KeyValue(key, value, self._revision, self._revision, 1, lease)
+            if key not in self._versions:
+                bisect.insort(self._keys, key)
+                self._versions[key] = []
+        else:
+            kv = KeyValue(key, value, previous.create_revision, self._revision, previous.version + 1, lease)
+            if previous.lease and previous.lease != lease and previous.lease in self._leases:
+                self._leases[previous.lease][2].discard(key)
+        if lease:
+            self._leases[lease][2].add(key)
+        self._versions[key].append(kv)
+        events.append(PutEvent(kv))
+
+    def _delete(self, key, events):
+        previous = self._latest(key)
+        if previous is None:
+            return False
+        if previous.lease in self._leases:
+            self._leases[previous.lease][2].discard(key)
+        tombstone = KeyValue(key, None, 0, self._revision, 0)
+        self._versions[key].append(tombstone)
+        events.append(DeleteEvent(tombstone))
+        return True
+
+    def _delete_range(self, start, end, events):
+        if end is None:
+            return int(self._delete(start, events))
+        kvs, _ = self._range(start, end)
+        return sum(self._delete(kv.key, events) for kv in kvs)
+
+    def _write(self, apply):
+        """
+        Run apply(events) as one revision and notify the watches of its events.
+        """
+        with self._lock:
+            self._revision += 1
+            events = []
+            try:
+                result = apply(events)
+            except BaseException:
+                # Like etcd, a write that failed halfway leaves nothing behind
+                self._undo(events)
+                self._revision -= 1
+                raise
+            if events:
+                self._events.append((self._revision, events))
+                self._notify(self._revision, events)
+            else:
+                # Like etcd, a write that changed nothing takes no revision
+                self._revision -= 1
+            if self._revision - self._compacted > 2 * self.history:
+                self.compact(self._revision - self.history)
+            return result, self._revision
+
+    def _undo(self, events):
+        """
+        Take back the versions that events added, latest first.
+        """
+        for event in reversed(events):
+            versions = self._versions[event.key]
+            versions.pop()
+            if event.lease in self._leases:
+                self._leases[event.lease][2].discard(event.key)
+            if not versions:
+                del self._versions[event.key]
+                del self._keys[bisect.bisect_left(self._keys, event.key)]
+            elif versions[-1].value is not None and versions[-1].lease in self._leases:
+                self._leases[versions[-1].lease][2].add(event.key)
+
+    def put(self, key, value, lease=None, prev_kv=False):
+        value = value_bytes(value)
+        _, revision = self._write(lambda events: self._put(to_bytes(key), value, lease, events))
+        return WriteResponse(revision)
+
+    def delete(self, key, prev_kv=False, return_response=False):
+        deleted, _ = self._write(lambda events: self._delete(to_bytes(key), events))
+        return deleted
+
+    def delete_prefix(self, prefix):
+        prefix = to_bytes(prefix)
+        deleted, revision = self._write(lambda events: self._delete_range(prefix, prefix_end(prefix), events))
+        return WriteResponse(revision, deleted)
+
+    def replace(self, key, initial_value, new_value):
+        succeeded, _ = self.transaction(
+            compare=[self.transactions.value(key) == initial_value],
+            success=[self.transactions.put(key, new_value)],
+            failure=[],
+        )
+        return succeeded
+
+    def transaction(self, compare, success=None, failure=None):
+        """
+        Apply success if every compare holds, otherwise failure, atomically
+        and as a single revision. Returns (succeeded, responses) like etcd3.
+        """
+        def apply(events):
+            succeeded = all(condition.holds(self._latest(condition.key)) for condition in compare)
+            responses = []
+            for op, key, operand, lease in (success if succeeded else failure) or []:
+                if op == "put":
+                    self._put(key, operand, lease, events)
+                    responses.append(ResponseOp(self._revision))
+                elif op == "delete":
+                    responses.append(ResponseOp(self._revision, self._delete_range(key, operand, events)))
+                else:
+                    kvs, _ = self._range(key, operand)
+                    responses.append([(kv.value, KVMetadata(kv, self._revision)) for kv in kvs])
+            return succeeded, responses
+
+        (succeeded, responses), _ = self._write(apply)
+        return succeeded, responses
+
+    def compact(self, revision, physical=False):
+        """
+        Drop the versions that are not visible at revision or later.
+        """
+        with self._lock:
+            if revision <= self._compacted:
+                return
+            for key in self._keys:
+                versions = self._versions[key]
+                index = bisect.bisect_right([kv.mod_revision for kv in versions], revision) - 1
+                if index < 0:
+                    continue
+                if versions[index].value is None:
+                    index += 1
+                if index:
+                    del versions[:index]
+                if not versions:
+                    del self._versions[key]
+            self._keys = [key for key in self._keys if key in self._versions]
+            self._events = self._events[bisect.bisect_right([event[0] for event in self._events], revision):]
+            self._compacted = revision
+
+    # Watches
+
+    def add_watch_prefix_callback(self, key_prefix, callback, start_revision=None, **kwargs):
+        prefix = to_bytes(key_prefix)
+        return self._add_watch(prefix, prefix_end(prefix), callback, start_revision)
+
+    def add_watch_callback(self, key, callback, range_end=None, start_revision=None, **kwargs):
+        key = to_bytes(key)
+        return self._add_watch(key, to_bytes(range_end) or key + b"\0", callback, start_revision)
+
+    def _add_watch(self, start, end, callback, start_revision):
+        with self._lock:
+            watch_id = next(self._watch_ids)
+            self._watches[watch_id] = (start, end, callback)
+            if start_revision:
+                if start_revision <= self._compacted:
+                    self._deliveries.put((watch_id, RevisionCompacted(
+                        f"Watch start revision {start_revision} has been compacted (compacted at {self._compacted})"
+                    )))
+                else:
+                    first = bisect.bisect_left([event[0] for event in self._events], start_revision)
+                    for revision, events in self._events[first:]:
+                        self._deliver(watch_id, start, end, revision, events)
+            self._start_dispatcher()
+        return watch_id
+
+    def cancel_watch(self, watch_id):
+        with self._lock:
+            self._watches.pop(watch_id, None)
+
+    def _notify(self, revision, events):
+        for watch_id, (start, end, _) in self._watches.items():
+            self._deliver(watch_id, start, end, revision, events)
+
+    def _deliver(self, watch_id, start, end, revision, events):
+        matched = [event for event in events if start <= event.key < end]
+        if matched:
+            self._deliveries.put((watch_id, WatchResponse(matched, revision)))
+
+    def _start_dispatcher(self):
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch, name="memory-etcd-watch", daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            watch_id, response = self._deliveries.get()
+            with self._lock:
+                watch = self._watches.get(watch_id)
+            if watch is None:
+                continue
+            try:
+                watch[2](response)
+            except Exception:
+                traceback.print_exc()
+
+    # Leases
+
+    def lease(self, ttl, lease_id=None):
+        with self._lock:
+            lease_id = lease_id or next(self._lease_ids)
+            self._leases[lease_id] = [ttl, time.monotonic() + ttl, set()]
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap, name="memory-etcd-leases", daemon=True)
+                self._reaper.start()
+        return Lease(lease_id, ttl, self)
+
+    def revoke_lease(self, lease_id):
+        with self._lock:
+            lease = self._leases.pop(lease_id, None)
+            if lease is not None and lease[2]:
+                self._write(lambda events: [self._delete(key, events) for key in sorted(lease[2])])
+
+    def refresh_lease(self, lease_id):
+        with self._lock:
+            lease = self._leases.get(lease_id)
+            if lease is None:
+                return [LeaseKeepAlive(lease_id, 0)]
+            lease[1] = time.monotonic() + lease[0]
+            return [LeaseKeepAlive(lease_id, lease[0])]
+
+    def lease_remaining(self, lease_id):
+        with self._lock:
+            lease = self._leases.get(lease_id)
+            return max(0, int(lease[1] - time.monotonic())) if lease is not None else -1
+
+    def lease_keys(self, lease_id):
+        with self._lock:
+            lease = self._leases.get(lease_id)
+            return sorted(lease[2]) if lease is not None else []
+
+    def _reap(self):
+        while True:
+            time.sleep(0.25)
+            now = time.monotonic()
+            with self._lock:
+                expired = [lease_id for lease_id, lease in self._leases.items() if lease[1] <= now]
+            for lease_id in expired:
+                self.revoke_lease(lease_id)
+
+    # Cluster
+
+    def status(self):
+        with self._lock:
+            return Header(self._revision)
+
+    def close(self):
+        pass
+
+
+def prefix_end(prefix):
+    end = bytearray(prefix)
+    end[-1] += 1
+    return bytes(end)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_store():
+    """
+    The store of this process, shared by all clients.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = MemoryEtcd()
+        return _shared
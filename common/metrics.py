@@ -0,0 +1,300 @@
+"""
+Prometheus metrics, served on /metrics by every service.
+
+A small implementation of the Prometheus text format instead of
+prometheus_client: it has no import cost on a cold start, and recording a
+sample is a dict lookup and an addition under a lock, cheap enough to stay
+on in production. Counters, gauges and histograms are kept per label
+values. Values that other components already count (caches, work queues)
+are read through callbacks at scrape time rather than recorded twice.
+"""
+import bisect
+import math
+import threading
+import time
+
+# Seconds; etcd and Auger calls take around a millisecond, HTTP hops more
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    """
+    Base of the metric types: a family of series keyed by label values.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # label values -> series state
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        return tuple(str(value) for value in labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        return self.header() + [
+            f"{self.name}_total{format_labels(self.labelnames, key)} {format_value(value)}"
+            for key, value in series
+        ]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def render(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        return self.header() + [
+            f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}"
+            for key, value in series
+        ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per bucket (not cumulative) counts, then the sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *labels):
+        """
+        Context manager that observes the duration of its block.
+        """
+        return Timer(self, labels)
+
+    def render(self):
+        with self._lock:
+            series = sorted((key, list(counts)) for key, counts in self._series.items())
+        lines = self.header()
+        for key, counts in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{format_labels(self.labelnames, key, [('le', format_value(bound))])} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class CallbackGauge(Metric):
+    """
+    Gauge read at scrape time: callback() returns {label values: value}, or
+    a number if there are no labels.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, callback, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def render(self):
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return self.header() + [
+            f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class CallbackCounter(CallbackGauge):
+    """
+    Counter read at scrape time, for totals that another component keeps.
+    """
+
+    type = "counter"
+
+    def render(self):
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return self.header() + [
+            f"{self.name}_total{format_labels(self.labelnames, key)} {format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Add a metric, or return the one already registered under its name.
+        """
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # One broken callback must not take the whole scrape down
+                print(f"Failed to render metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def callback_gauge(name, documentation, callback, labelnames=()):
+    return REGISTRY.register(CallbackGauge(name, documentation, callback, labelnames))
+
+
+def callback_counter(name, documentation, callback, labelnames=()):
+    return REGISTRY.register(CallbackCounter(name, documentation, callback, labelnames))
+
+
+# Shared instrumentation of the common modules
+ETCD_DURATION = histogram(
+    "etcd_request_duration_seconds", "Latency of etcd requests by operation.", ["operation"]
+)
+CODEC_DURATION = histogram(
+    "codec_duration_seconds", "Latency of object encode and decode calls.", ["operation"]
+)
+HTTP_CLIENT_DURATION = histogram(
+    "http_client_request_duration_seconds", "Latency of calls to other services.", ["service", "path"]
+)
+HTTP_CLIENT_REQUESTS = counter(
+    "http_client_requests", "Calls to other services by response status.", ["service", "path", "status"]
+)
+HTTP_REQUEST_DURATION = histogram(
+    "http_request_duration_seconds", "Latency of requests served, by route.", ["method", "route"]
+)
+HTTP_REQUESTS = counter(
+    "http_requests", "Requests served, by route and status.", ["method", "route", "status"]
+)
+HTTP_IN_FLIGHT = gauge("http_requests_in_flight", "Requests being served.")
+
+
+def cache_metrics(prefix, documentation, stats):
+    """
+    Expose the hits, misses and hit ratio of a cache whose stats() returns
+    hits and misses.
+    """
+    callback_counter(f"{prefix}_hits", f"Hits of the {documentation}.", lambda: stats()["hits"])
+    callback_counter(f"{prefix}_misses", f"Misses of the {documentation}.", lambda: stats()["misses"])
+    callback_gauge(f"{prefix}_hit_ratio", f"Hit ratio of the {documentation}.", lambda: stats()["hit_ratio"])
+
+
+def install(app):
+    """
+    Serve /metrics from a Flask app and count and time the requests it serves.
+    """
+    from flask import Response, g, request
+
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+
+    def record(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, request.method, route)
+            HTTP_REQUESTS.inc(request.method, route, response.status_code)
+            HTTP_IN_FLIGHT.dec()
+        return response
+
+    def render():
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+    app.before_request(start_timer)
+    app.after_request(record)
+    app.add_url_rule("/metrics", "metrics", render, methods=["GET"])
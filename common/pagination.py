@@ -0,0 +1,105 @@
+"""
+Paginated etcd range reads.
+
+get_prefix() pulls every key and value of a prefix in one response, so a
+listing costs memory and time in proportion to the whole prefix. These
+helpers read a prefix page by page using etcd range limits, optionally
+without values. Every page is read at the revision of the first page, so a
+paginated list is one consistent snapshot. Like Kubernetes, a continue token
+carries that revision and the key to resume from.
+
+The pages are read with LazyClient.range, which builds the RangeRequest
+that etcd3 cannot make.
+"""
+import base64
+import collections
+import json
+import os
+
+from common.etcd_client import RevisionCompacted
+
+# Keys per etcd range request when a listing is streamed
+LIST_PAGE_SIZE = int(os.environ.get("LIST_PAGE_SIZE", "500"))
+
+# next_key is None on the last page. remaining counts the keys after this page.
+Page = collections.namedtuple("Page", ["kvs", "revision", "next_key", "remaining"])
+
+
+class InvalidContinueToken(ValueError):
+    """The continue token is malformed or belongs to another listing."""
+
+
+class ContinueTokenExpired(Exception):
+    """The snapshot revision of a continue token has been compacted."""
+
+
+def to_bytes(value):
+    return value if isinstance(value, bytes) else value.encode("utf-8")
+
+
+def prefix_end(prefix):
+    """
+    End of the key range of a prefix (like etcd3.utils.increment_last_byte).
+    """
+    end = bytearray(to_bytes(prefix))
+    end[-1] += 1
+    return bytes(end)
+
+
+def encode_continue(revision, next_key):
+    token = json.dumps({"rv": revision, "start": next_key.decode("utf-8", errors="surrogateescape")})
+    return base64.urlsafe_b64encode(token.encode("utf-8")).decode("ascii")
+
+
+def decode_continue(token, prefix):
+    """
+    Return (revision, start key) of a continue token issued for prefix.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        revision = int(data["rv"])
+        start = data["start"].encode("utf-8", errors="surrogateescape")
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise InvalidContinueToken("Invalid continue token")
+    if revision <= 0 or not start.startswith(to_bytes(prefix)):
+        raise InvalidContinueToken("Continue token does not belong to this listing")
+    return revision, start
+
+
+def range_page(etcd, start, end, limit=0, revision=0, keys_only=False):
+    """
+    Read up to `limit` keys (0 for no limit) in [start, end) at `revision`
+    (0 for the latest), in key order.
+    """
+    try:
+        response = etcd.range(to_bytes(start), to_bytes(end), limit, revision, keys_only)
+    except RevisionCompacted:
+        raise ContinueTokenExpired(f"Revision {revision} has been compacted, list again")
+
+    kvs = list(response.kvs)
+    next_key = kvs[-1].key + b"\0" if response.more and kvs else None
+    return Page(kvs, revision or response.header.revision, next_key, response.count - len(kvs))
+
+
+def list_page(etcd, prefix, limit, continue_token=None, keys_only=False):
+    """
+    Read one page of a prefix, resuming from continue_token if given.
+    """
+    revision = 0
+    start = to_bytes(prefix)
+    if continue_token:
+        revision, start = decode_continue(continue_token, prefix)
+    end = prefix_end(prefix)
+    return range_page(etcd, start, end, limit, revision, keys_only)
+
+
+def scan_prefix(etcd, prefix, page_size=LIST_PAGE_SIZE, keys_only=False):
+    """
+    Yield the pages of a whole prefix, read at one revision.
+    """
+    page = list_page(etcd, prefix, page_size, keys_only=keys_only)
+    yield page
+    end = prefix_end(prefix)
+    while page.next_key is not None:
+        page = range_page(etcd, page.next_key, end, page_size, page.revision, keys_only)
+        yield page
@@ -0,0 +1,122 @@
+"""
+Kubernetes label and field selectors.
+
+Label selectors support `key=value`, `key==value`, `key!=value`,
+`key in (a,b)`, `key notin (a,b)`, `key` and `!key`, joined by commas.
+Field selectors support `field=value`, `field==value` and `field!=value` on
+the fields in SELECTABLE_FIELDS.
+"""
+import collections
+import re
+
+SELECTABLE_FIELDS = ("metadata.name", "metadata.namespace", "spec.nodeName", "status.phase")
+
+# op is one of "=", "!=", "in", "notin", "exists", "!exists"
+Requirement = collections.namedtuple("Requirement", ["key", "op", "values"])
+
+_SET_REQUIREMENT = re.compile(r"^([^\s!=(),]+)\s+(in|notin)\s+\(([^()]*)\)$")
+_EQUALITY_REQUIREMENT = re.compile(r"^([^\s!=(),]+)\s*(==|=|!=)\s*([^\s!=(),]*)$")
+_EXISTS_REQUIREMENT = re.compile(r"^(!?)\s*([^\s!=(),]+)$")
+
+
+class SelectorError(ValueError):
+    """Raised for a selector that cannot be parsed."""
+
+
+def _split(selector):
+    # Commas inside `in (...)` do not separate requirements
+    parts = []
+    depth = 0
+    current = ""
+    for char in selector:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+        else:
+            current += char
+    parts.append(current)
+    return [part.strip() for part in parts if part.strip()]
+
+
+def parse_label_selector(selector):
+    """
+    Parse a label selector into a list of Requirements.
+    """
+    requirements = []
+    for part in _split(selector or ""):
+        match = _SET_REQUIREMENT.match(part)
+        if match:
+            values = frozenset(value.strip() for value in match.group(3).split(",") if value.strip())
+            requirements.append(Requirement(match.group(1), match.group(2), values))
+            continue
+        match = _EQUALITY_REQUIREMENT.match(part)
+        if match:
+            op = "!=" if match.group(2) == "!=" else "="
+            requirements.append(Requirement(match.group(1), op, frozenset([match.group(3)])))
+            continue
+        match = _EXISTS_REQUIREMENT.match(part)
+        if match:
+            op = "!exists" if match.group(1) else "exists"
+            requirements.append(Requirement(match.group(2), op, frozenset()))
+            continue
+        raise SelectorError(f"Invalid label selector requirement '{part}'")
+    return requirements
+
+
+def parse_field_selector(selector):
+    """
+    Parse a field selector into a list of Requirements.
+    """
+    requirements = []
+    for part in _split(selector or ""):
+        match = _EQUALITY_REQUIREMENT.match(part)
+        if not match:
+            raise SelectorError(f"Invalid field selector requirement '{part}'")
+        if match.group(1) not in SELECTABLE_FIELDS:
+            raise SelectorError(f"Field '{match.group(1)}' is not supported, use one of {', '.join(SELECTABLE_FIELDS)}")
+        op = "!=" if match.group(2) == "!=" else "="
+        requirements.append(Requirement(match.group(1), op, frozenset([match.group(3)])))
+    return requirements
+
+
+def object_labels(obj):
+    labels = (obj.get("metadata") or {}).get("labels") or {}
+    return {str(key): str(value) for key, value in labels.items()}
+
+
+def object_fields(key, obj):
+    """
+    Values of the selectable fields. A missing field matches the empty
+    string, so `spec.nodeName=` selects pods that are not scheduled yet.
+    """
+    namespace, name = key.rsplit("/", 2)[-2:]
+    return {
+        "metadata.name": name,
+        "metadata.namespace": namespace,
+        "spec.nodeName": str((obj.get("spec") or {}).get("nodeName") or ""),
+        "status.phase": str((obj.get("status") or {}).get("phase") or ""),
+    }
+
+
+def requirement_matches(requirement, values):
+    """
+    Check one requirement against a dict of labels or fields.
+    """
+    key, op, expected = requirement
+    if op == "exists":
+        return key in values
+    if op == "!exists":
+        return key not in values
+    if op in ("=", "in"):
+        return key in values and values[key] in expected
+    # "!=" and "notin" also match objects without the key
+    return values.get(key) not in expected
+
+
+def matches(label_requirements, field_requirements, labels, fields):
+    return (all(requirement_matches(r, labels) for r in label_requirements)
+            and all(requirement_matches(r, fields) for r in field_requirements))
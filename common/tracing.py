@@ -0,0 +1,349 @@
+"""
+Request tracing across the services.
+
+A request carries a W3C `traceparent` header from service to service. The
+API server accepts one from the client or starts a new trace, and every
+outbound call passes it on, so the hops of one pod create share a trace ID.
+Each service records spans for the request it serves and for its etcd,
+codec and HTTP stages, and exports them in the background:
+
+    TRACE_FILE            append spans as JSON lines to this file
+    TRACE_OTLP_ENDPOINT   POST them as OTLP/HTTP JSON to this collector,
+                          e.g. http://trace-collector:4318/v1/traces
+
+With neither set no spans are recorded, but trace IDs are still passed on
+and returned in the `X-Trace-Id` response header. TRACE_SAMPLE_RATE keeps
+that fraction of new traces (default 1). A full export queue drops spans
+instead of slowing requests down.
+"""
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+import traceback
+
+TRACE_FILE = os.environ.get("TRACE_FILE", "")
+TRACE_OTLP_ENDPOINT = os.environ.get("TRACE_OTLP_ENDPOINT", "")
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "1"))
+TRACE_QUEUE_SIZE = int(os.environ.get("TRACE_QUEUE_SIZE", "10000"))
+# Spans sent to the collector per request
+TRACE_EXPORT_BATCH = int(os.environ.get("TRACE_EXPORT_BATCH", "512"))
+
+ENABLED = bool(TRACE_FILE or TRACE_OTLP_ENDPOINT)
+
+# Span of the current request or background task, or a SpanContext of a
+# parent in another service
+_current = contextvars.ContextVar("trace_span", default=None)
+
+
+def new_id(bits):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class SpanContext:
+    """
+    Identity of a span, as carried in a traceparent header.
+    """
+
+    def __init__(self, trace_id, span_id, sampled):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(header):
+    """
+    SpanContext of a `00-<trace id>-<span id>-<flags>` header, or None if
+    it is missing or malformed.
+    """
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        trace_id, span_id, flags = int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    if not trace_id or not span_id:
+        return None
+    return SpanContext(parts[1], parts[2], bool(flags & 1))
+
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+
+class Span(SpanContext):
+    def __init__(self, name, parent=None, attributes=None, kind=INTERNAL):
+        if parent is None:
+            super().__init__(new_id(128), new_id(64), random.random() < TRACE_SAMPLE_RATE)
+        else:
+            super().__init__(parent.trace_id, new_id(64), parent.sampled)
+        self.name = name
+        self.kind = kind
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes or {}
+        self.error = None
+        self.start = time.time()
+        self._start = time.perf_counter()
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def end(self):
+        if self.sampled and ENABLED:
+            exporter.export(self, time.perf_counter() - self._start)
+
+
+class _Activation:
+    """
+    Makes a span current for the duration of a with block and ends it.
+    """
+
+    def __init__(self, span):
+        self.span = span
+
+    def __enter__(self):
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        _current.reset(self._token)
+        self.span.end()
+
+
+class _NoSpan:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, kind=INTERNAL, **attributes):
+    """
+    Context manager recording a child span of the current span. Outside of
+    a sampled trace, or with no exporter, it costs next to nothing.
+    """
+    parent = _current.get()
+    if not ENABLED or parent is None or not parent.sampled:
+        return _NO_SPAN
+    return _Activation(Span(name, parent, attributes, kind))
+
+
+def start_trace(name, traceparent=None, kind=INTERNAL, **attributes):
+    """
+    Context manager making a new span current: a root span, or the child
+    of a span in another service if its traceparent is given.
+    """
+    return _Activation(Span(name, parse_traceparent(traceparent), attributes, kind))
+
+
+def current_traceparent():
+    """
+    traceparent header value of the current span, or None.
+    """
+    current = _current.get()
+    return current.traceparent() if current is not None else None
+
+
+def current_trace_id():
+    current = _current.get()
+    return current.trace_id if current is not None else None
+
+
+def bind(function):
+    """
+    Wrap function to run under the current span, for handing work to
+    another thread.
+    """
+    current = _current.get()
+    if current is None:
+        return function
+
+    def run(*args, **kwargs):
+        token = _current.set(current)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return run
+
+
+class Exporter:
+    """
+    Writes finished spans to the trace file and/or the collector from a
+    background thread.
+    """
+
+    def __init__(self, service=None):
+        self.service = service or os.environ.get("K_SERVICE", "unknown")
+        self._queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def export(self, span, duration):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait((span, duration))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < TRACE_EXPORT_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if TRACE_FILE:
+                    self._write_file(batch)
+                if TRACE_OTLP_ENDPOINT:
+                    self._post_otlp(batch)
+                with self._lock:
+                    self.exported += len(batch)
+            except Exception:
+                traceback.print_exc()
+                with self._lock:
+                    self.failed += len(batch)
+
+    def _write_file(self, batch):
+        with open(TRACE_FILE, "a") as f:
+            for span, duration in batch:
+                f.write(json.dumps({
+                    "trace_id": span.trace_id,
+                    "span_id": span.span_id,
+                    "parent_id": span.parent_id,
+                    "service": self.service,
+                    "name": span.name,
+                    "kind": span.kind,
+                    "start": span.start,
+                    "duration_ms": round(duration * 1000, 3),
+                    "attributes": span.attributes,
+                    "error": span.error,
+                }, default=str) + "\n")
+
+    def _post_otlp(self, batch):
+        import urllib.request
+
+        body = json.dumps(otlp_request(self.service, batch), default=str).encode("utf-8")
+        request = urllib.request.Request(
+            TRACE_OTLP_ENDPOINT, data=body, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=5) as response:
+            response.read()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": ENABLED,
+                "queued": self._queue.qsize(),
+                "exported": self.exported,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_request(service, batch):
+    """
+    ExportTraceServiceRequest in the OTLP/HTTP JSON encoding.
+    """
+    spans = []
+    for span, duration in batch:
+        start = int(span.start * 1e9)
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(start + int(duration * 1e9)),
+            "attributes": [{"key": key, "value": otlp_value(value)} for key, value in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 0},
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+        "scopeSpans": [{"scope": {"name": "serverless-k8s"}, "spans": spans}],
+    }]}
+
+
+exporter = Exporter()
+
+
+def install(app, service):
+    """
+    Trace every request a Flask app serves: continue the caller's trace or
+    start one, and return the trace ID in the X-Trace-Id header.
+    """
+    from flask import g, request
+
+    exporter.service = service
+
+    def start_span():
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        activation = start_trace(
+            f"{request.method} {route}",
+            request.headers.get("traceparent"),
+            SERVER,
+            **{"http.method": request.method, "http.route": route, "http.target": request.full_path.rstrip("?")},
+        )
+        activation.__enter__()
+        g.trace_activation = activation
+
+    def finish_span(response):
+        activation = g.get("trace_activation")
+        if activation is not None:
+            activation.span.set("http.status_code", response.status_code)
+            response.headers["X-Trace-Id"] = activation.span.trace_id
+            if response.status_code >= 500:
+                activation.span.error = f"HTTP {response.status_code}"
+                print(f"[trace {activation.span.trace_id}] {activation.span.name} returned {response.status_code}")
+        return response
+
+    def end_span(exc):
+        activation = g.pop("trace_activation", None)
+        if activation is not None:
+            activation.__exit__(type(exc) if exc is not None else None, exc, None)
+
+    app.before_request(start_span)
+    app.after_request(finish_span)
+    app.teardown_request(end_span)
@@ -0,0 +1,92 @@
+"""
+Micro-benchmark for the Auger codec: per-object encode/decode latency with the
+one-shot auger CLI (one fork+exec per object) and with the augerd worker pool,
+next to the in-process JSON and msgpack codecs.
+
+Point AUGER_BIN and AUGERD_BIN at an Auger build (see the service Dockerfiles):
+
+    AUGER_BIN=auger/build/auger AUGERD_BIN=auger/build/augerd \
+        python demo/bench_codec.py --iterations 500
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common import codec  # noqa: E402
+
+
+def sample_pod():
+    dirname = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(dirname, "demo1.yaml")) as f:
+        pod = yaml.safe_load(f)
+    pod["metadata"]["uid"] = "00000000-0000-0000-0000-000000000000"
+    return pod
+
+
+def measure(fn, iterations):
+    """Return the latency of each call in microseconds."""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{name:<24} mean {statistics.mean(samples):>10.1f}us  "
+          f"p50 {statistics.median(samples):>10.1f}us  p99 {p99:>10.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=codec.AUGER_WORKERS)
+    args = parser.parse_args()
+
+    pod = sample_pod()
+
+    # Compact codecs for types Kubernetes does not read, in process
+    for name in ("json", "msgpack"):
+        compact = codec.CODECS[name]
+        try:
+            value = compact.encode(pod)
+        except ImportError:
+            print(f"{name} is not installed, skipping")
+            continue
+        report(f"{name} encode ({len(value)} B)", measure(lambda: compact.encode(pod), args.iterations))
+        report(f"{name} decode", measure(lambda: compact.decode(value), args.iterations))
+
+    document = yaml.dump(pod).encode("utf-8")
+    encoded = codec._run_auger_cli(["encode"], document)
+
+    # Before: one auger process per object
+    report("cli encode", measure(lambda: codec._run_auger_cli(["encode"], document), args.iterations))
+    report("cli decode", measure(lambda: codec._run_auger_cli(["decode"], encoded), args.iterations))
+
+    # After: long-lived augerd workers
+    if not os.path.exists(codec.AUGERD_BIN):
+        print(f"{codec.AUGERD_BIN} not found, skipping worker pool benchmark")
+        return
+
+    pool = codec.AugerPool(codec.AUGERD_BIN, args.workers)
+    try:
+        # Start the first worker outside of the measurement
+        pool.call(codec.OP_ENCODE, document)
+        report("pool encode", measure(lambda: pool.call(codec.OP_ENCODE, document), args.iterations))
+        report("pool decode (yaml)", measure(lambda: pool.call(codec.OP_DECODE_YAML, encoded), args.iterations))
+        report("pool decode (json)", measure(lambda: pool.call(codec.OP_DECODE_JSON, encoded), args.iterations))
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
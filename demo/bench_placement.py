@@ -0,0 +1,98 @@
+"""
+Simulation benchmark for the scheduler's placement engine: place pods on
+synthetic nodes with every policy and report placement latency and how the
+pods were spread.
+
+    python demo/bench_placement.py --nodes 1000 --pods 10000 [--nodes-to-score 100]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(dirname, ".."))
+sys.path.insert(0, os.path.join(dirname, "..", "services", "scheduler"))
+
+from node_inventory import NodeInfo  # noqa: E402
+from placement import POLICIES, NoFitError, PlacementEngine  # noqa: E402
+
+
+def synthetic_nodes(count, rng):
+    shapes = [(4000, 8 * 2 ** 30), (8000, 16 * 2 ** 30), (16000, 64 * 2 ** 30)]
+    nodes = []
+    for i in range(count):
+        cpu, memory = rng.choice(shapes)
+        nodes.append(NodeInfo(
+            name=f"node-{i:05d}",
+            ready=True,
+            schedulable=True,
+            labels={},
+            allocatable={"cpu": cpu, "memory": memory, "pods": 110},
+        ))
+    return nodes
+
+
+def synthetic_pods(count, rng):
+    pods = []
+    for i in range(count):
+        pods.append((f"/registry/pods/default/pod-{i}", {
+            "spec": {"containers": [{
+                "name": "app",
+                "resources": {"requests": {
+                    "cpu": f"{rng.choice([10, 100, 250, 500, 1000])}m",
+                    "memory": f"{rng.choice([1, 64, 256, 512, 1024])}Mi",
+                }},
+            }]},
+        }))
+    return pods
+
+
+def run(policy, nodes, pods, nodes_to_score):
+    engine = PlacementEngine(policy, nodes_to_score)
+    latencies = []
+    unschedulable = 0
+
+    start = time.perf_counter()
+    for pod_key, pod in pods:
+        begin = time.perf_counter()
+        try:
+            engine.reserve(pod_key, pod, nodes)
+        except NoFitError:
+            unschedulable += 1
+        latencies.append((time.perf_counter() - begin) * 1e6)
+    elapsed = time.perf_counter() - start
+
+    used = [engine.committed(node.name) for node in nodes]
+    cpu_usage = [u["cpu"] / node.allocatable["cpu"] for u, node in zip(used, nodes)]
+    latencies.sort()
+
+    print(f"{policy:<16} {elapsed:>7.2f}s total  "
+          f"p50 {latencies[len(latencies) // 2]:>8.1f}us  "
+          f"p99 {latencies[int(len(latencies) * 0.99)]:>8.1f}us  "
+          f"nodes used {sum(1 for u in used if u['pods']):>5}  "
+          f"cpu usage mean {statistics.mean(cpu_usage):.2f} max {max(cpu_usage):.2f}  "
+          f"unschedulable {unschedulable}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--pods", type=int, default=10000)
+    parser.add_argument("--nodes-to-score", type=int, default=0,
+                        help="stop after this many feasible nodes (0 scores all)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    nodes = synthetic_nodes(args.nodes, rng)
+    pods = synthetic_pods(args.pods, rng)
+
+    for policy in POLICIES:
+        run(policy, nodes, pods, args.nodes_to_score)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,458 @@
+"""
+Load generator for pod creation, against the serverless API server or a
+Kubernetes API server (through `kubectl proxy`).
+
+Pods are created either at a fixed arrival rate (open loop, --rate) or by a
+fixed number of clients that each create the next pod as soon as their last
+one is done (closed loop, --concurrency). One watch on the pods reports when
+each pod is bound to a node (or running, with --until running), so nothing
+polls. Times are taken from a monotonic clock. One row per pod is written
+in the CSV format that process_results.py reads; pods that time out get a
+row of zeros.
+
+    python demo/loadgen.py --url http://api-server.default.127.0.0.1.sslip.io --count 500 --rate 50
+    python demo/loadgen.py --target k8s --url http://localhost:8080 --count 500 --concurrency 20 --until running
+
+Only the standard library is used, so it runs anywhere with Python 3.9.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import ssl
+import statistics
+import sys
+import time
+from urllib.parse import urlencode, urlsplit
+
+CSV_COLUMNS = [
+    "i", "start_time", "deployment_start", "deployment_end", "pod_start", "pod_end", "end_time",
+    "total_time", "deployment_time", "pod_ready_time",
+]
+
+
+class Clock:
+    """
+    Monotonic nanoseconds, reported as Unix nanoseconds anchored at start.
+    """
+
+    def __init__(self):
+        self.wall_start = time.time_ns()
+        self.monotonic_start = time.perf_counter_ns()
+
+    def now(self):
+        return self.wall_start + time.perf_counter_ns() - self.monotonic_start
+
+
+class HTTPError(Exception):
+    pass
+
+
+class HTTPClient:
+    """
+    Minimal asyncio HTTP/1.1 client with a pool of keep-alive connections.
+    """
+
+    def __init__(self, base_url, connections):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == "https" else 80)
+        self.ssl = ssl.create_default_context() if url.scheme == "https" else None
+        self.base_path = url.path.rstrip("/")
+        self.host_header = url.netloc
+        self._idle = []
+        self._slots = asyncio.Semaphore(connections)
+
+    async def _connect(self):
+        return await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+
+    def _request_bytes(self, method, path, body):
+        headers = [
+            f"{method} {self.base_path}{path} HTTP/1.1",
+            f"Host: {self.host_header}",
+            "Connection: keep-alive",
+            "Accept: application/json",
+        ]
+        if body is not None:
+            headers += ["Content-Type: application/json", f"Content-Length: {len(body)}"]
+        return ("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + (body or b"")
+
+    async def request(self, method, path, payload=None):
+        """
+        Send a request and return (status, parsed JSON body or None).
+        """
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        async with self._slots:
+            for attempt in range(2):
+                reused = bool(self._idle)
+                reader, writer = self._idle.pop() if reused else await self._connect()
+                try:
+                    writer.write(self._request_bytes(method, path, body))
+                    await writer.drain()
+                    version, status, headers = await read_head(reader)
+                    data, framed = await read_body(reader, headers)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    # The server may have closed a connection that sat idle
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                if framed and version == "HTTP/1.1" and headers.get("connection", "").lower() != "close":
+                    self._idle.append((reader, writer))
+                else:
+                    writer.close()
+                try:
+                    return status, json.loads(data) if data else None
+                except ValueError:
+                    return status, None
+
+    async def stream_lines(self, path):
+        """
+        Yield the lines of a streamed response, on a connection of its own.
+        """
+        reader, writer = await self._connect()
+        try:
+            writer.write(self._request_bytes("GET", path, None))
+            await writer.drain()
+            _, status, headers = await read_head(reader)
+            if status != 200:
+                data, _ = await read_body(reader, headers)
+                raise HTTPError(f"GET {path} returned {status}: {data[:200]!r}")
+            if headers.get("transfer-encoding", "").lower() == "chunked":
+                buffer = b""
+                async for chunk in read_chunks(reader):
+                    buffer += chunk
+                    *lines, buffer = buffer.split(b"\n")
+                    for line in lines:
+                        yield line
+            else:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        return
+                    yield line
+        finally:
+            writer.close()
+
+    def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+async def read_head(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed by the server")
+    version, status = status_line.decode("latin-1").split(" ", 2)[:2]
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            return version, int(status), headers
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+
+async def read_chunks(reader):
+    while True:
+        size = int((await reader.readline()).split(b";")[0], 16)
+        if size == 0:
+            # Skip the trailers
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            return
+        data = await reader.readexactly(size)
+        await reader.readexactly(2)
+        yield data
+
+
+async def read_body(reader, headers):
+    """
+    Return (body, whether its end was framed so the connection can be reused).
+    """
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        return b"".join([chunk async for chunk in read_chunks(reader)]), True
+    if "content-length" in headers:
+        return await reader.readexactly(int(headers["content-length"])), True
+    return await reader.read(), False
+
+
+class Target:
+    """
+    Paths of the pod API of the serverless API server.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+
+    def create_path(self):
+        return f"/api/v1/pods?{urlencode({'namespace': self.namespace})}"
+
+    def watch_path(self, resource_version=None):
+        query = {"watch": "true", "namespace": self.namespace}
+        if resource_version:
+            query["resourceVersion"] = resource_version
+        return f"/api/v1/pods?{urlencode(query)}"
+
+    async def delete(self, client, names):
+        for start in range(0, len(names), 500):
+            await client.request(
+                "DELETE", f"/api/v1/pods?{urlencode({'namespace': self.namespace})}",
+                {"names": names[start:start + 500]},
+            )
+
+
+class KubernetesTarget(Target):
+    """
+    Paths of the pod API of kube-apiserver.
+    """
+
+    def create_path(self):
+        return f"/api/v1/namespaces/{self.namespace}/pods"
+
+    def watch_path(self, resource_version=None):
+        query = {"watch": "true", "allowWatchBookmarks": "true"}
+        if resource_version:
+            query["resourceVersion"] = resource_version
+        return f"/api/v1/namespaces/{self.namespace}/pods?{urlencode(query)}"
+
+    async def delete(self, client, names):
+        await asyncio.gather(*(
+            client.request("DELETE", f"/api/v1/namespaces/{self.namespace}/pods/{name}") for name in names
+        ))
+
+
+TARGETS = {"serverless": Target, "k8s": KubernetesTarget}
+
+
+def new_pod(name, namespace):
+    # The pod of the original demo scripts
+    return {
+        "apiVersion": "v1",
+        "kind": "Pod",
+        "metadata": {"name": name, "namespace": namespace, "labels": {"app": name}},
+        "spec": {
+            "containers": [{
+                "name": "nginx",
+                "image": "nginx",
+                "resources": {"requests": {"memory": "1Mi", "cpu": "10m"}},
+                "ports": [{"containerPort": 80}],
+            }],
+        },
+    }
+
+
+def is_ready(pod, until):
+    if until == "running":
+        return (pod.get("status") or {}).get("phase") == "Running"
+    return bool((pod.get("spec") or {}).get("nodeName"))
+
+
+class PodWatch:
+    """
+    Follows the pods of the run with one watch and records when each one
+    became ready.
+    """
+
+    def __init__(self, client, target, names, until, clock):
+        self.client = client
+        self.target = target
+        self.names = names
+        self.until = until
+        self.clock = clock
+        self.ready_at = {}
+        self._waiters = {}
+
+    async def run(self):
+        resource_version = None
+        while True:
+            try:
+                async for line in self.client.stream_lines(self.target.watch_path(resource_version)):
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    pod = event.get("object") or {}
+                    if event.get("type") == "ERROR":
+                        # Expired resourceVersion: start over, the ADDED events repeat the state
+                        resource_version = None
+                        break
+                    resource_version = (pod.get("metadata") or {}).get("resourceVersion") or resource_version
+                    if event.get("type") in ("ADDED", "MODIFIED"):
+                        self._observe(pod)
+            except (ConnectionError, asyncio.IncompleteReadError, HTTPError) as e:
+                print(f"Watch interrupted ({e}), reconnecting", file=sys.stderr)
+                await asyncio.sleep(0.5)
+
+    def _observe(self, pod):
+        name = (pod.get("metadata") or {}).get("name")
+        if name not in self.names or name in self.ready_at or not is_ready(pod, self.until):
+            return
+        self.ready_at[name] = self.clock.now()
+        waiter = self._waiters.pop(name, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def wait(self, name, timeout):
+        """
+        Return when the pod became ready, or None on timeout.
+        """
+        if name not in self.ready_at:
+            waiter = self._waiters[name] = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                self._waiters.pop(name, None)
+                return None
+        return self.ready_at[name]
+
+
+class Run:
+    def __init__(self, args):
+        self.args = args
+        self.clock = Clock()
+        self.client = HTTPClient(args.url, args.connections)
+        self.target = TARGETS[args.target](args.namespace)
+        self.names = {f"{args.name_prefix}{i}": i for i in range(1, args.count + 1)}
+        self.watch = PodWatch(self.client, self.target, self.names, args.until, self.clock)
+        self.rows = []
+        self.failed = 0
+        self.timeouts = 0
+
+    async def create_pod(self, i, start_time):
+        """
+        Create pod i and wait for it; start_time is when it was due, so that
+        queueing behind a slow server counts in an open loop.
+        """
+        args = self.args
+        name = f"{args.name_prefix}{i}"
+        deployment_start = self.clock.now()
+        try:
+            status, body = await self.client.request("POST", self.target.create_path(), new_pod(name, args.namespace))
+        except (OSError, asyncio.IncompleteReadError) as e:
+            status, body = None, str(e)
+        deployment_end = self.clock.now()
+        # A server error can still leave the pod stored and scheduled later, so only
+        # rejected requests fail right away, like in the original scripts
+        if status is None or 400 <= status < 500:
+            print(f"Pod {name} not created: {status} {body}", file=sys.stderr)
+            self.failed += 1
+            self.write_row([i] + [0] * 9)
+            return
+
+        pod_start = self.clock.now()
+        ready_at = await self.watch.wait(name, args.timeout)
+        if ready_at is None:
+            print(f"Pod {name} timeout", file=sys.stderr)
+            self.timeouts += 1
+            self.write_row([i] + [0] * 9)
+            return
+        # Create-and-bind can report the binding before the create returns
+        pod_end = max(ready_at, pod_start)
+        end_time = self.clock.now()
+        self.write_row([
+            i, start_time, deployment_start, deployment_end, pod_start, pod_end, end_time,
+            (end_time - start_time) // 1000000,
+            (deployment_end - deployment_start) // 1000000,
+            (pod_end - pod_start) // 1000000,
+        ])
+
+    def write_row(self, row):
+        self.rows.append(row)
+        self.writer.writerow(row)
+        self.output.flush()
+
+    async def open_loop(self):
+        rng = random.Random(self.args.seed)
+        due = time.perf_counter()
+        tasks = []
+        for i in range(1, self.args.count + 1):
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            start_time = self.clock.now() - max(0, int(-delay * 1e9))
+            tasks.append(asyncio.create_task(self.create_pod(i, start_time)))
+            gap = 1 / self.args.rate
+            due += rng.expovariate(1 / gap) if self.args.arrival == "poisson" else gap
+        await asyncio.gather(*tasks)
+
+    async def closed_loop(self):
+        indices = iter(range(1, self.args.count + 1))
+
+        async def client():
+            for i in indices:
+                await self.create_pod(i, self.clock.now())
+
+        await asyncio.gather(*(client() for _ in range(self.args.concurrency)))
+
+    async def run(self):
+        # A watch without resourceVersion starts with the current state of
+        # every pod, so pods bound before it is established are not missed
+        watch = asyncio.create_task(self.watch.run())
+
+        started = time.perf_counter()
+        with open(self.args.output, "w", newline="") as self.output:
+            self.writer = csv.writer(self.output)
+            self.writer.writerow(CSV_COLUMNS)
+            if self.args.rate:
+                await self.open_loop()
+            else:
+                await self.closed_loop()
+        elapsed = time.perf_counter() - started
+        watch.cancel()
+
+        if not self.args.keep:
+            await self.target.delete(self.client, list(self.names))
+        self.client.close()
+        self.report(elapsed)
+
+    def report(self, elapsed):
+        completed = [row for row in self.rows if row[1]]
+        print(f"{len(completed)} of {len(self.rows)} pods {self.args.until} in {elapsed:.1f}s "
+              f"({len(completed) / elapsed:.1f} pods/s), {self.timeouts} timed out, {self.failed} failed")
+        for column, label in ((8, "create"), (9, self.args.until), (7, "total")):
+            samples = sorted(row[column] for row in completed)
+            if not samples:
+                continue
+            p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+            print(f"{label:<10} p50 {statistics.median(samples):>8.0f}ms  p99 {p99:>8}ms  max {samples[-1]:>8}ms")
+        print(f"Results written to {self.args.output}")
+
+
+def main():
+    dirname = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://api-server.default.127.0.0.1.sslip.io",
+                        help="base URL of the API server")
+    parser.add_argument("--target", choices=sorted(TARGETS), default="serverless",
+                        help="serverless API server or kube-apiserver")
+    parser.add_argument("--count", type=int, default=500, help="pods to create")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--rate", type=float, help="open loop: pods created per second")
+    load.add_argument("--concurrency", type=int, default=10, help="closed loop: clients creating pods")
+    parser.add_argument("--arrival", choices=["poisson", "uniform"], default="poisson",
+                        help="spacing of the open-loop arrivals")
+    parser.add_argument("--until", choices=["bound", "running"], default="bound",
+                        help="wait until the pod is bound to a node, or running")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for each pod")
+    parser.add_argument("--connections", type=int, default=100, help="keep-alive connections to the API server")
+    parser.add_argument("--namespace", default="default")
+    parser.add_argument("--name-prefix", default="demo")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the open-loop arrivals")
+    parser.add_argument("--keep", action="store_true", help="do not delete the pods afterwards")
+    parser.add_argument("--output", default=os.path.join(dirname, "output.csv"))
+    args = parser.parse_args()
+    if args.rate is not None and args.rate <= 0:
+        parser.error("--rate must be positive")
+
+    async def run():
+        # Created in the running loop: Python 3.9 binds asyncio primitives on creation
+        await Run(args).run()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,378 @@
+"""
+Latency and throughput report of one or more benchmark runs.
+
+Reads the CSV files written by loadgen.py (or the former demo scripts), drops
+the rows of pods that timed out (all zeros), and reports per run:
+
+    deployment_time, pod_ready_time, total_time   count, mean, p50, p90, p99, max (ms)
+    throughput                                    pods completed per second over
+                                                  sliding windows: peak, mean, min
+
+The rows are streamed and only counted per distinct millisecond value and per
+second, so memory stays bounded for CSV files of millions of rows, and the
+percentiles are exact. The report is written without a display:
+
+    summary.json   the numbers above, for regression gating
+    report.html    tables and charts, self-contained
+    report.png     the charts, if matplotlib is installed
+
+    python demo/process_results.py demo/k8s_output_500.csv demo/serverless_output_500.csv
+
+With --baseline, compare against an earlier summary.json and exit with 1 if
+a percentile of a run got slower by more than --tolerance.
+"""
+import argparse
+import csv
+import html
+import json
+import math
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-# Load the CSV file
-dirname = os.path.dirname(__file__)
-file_path = os.path.join(dirname, 'output.csv')
-data = pd.read_csv(file_path)
-
-# Step 1: Sort the data by the 'pod_end' column
-data_sorted = data.sort_values(by='pod_end')
-
-# Step 2: Normalize the 'pod_end' column
-pod_end_first = data_sorted['pod_end'].iloc[0]
-data_sorted['normalized_pod_end'] = (data_sorted['pod_end'] - pod_end_first) / 1000000
-
-# Step 3: Plot the graph by sorting order
-plt.figure(figsize=(10, 6))
-plt.plot(
-    range(len(data_sorted)),  # X-axis: Sorting order
-    data_sorted['normalized_pod_end'],  # Y-axis: Normalized pod_end
-    marker='o',
-    linestyle='-',
-    color='b',
-    label='Normalized Pod End Time'
-)
-plt.title('Normalized Pod End Time by Starting Instance', fontsize=14)
-plt.xlabel('Starting Instance', fontsize=12)
-plt.ylabel('Normalized Pod End Time (ms)', fontsize=12)
-plt.grid(True, linestyle='--', alpha=0.6)
-plt.legend(fontsize=10)
-plt.tight_layout()
-plt.show()
-
-# Step 4: Plot the distribution of 'pod_ready_time'
-plt.figure(figsize=(10, 6))
-sns.histplot(data_sorted['pod_ready_time'], kde=True, color='g', bins=30, label='Pod Ready Time Distribution')
-plt.title('Distribution of Pod Ready Time', fontsize=14)
-plt.xlabel('Pod Ready Time (ms)', fontsize=12)
-plt.ylabel('Frequency', fontsize=12)
-plt.grid(True, linestyle='--', alpha=0.6)
-plt.legend(fontsize=10)
-plt.tight_layout()
-plt.show()
+import sys
+from collections import Counter
+
+METRICS = ("deployment_time", "pod_ready_time", "total_time")
+PERCENTILES = (50, 90, 99)
+COLORS = ("#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f")
+
+
+class RunStats:
+    """
+    Streaming statistics of one run.
+    """
+
+    def __init__(self, label, path):
+        self.label = label
+        self.path = path
+        self.rows = 0
+        self.timeouts = 0
+        self.malformed = 0
+        self.latencies = {metric: Counter() for metric in METRICS}  # ms -> count
+        self.completions = Counter()  # Unix second of end_time -> pods completed
+        self.first_start = None
+        self.last_end = None
+
+    def add(self, start_time, end_time, values):
+        """
+        Count one row, given its start_time and end_time (ns) and the METRICS (ms) as strings.
+        """
+        self.rows += 1
+        try:
+            start_time = int(start_time)
+            end_time = int(end_time)
+            values = [int(float(value)) for value in values]
+        except ValueError:
+            self.malformed += 1
+            return
+        if not start_time or not end_time:
+            self.timeouts += 1
+            return
+        for metric, value in zip(METRICS, values):
+            self.latencies[metric][value] += 1
+        self.completions[end_time // 1_000_000_000] += 1
+        self.first_start = start_time if self.first_start is None else min(self.first_start, start_time)
+        self.last_end = end_time if self.last_end is None else max(self.last_end, end_time)
+
+    @property
+    def completed(self):
+        return sum(self.latencies[METRICS[0]].values())
+
+    @property
+    def duration(self):
+        if self.first_start is None:
+            return 0.0
+        return (self.last_end - self.first_start) / 1e9
+
+    def latency_summary(self, metric):
+        counts = self.latencies[metric]
+        total = sum(counts.values())
+        if not total:
+            return None
+        summary = {"count": total, "mean": round(sum(value * count for value, count in counts.items()) / total, 1)}
+        ranks = {f"p{p}": math.ceil(p / 100 * total) for p in PERCENTILES}
+        seen = 0
+        for value in sorted(counts):
+            seen += counts[value]
+            for name, rank in ranks.items():
+                if name not in summary and seen >= rank:
+                    summary[name] = value
+        summary["max"] = max(counts)
+        return summary
+
+    def cdf(self, metric):
+        """
+        [(ms, fraction of pods done within ms)].
+        """
+        counts = self.latencies[metric]
+        total = sum(counts.values())
+        points = []
+        seen = 0
+        for value in sorted(counts):
+            seen += counts[value]
+            points.append((value, seen / total))
+        return points
+
+    def throughput(self, window, step):
+        """
+        [(seconds since the first start, pods per second over the window ending there)].
+        """
+        if self.first_start is None:
+            return []
+        first = self.first_start // 1_000_000_000
+        last = self.last_end // 1_000_000_000
+        series = []
+        total = 0
+        for second in range(first, last + 1):
+            total += self.completions.get(second, 0)
+            if second - window >= first:
+                total -= self.completions.get(second - window, 0)
+            offset = second - first + 1
+            if offset >= min(window, last - first + 1) and (offset % step == 0 or second == last):
+                series.append((offset, total / min(window, offset)))
+        return series
+
+    def summary(self, window, step):
+        throughput = [rate for _, rate in self.throughput(window, step)]
+        return {
+            "file": self.path,
+            "rows": self.rows,
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+            "malformed": self.malformed,
+            "duration_s": round(self.duration, 3),
+            "latency_ms": {metric: self.latency_summary(metric) for metric in METRICS},
+            "throughput_pods_per_s": {
+                "window_s": window,
+                "overall": round(self.completed / self.duration, 3) if self.duration else None,
+                "peak": round(max(throughput), 3) if throughput else None,
+                "mean": round(sum(throughput) / len(throughput), 3) if throughput else None,
+                "min": round(min(throughput), 3) if throughput else None,
+            },
+        }
+
+
+def load_run(path, label):
+    stats = RunStats(label, path)
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        try:
+            columns = [header.index(column) for column in ("start_time", "end_time") + METRICS]
+        except ValueError:
+            sys.exit(f"{path} lacks one of the columns start_time, end_time, {', '.join(METRICS)}")
+        width = max(columns) + 1
+        for row in reader:
+            # The demo scripts appended a header line on every run
+            if row == header:
+                continue
+            if len(row) < width:
+                stats.rows += 1
+                stats.malformed += 1
+                continue
+            values = [row[column] for column in columns]
+            stats.add(values[0], values[1], values[2:])
+    return stats
+
+
+def compare(summary, baseline, tolerance):
+    """
+    Lines describing the percentiles that got slower than the baseline allows.
+    """
+    regressions = []
+    for label, run in summary["runs"].items():
+        base = baseline.get("runs", {}).get(label)
+        if base is None:
+            continue
+        for metric in METRICS:
+            current, previous = run["latency_ms"].get(metric), base["latency_ms"].get(metric)
+            if not current or not previous:
+                continue
+            for name in [f"p{p}" for p in PERCENTILES]:
+                if previous[name] and current[name] > previous[name] * (1 + tolerance):
+                    regressions.append(
+                        f"{label} {metric} {name}: {current[name]}ms, baseline {previous[name]}ms "
+                        f"(+{(current[name] / previous[name] - 1) * 100:.0f}%)"
+                    )
+    return regressions
+
+
+def print_summary(summary):
+    for label, run in summary["runs"].items():
+        throughput = run["throughput_pods_per_s"]
+        print(f"{label}: {run['completed']} pods completed, {run['timeouts']} timed out, "
+              f"{run['malformed']} malformed rows, {run['duration_s']:.1f}s")
+        for metric in METRICS:
+            stats = run["latency_ms"][metric]
+            if stats:
+                print(f"  {metric:<16} p50 {stats['p50']:>8}  p90 {stats['p90']:>8}  p99 {stats['p99']:>8}  "
+                      f"max {stats['max']:>8}  mean {stats['mean']:>10.1f} ms")
+        if throughput["peak"] is not None:
+            print(f"  throughput       overall {throughput['overall']:.1f}  peak {throughput['peak']:.1f}  "
+                  f"mean {throughput['mean']:.1f}  min {throughput['min']:.1f} pods/s "
+                  f"({throughput['window_s']}s windows)")
+
+
+def svg_chart(title, x_label, y_label, series, width=640, height=360):
+    """
+    Line chart of {label: [(x, y)]} as an inline SVG element.
+    """
+    left, right, top, bottom = 60, 20, 30, 45
+    points = [point for values in series.values() for point in values]
+    if not points:
+        return f"<p>{html.escape(title)}: no data</p>"
+    max_x = max(x for x, _ in points) or 1
+    max_y = max(y for _, y in points) or 1
+
+    def sx(x):
+        return left + x / max_x * (width - left - right)
+
+    def sy(y):
+        return height - bottom - y / max_y * (height - top - bottom)
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="sans-serif" font-size="11">',
+        f'<text x="{width / 2}" y="16" text-anchor="middle" font-size="13">{html.escape(title)}</text>',
+        f'<line x1="{left}" y1="{sy(0)}" x2="{width - right}" y2="{sy(0)}" stroke="black"/>',
+        f'<line x1="{left}" y1="{sy(0)}" x2="{left}" y2="{top}" stroke="black"/>',
+        f'<text x="{width / 2}" y="{height - 8}" text-anchor="middle">{html.escape(x_label)}</text>',
+        f'<text x="14" y="{height / 2}" text-anchor="middle" transform="rotate(-90 14 {height / 2})">'
+        f'{html.escape(y_label)}</text>',
+    ]
+    for tick in range(5):
+        x, y = max_x * tick / 4, max_y * tick / 4
+        parts.append(f'<text x="{sx(x)}" y="{sy(0) + 14}" text-anchor="middle">{x:.4g}</text>')
+        parts.append(f'<text x="{left - 4}" y="{sy(y) + 4}" text-anchor="end">{y:.3g}</text>')
+        parts.append(f'<line x1="{left}" y1="{sy(y)}" x2="{width - right}" y2="{sy(y)}" stroke="#ddd"/>')
+    for index, (label, values) in enumerate(series.items()):
+        color = COLORS[index % len(COLORS)]
+        # Thin out long series, a chart has no use for more points than pixels
+        stride = max(1, len(values) // (width * 2))
+        path = " ".join(f"{sx(x):.1f},{sy(y):.1f}" for x, y in values[::stride] + values[-1:])
+        parts.append(f'<polyline fill="none" stroke="{color}" stroke-width="1.5" points="{path}"/>')
+        parts.append(f'<text x="{left + 10}" y="{top + 14 * (index + 1)}" fill="{color}">{html.escape(label)}</text>')
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+def charts(runs, window, step):
+    """
+    (title, x label, y label, series) of every chart in the report.
+    """
+    specs = [(
+        f"Throughput ({window}s sliding window)", "seconds since the first pod", "pods / s",
+        {run.label: run.throughput(window, step) for run in runs},
+    )]
+    for metric in METRICS:
+        specs.append((
+            f"{metric} distribution", f"{metric} (ms)", "fraction of pods",
+            {run.label: run.cdf(metric) for run in runs},
+        ))
+    return specs
+
+
+def write_html(path, summary, specs):
+    rows = []
+    for label, run in summary["runs"].items():
+        for metric in METRICS:
+            stats = run["latency_ms"][metric] or {}
+            rows.append(
+                f"<tr><td>{html.escape(label)}</td><td>{metric}</td>"
+                + "".join(f"<td>{stats.get(name, '')}</td>" for name in ("count", "p50", "p90", "p99", "max", "mean"))
+                + "</tr>"
+            )
+    throughput_rows = [
+        f"<tr><td>{html.escape(label)}</td><td>{run['completed']}</td><td>{run['timeouts']}</td>"
+        + "".join(f"<td>{run['throughput_pods_per_s'][name]}</td>" for name in ("overall", "peak", "mean", "min"))
+        + "</tr>"
+        for label, run in summary["runs"].items()
+    ]
+    with open(path, "w") as f:
+        f.write(f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Benchmark report</title>
+<style>body {{ font-family: sans-serif; }} td, th {{ padding: 2px 10px; text-align: right; }}</style>
+</head><body>
+<h1>Benchmark report</h1>
+<h2>Latency (ms)</h2>
+<table><tr><th>run</th><th>metric</th><th>count</th><th>p50</th><th>p90</th><th>p99</th><th>max</th><th>mean</th></tr>
+{"".join(rows)}</table>
+<h2>Throughput (pods/s)</h2>
+<table><tr><th>run</th><th>completed</th><th>timeouts</th><th>overall</th><th>peak</th><th>mean</th><th>min</th></tr>
+{"".join(throughput_rows)}</table>
+<h2>Charts</h2>
+{"".join(svg_chart(*spec) for spec in specs)}
+</body></html>
+""")
+
+
+def write_png(path, specs):
+    """
+    Draw the charts with matplotlib, if it is installed. Returns whether it was.
+    """
+    try:
+        import matplotlib
+    except ImportError:
+        return False
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(2, 2, figsize=(14, 9))
+    for ax, (title, x_label, y_label, series) in zip(axes.flat, specs):
+        for label, values in series.items():
+            if values:
+                ax.plot([x for x, _ in values], [y for _, y in values], label=label)
+        ax.set_title(title)
+        ax.set_xlabel(x_label)
+        ax.set_ylabel(y_label)
+        ax.grid(True, linestyle="--", alpha=0.6)
+        ax.legend()
+    fig.tight_layout()
+    fig.savefig(path, dpi=100)
+    plt.close(fig)
+    return True
+
+
+def main():
+    dirname = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="*", default=[os.path.join(dirname, "output.csv")],
+                        help="CSV files of the runs (default: demo/output.csv)")
+    parser.add_argument("--output-dir", default=os.path.join(dirname, "report"))
+    parser.add_argument("--window", type=int, default=10, help="seconds per throughput window")
+    parser.add_argument("--step", type=int, default=1, help="seconds between throughput windows")
+    parser.add_argument("--baseline", help="summary.json of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed slowdown of a percentile against the baseline (0.1 = 10%%)")
+    args = parser.parse_args()
+    if args.window < 1 or args.step < 1:
+        parser.error("--window and --step must be at least 1")
+
+    runs = []
+    for path in args.files:
+        label = os.path.splitext(os.path.basename(path))[0]
+        if any(run.label == label for run in runs):
+            label = path
+        runs.append(load_run(path, label))
+
+    summary = {"runs": {run.label: run.summary(args.window, args.step) for run in runs}}
+    print_summary(summary)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    specs = charts(runs, args.window, args.step)
+    write_html(os.path.join(args.output_dir, "report.html"), summary, specs)
+    written = ["summary.json", "report.html"]
+    if write_png(os.path.join(args.output_dir, "report.png"), specs):
+        written.append("report.png")
+    print(f"Wrote {', '.join(written)} to {args.output_dir}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(summary, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"Regression: {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
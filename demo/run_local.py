@@ -0,0 +1,102 @@
+"""
+Run the API server, scheduler and controller together in one process, on
+the in-memory etcd stand-in (common/memory_etcd.py), for benchmarks and
+profiling without a cluster:
+
+    python demo/run_local.py --nodes 100
+    python demo/loadgen.py --url http://127.0.0.1:8080 --count 1000 --concurrency 50
+
+The services listen on localhost (ports 8080, 8081 and 8082 by default) and
+call each other there. Synthetic nodes are stored under /registry/minions/
+before the services start. Objects are stored as JSON, so no Auger build is
+needed; with `--codec protobuf` they go through Auger as in the cluster
+(set AUGER_BIN and AUGERD_BIN if it is not in ./auger/build). Other
+settings of the services, e.g. ASYNC_SCHEDULING, STORAGE_CODECS or
+TRACE_FILE, are read from the environment as usual.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def node_object(name, cpu, memory, pods):
+    return {
+        "kind": "Node",
+        "apiVersion": "v1",
+        "metadata": {"name": name, "labels": {"kubernetes.io/hostname": name}},
+        "spec": {},
+        "status": {
+            "allocatable": {"cpu": cpu, "memory": memory, "pods": str(pods)},
+            "conditions": [{"type": "Ready", "status": "True"}],
+        },
+    }
+
+
+def serve(app, host, port):
+    from werkzeug.serving import make_server
+
+    server = make_server(host, port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name=f"serve-{port}", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--api-server-port", type=int, default=8080)
+    parser.add_argument("--scheduler-port", type=int, default=8081)
+    parser.add_argument("--controller-port", type=int, default=8082)
+    parser.add_argument("--nodes", type=int, default=10, help="synthetic nodes to create")
+    parser.add_argument("--node-cpu", default="32", help="allocatable CPU of each node")
+    parser.add_argument("--node-memory", default="128Gi", help="allocatable memory of each node")
+    parser.add_argument("--node-pods", type=int, default=110, help="pod capacity of each node")
+    parser.add_argument("--codec", choices=("json", "msgpack", "protobuf"), default="json",
+                        help="storage codec of the objects (see common/codec.py)")
+    parser.add_argument("--access-log", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    # The services read these at import
+    os.environ["STORAGE_BACKEND"] = "memory"
+    os.environ["STORAGE_CODEC"] = args.codec
+    os.environ["API_SERVER_URL"] = f"http://{args.host}:{args.api_server_port}"
+    os.environ["SCHEDULER_URL"] = f"http://{args.host}:{args.scheduler_port}"
+    os.environ["CONTROLLER_URL"] = f"http://{args.host}:{args.controller_port}"
+    sys.path[:0] = [ROOT] + [os.path.join(ROOT, "services", name) for name in ("api_server", "scheduler", "controller")]
+
+    from common.memory_etcd import shared_store
+
+    store = shared_store()
+    for i in range(args.nodes):
+        name = f"node-{i}"
+        node = node_object(name, args.node_cpu, args.node_memory, args.node_pods)
+        store.put(f"/registry/minions/{name}", json.dumps(node))
+    print(f"Created {args.nodes} nodes")
+
+    import api_server
+    import controller
+    import scheduler
+
+    if not args.access_log:
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    servers = []
+    for service, port in ((scheduler, args.scheduler_port), (controller, args.controller_port),
+                          (api_server, args.api_server_port)):
+        service.start()
+        servers.append(serve(service.app, args.host, port))
+        print(f"{service.__name__} listening on http://{args.host}:{port}")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Stand-in for an OpenTelemetry collector, and a viewer for the spans the
+services export (see common/tracing.py).
+
+Receive spans over OTLP/HTTP JSON and append them to a JSON-lines file, in
+the same format as TRACE_FILE:
+
+    python demo/trace_collector.py serve --port 4318 --output traces.jsonl
+
+and point the services at it with TRACE_OTLP_ENDPOINT=http://<host>:4318/v1/traces.
+
+List the slowest requests, then show where the time of one of them went:
+
+    python demo/trace_collector.py show traces.jsonl --slowest 10
+    python demo/trace_collector.py show traces.jsonl --trace <trace id>
+"""
+import argparse
+import json
+import sys
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def attribute_value(value):
+    for kind in ("stringValue", "boolValue", "doubleValue"):
+        if kind in value:
+            return value[kind]
+    if "intValue" in value:
+        return int(value["intValue"])
+    return None
+
+
+def spans_from_otlp(request):
+    """
+    Span records of an OTLP ExportTraceServiceRequest in the JSON encoding.
+    """
+    for resource_spans in request.get("resourceSpans", []):
+        resource = {
+            attribute["key"]: attribute_value(attribute["value"])
+            for attribute in (resource_spans.get("resource") or {}).get("attributes", [])
+        }
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                start = int(span["startTimeUnixNano"])
+                status = span.get("status") or {}
+                yield {
+                    "trace_id": span["traceId"],
+                    "span_id": span["spanId"],
+                    "parent_id": span.get("parentSpanId") or None,
+                    "service": resource.get("service.name", "unknown"),
+                    "name": span["name"],
+                    "kind": span.get("kind", 1),
+                    "start": start / 1e9,
+                    "duration_ms": round((int(span["endTimeUnixNano"]) - start) / 1e6, 3),
+                    "attributes": {
+                        attribute["key"]: attribute_value(attribute["value"]) for attribute in span.get("attributes", [])
+                    },
+                    "error": status.get("message") if status.get("code") == 2 else None,
+                }
+
+
+def serve(port, output):
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/v1/traces":
+                self.send_error(404)
+                return
+            try:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                records = list(spans_from_otlp(json.loads(body)))
+            except (ValueError, KeyError, TypeError) as e:
+                self.send_error(400, str(e))
+                return
+            with lock, open(output, "a") as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    print(f"Receiving OTLP/HTTP JSON spans on :{port}/v1/traces, writing to {output}")
+    ThreadingHTTPServer(("0.0.0.0", port), Handler).serve_forever()
+
+
+def load_traces(paths):
+    traces = defaultdict(list)
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    traces[record["trace_id"]].append(record)
+    return traces
+
+
+def roots(spans):
+    """
+    Spans whose parent is not part of the trace (the first hop).
+    """
+    ids = {span["span_id"] for span in spans}
+    return [span for span in spans if span["parent_id"] not in ids]
+
+
+def show_slowest(traces, count):
+    rows = []
+    for trace_id, spans in traces.items():
+        first = min(span["start"] for span in spans)
+        end = max(span["start"] + span["duration_ms"] / 1000 for span in spans)
+        root = min(roots(spans), key=lambda span: span["start"])
+        rows.append(((end - first) * 1000, trace_id, root, len(spans)))
+    rows.sort(key=lambda row: row[0], reverse=True)
+    print(f"{'ms':>10}  {'trace id':<32}  {'spans':>5}  first hop")
+    for duration, trace_id, root, spans in rows[:count]:
+        print(f"{duration:>10.1f}  {trace_id:<32}  {spans:>5}  {root['service']} {root['name']}")
+
+
+def show_trace(spans):
+    children = defaultdict(list)
+    for span in spans:
+        children[span["parent_id"]].append(span)
+    first = min(span["start"] for span in spans)
+
+    def show(span, depth):
+        offset = (span["start"] - first) * 1000
+        error = f"  ERROR {span['error']}" if span.get("error") else ""
+        print(f"{offset:>9.1f} {span['duration_ms']:>9.1f}  {'  ' * depth}{span['service']}: {span['name']}{error}")
+        for child in sorted(children[span["span_id"]], key=lambda child: child["start"]):
+            show(child, depth + 1)
+
+    print(f"{'start ms':>9} {'ms':>9}  span")
+    for root in sorted(roots(spans), key=lambda span: span["start"]):
+        show(root, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="receive spans over OTLP/HTTP JSON")
+    serve_parser.add_argument("--port", type=int, default=4318)
+    serve_parser.add_argument("--output", default="traces.jsonl")
+    show_parser = commands.add_parser("show", help="list slow traces or show one")
+    show_parser.add_argument("files", nargs="+", help="JSON-lines span files, from TRACE_FILE or serve")
+    show_parser.add_argument("--trace", help="trace id to show (as returned in X-Trace-Id)")
+    show_parser.add_argument("--slowest", type=int, default=10, help="number of traces to list")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.port, args.output)
+        return
+
+    traces = load_traces(args.files)
+    if args.trace:
+        if args.trace not in traces:
+            sys.exit(f"Trace {args.trace} not found")
+        show_trace(traces[args.trace])
+    else:
+        show_slowest(traces, args.slowest)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,54 @@
-from flask import Flask, request, jsonify
-import etcd3
+from flask import Flask, Response, request, jsonify
 import os
 from datetime import datetime
 import json
-import yaml
 import traceback
-import subprocess
-import requests
 from datetime import datetime
 import uuid
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from common import http_client, metrics, tracing
+from common.cache import object_cache, parse_cached, parse_cached_many
+from pending_bindings import PendingBindings, pending_entry, pending_key
+from pod_status import SummaryCache, pod_summary, status_row
+from watch_cache import UnknownResource, WatchExpired, WatchHub, event_line, status_object
+from common.batch import delete_many, get_many, put_many
+from common.codec import decode_yaml, encode, encode_many, get_pool
+from common.etcd_client import LazyClient
+from common.pagination import ContinueTokenExpired, InvalidContinueToken, encode_continue, list_page, scan_prefix
+from common.selector import SelectorError, parse_field_selector, parse_label_selector
+from common.startup import StartupTimeline
 
 # Initialize Flask App
 app = Flask(__name__)
+startup = StartupTimeline("api-server")
+startup.install(app)
+metrics.install(app)
+tracing.install(app, "api-server")
+startup.mark("imported")
 
 # Constant
-SCHEDULER_URL = "http://knative-scheduler.default.svc.cluster.local"
-CONTROLLER_URL = "http://knative-controller.default.svc.cluster.local"
+SCHEDULER_URL = os.environ.get("SCHEDULER_URL", "http://knative-scheduler.default.svc.cluster.local")
+CONTROLLER_URL = os.environ.get("CONTROLLER_URL", "http://knative-controller.default.svc.cluster.local")
 
-# etcd Configuration
-ETCD_HOST = "172.18.0.2"
-ETCD_PORT = 2379
+# Pooled keep-alive clients for the other services
+scheduler_client = http_client.get_client(SCHEDULER_URL)
+controller_client = http_client.get_client(CONTROLLER_URL)
+controller_notifier = ThreadPoolExecutor(max_workers=2, thread_name_prefix="controller-notify")
+
+# Persist resources and return 202 right away, scheduling them in the background.
+# Can be overridden per request with `?async=true|false`.
+ASYNC_SCHEDULING = os.environ.get("ASYNC_SCHEDULING", "false").lower() == "true"
+
+# Scheduler failure reasons of a bulk Pod create that leave the pod unstored
+NOT_STORED_REASONS = ("AlreadyExists", "Invalid", "EncodeFailed", "NotStored")
+
+# etcd Configuration, STORAGE_BACKEND=memory keeps the data in this process
+# instead (see common.memory_etcd) and ETCD_TLS=false connects without certificates
+ETCD_HOST = os.environ.get("ETCD_HOST", "172.18.0.2")
+ETCD_PORT = int(os.environ.get("ETCD_PORT", "2379"))
+ETCD_TLS = os.environ.get("ETCD_TLS", "true").lower() == "true"
 
 # Path to certificates
 dirname = os.path.dirname(__file__)
@@ -27,19 +56,26 @@ ca_cert = os.path.join(dirname, 'certs/ca.crt')
 cert_cert = os.path.join(dirname, 'certs/client.crt')
 cert_key = os.path.join(dirname, 'certs/client.key')
 
-# Initialize etcd3 Client
-etcd = etcd3.client(
+# etcd3 Client, connected on first use (see common.etcd_client)
+etcd = LazyClient(
     host=ETCD_HOST,
     port=ETCD_PORT,
-    ca_cert=ca_cert,
-    cert_cert=cert_cert,
-    cert_key=cert_key
+    ca_cert=ca_cert if ETCD_TLS else None,
+    cert_cert=cert_cert if ETCD_TLS else None,
+    cert_key=cert_key if ETCD_TLS else None
 )
 
+# Pod status summaries by revision, shared by the status endpoints
+pod_summaries = SummaryCache()
+metrics.cache_metrics("pod_summary_cache", "pod status summary cache", pod_summaries.stats)
+
+# One shared etcd watch per resource type for watch requests and selector queries
+watch_hub = WatchHub(etcd)
+
 @app.route('/', methods=['GET'])
 def health_check():
     try:
-        response = requests.get(SCHEDULER_URL)
+        response = scheduler_client.get("/")
         if response.status_code == 200:
             return jsonify({"status": "API is running"}), 200
         else:
@@ -47,9 +83,24 @@ def health_check():
     except Exception as e:
         return {"status": "failure", "error": str(e)}
 
+@app.route('/debug/stats', methods=['GET'])
+def debug_stats():
+    """Connection pool, cache and startup statistics of this instance."""
+    return jsonify({
+        "http_clients": http_client.stats(),
+        "object_cache": object_cache.stats(),
+        "pod_summaries": pod_summaries.stats(),
+        "watches": watch_hub.stats(),
+        "startup": startup.stats(),
+        "tracing": tracing.exporter.stats(),
+    }), 200
+
 @app.route('/api/v1/<resource>', methods=['POST'])
 def create_resource(resource):
-    """Create a resource in etcd."""
+    """
+    Create a resource in etcd. The body can also hold many resources, as a
+    multi-document YAML stream or a JSON list, which are created in bulk.
+    """
     try:
         if "file" in request.files:
             # return jsonify({"error": "No file part in the request"}), 400
@@ -60,10 +111,20 @@ def create_resource(resource):
             elif not file.filename.endswith(".yaml"):
                 return jsonify({"error": "Expect YAML file"}), 400
             
-            data = yaml.safe_load(file.stream)
+            data = load_yaml_documents(file.stream)
+        elif request.mimetype in ("application/yaml", "application/x-yaml", "text/yaml"):
+            data = load_yaml_documents(request.get_data())
         else:
             data = request.json
 
+        # A single document is created as before, anything else in bulk
+        if isinstance(data, list) and len(data) == 1:
+            data = data[0]
+        if isinstance(data, list):
+            return create_resources(resource, data)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expect a resource object"}), 400
+
         namespace = data.get("metadata", {}).get("namespace", "default")
         resource_name = data.get("metadata", {}).get("name", "")
         if not resource_name:
@@ -76,16 +137,44 @@ def create_resource(resource):
         data["metadata"]["uid"] = resource_uid
 
         # Step 2: Encode the resource and store it in etcd
-        etcd.put(etcd_key, auger_encode(data))
+        if use_async_scheduling():
+            value = encode(etcd_key, data)
+            if value is None:
+                return jsonify({"error": "Failed to encode resource"}), 500
+
+            # Store the resource and its pending binding together, schedule later
+            etcd.transaction(
+                compare=[],
+                success=[etcd.transactions.put(etcd_key, value)] + pending_bindings.put_ops(etcd_key)
+            )
+            object_cache.invalidate(etcd_key)
+            pending_bindings.enqueue([etcd_key])
+
+            if resource == "deployments":
+                notify_controller(resource, resource_name)
+
+            return jsonify({
+                "message": f"{resource.capitalize()} '{resource_name}' created, scheduling is pending",
+                "data": data
+            }), 202
+
+        # Pods are bound by the Scheduler and written to etcd once, by the Scheduler
+        if resource == "pods":
+            results = trigger_scheduler_create([(etcd_key, data)])
+            if results is not None:
+                return created_pod_response(resource_name, data, results[0])
+
+        value = encode(etcd_key, data)
+        if value is None:
+            return jsonify({"error": "Failed to encode resource"}), 500
+        etcd.put(etcd_key, value)
+        object_cache.invalidate(etcd_key)
 
         # Step 3: Trigger the Scheduler to assign a node to the resource
         scheduling_response = trigger_scheduler(etcd_key)
         
-        try:
-            if resource == "deployments":
-                trigger_controller(resource, resource_name)
-        except Exception:
-            pass
+        if resource == "deployments":
+            notify_controller(resource, resource_name)
         
         if scheduling_response.get("status") == "success":
             return jsonify({
@@ -112,7 +201,7 @@ def get_resource(resource, name):
 
         value, _ = etcd.get(etcd_key)
         if value:
-            return jsonify({"data": auger_decode(value)}), 200
+            return jsonify({"data": decode_yaml(value)}), 200
         else:
             return jsonify({"error": f"{resource.capitalize()} '{name}' not found"}), 404
         
@@ -127,55 +216,15 @@ def get_resource_status(name):
         namespace = request.args.get("namespace", "default")
         etcd_key = f"/registry/pods/{namespace}/{name}"
 
-        value, _ = etcd.get(etcd_key)
+        value, metadata = etcd.get(etcd_key)
 
         if value:
-            pod_data = detect_and_parse(value)
-
-            # Extract pod data
-            pod_name = pod_data.get("metadata", {}).get("name", "")
-            pod_phase = pod_data.get("status", {}).get("phase", "")
-            container_statuses = pod_data.get("status", {}).get("containerStatuses", [])
-            creation_timestamp = pod_data.get("metadata", {}).get("creationTimestamp")
-            deletion_timestamp = pod_data["metadata"].get("deletionTimestamp")
-
-            # Determine the number of ready containers
-            ready_containers = [container for container in container_statuses if container.get("ready", False)]
-            total_container_count = len(container_statuses)
-            ready_container_count = len(ready_containers)
-
-            # Determine the pod status
-            if deletion_timestamp:
-                pod_status = "Terminating"
-            elif pod_phase == "Running":
-                pod_status = "Running"
-            else:
-                pod_status = "Unknown"
-
-            # Calculate restarts
-            restart_count = sum(container.get("restartCount", 0) for container in container_statuses)
-
-            # Calculate the age of the pod by comparing current time
-            if creation_timestamp:
-                current_time = datetime.now()
-                creation_time = datetime.strptime(creation_timestamp, "%Y-%m-%dT%H:%M:%SZ")
-                age = current_time - creation_time
-                age_minutes = int(age.total_seconds() // 60)
-                age_seconds = int(age.total_seconds() % 60)
-            else:
-                age_minutes = 0
-                age_seconds = 0
-
-            status = {
-                "pod_name": pod_name,
-                "ready_container_count": ready_container_count,
-                "total_container_count": total_container_count,
-                "pod_status": pod_status,
-                "restart_count": restart_count,
-                "age": f"{age_minutes}m{age_seconds}s"
-            }
-            
-            return jsonify({"data": status}), 200
+            summary = pod_summaries.get(etcd_key, metadata.mod_revision)
+            if summary is None:
+                summary = pod_summary(parse_cached(etcd_key, value, metadata.mod_revision))
+                pod_summaries.put(etcd_key, metadata.mod_revision, summary)
+
+            return jsonify({"data": status_row(summary, datetime.now())}), 200
         else:
             return jsonify({"error": f"pod '{name}' not found"}), 404
         
@@ -183,35 +232,91 @@ def get_resource_status(name):
         traceback.print_exc()
         return jsonify({"error": "Internal System Error"}), 500
 
+@app.route('/api/v1/pods/status', methods=['GET'])
+def list_pod_statuses():
+    """
+    Retrieve the status of many pods at once, like `kubectl get pods`.
+    Without selectors every pod in the namespace is read with one range
+    request; with them only the pods the index selects are read. Only pods
+    that changed since their summary was computed are decoded, in parallel.
+    """
+    try:
+        namespace = request.args.get("namespace", "default")
+        try:
+            label_requirements = parse_label_selector(request.args.get("labelSelector"))
+            field_requirements = parse_field_selector(request.args.get("fieldSelector"))
+        except SelectorError as e:
+            return jsonify({"error": str(e)}), 400
+
+        summaries = {}
+        misses = []  # (key, value, mod_revision)
+
+        if label_requirements or field_requirements:
+            revision, selected = watch_hub.get("pods").select_keys(namespace, label_requirements, field_requirements)
+            unknown = []
+            for key, mod_revision in selected.items():
+                summary = pod_summaries.get(key, mod_revision)
+                if summary is None:
+                    unknown.append(key)
+                else:
+                    summaries[key] = summary
+            for key, (value, metadata) in get_many(etcd, unknown).items():
+                misses.append((key, value, metadata.mod_revision))
+        else:
+            response = etcd.get_prefix_response(f"/registry/pods/{namespace}/")
+            revision = response.header.revision
+            for kv in response.kvs:
+                key = kv.key.decode()
+                summary = pod_summaries.get(key, kv.mod_revision)
+                if summary is None:
+                    misses.append((key, kv.value, kv.mod_revision))
+                else:
+                    summaries[key] = summary
+
+        for (key, _, mod_revision), pod_data in zip(misses, parse_cached_many(misses)):
+            if pod_data is None:
+                continue
+            summary = summaries[key] = pod_summary(pod_data)
+            pod_summaries.put(key, mod_revision, summary)
+
+        now = datetime.now()
+        rows = [status_row(summaries[key], now) for key in sorted(summaries)]
+        return jsonify({"data": rows, "metadata": {"resourceVersion": str(revision)}}), 200
+
+    except Exception as error:
+        traceback.print_exc()
+        return jsonify({"error": "Internal System Error"}), 500
+
 @app.route('/api/v1/all', methods=['GET'])
 def list_all_resources():
     """List all keys in the etcd."""
     try:
         prefix = f"/registry/"
+        return list_keys(prefix)
 
-        resources = []
-        for value, metadata in etcd.get_prefix(prefix):
-            resources.append(metadata.key.decode())
-
-        return jsonify({"data": resources}), 200
-    
     except Exception as error:
         traceback.print_exc()
         return jsonify({"error": "Internal System Error"}), 500
 
 @app.route('/api/v1/<resource>', methods=['GET'])
 def list_resources(resource):
-    """List all resources of a type."""
+    """
+    List all resources of a type, or watch them with `?watch=true`.
+    With `labelSelector` or `fieldSelector` the matching objects are returned
+    instead of keys.
+    """
     try:
         namespace = request.args.get("namespace", "default")
-        prefix = f"/registry/{resource}/{namespace}/"
+        if request.args.get("watch", "false").lower() == "true":
+            return watch_resources(resource, namespace)
+        if request.args.get("labelSelector") or request.args.get("fieldSelector"):
+            return select_resources(resource, namespace)
 
-        resources = []
-        for value, metadata in etcd.get_prefix(prefix):
-            resources.append(metadata.key.decode())
+        prefix = f"/registry/{resource}/{namespace}/"
+        return list_keys(prefix)
 
-        return jsonify({"data": resources}), 200
-    
+    except UnknownResource as e:
+        return jsonify({"error": str(e)}), 404
     except Exception as error:
         traceback.print_exc()
         return jsonify({"error": "Internal System Error"}), 500
@@ -224,6 +329,7 @@ def delete_resource(resource, name):
         etcd_key = f"/registry/{resource}/{namespace}/{name}"
 
         deleted = etcd.delete(etcd_key)
+        object_cache.invalidate(etcd_key)
         if deleted:
             return jsonify({"message": f"{resource.capitalize()} '{name}' deleted successfully"}), 200
         else:
@@ -232,6 +338,289 @@ def delete_resource(resource, name):
         traceback.print_exc()
         return jsonify({"error": "Internal System Error"}), 500
 
+def list_keys(prefix):
+    """
+    List the keys under prefix without reading their values. With `limit` one
+    page is returned with a continue token for the next one. Without it the
+    whole list is streamed page by page, so memory use does not grow with
+    the number of keys.
+    """
+    try:
+        limit = int(request.args.get("limit") or 0)
+    except ValueError:
+        limit = -1
+    if limit < 0:
+        return jsonify({"error": "limit must be a positive number"}), 400
+    continue_token = request.args.get("continue")
+
+    if limit or continue_token:
+        try:
+            page = list_page(etcd, prefix, limit, continue_token, keys_only=True)
+        except InvalidContinueToken as e:
+            return jsonify({"error": str(e)}), 400
+        except ContinueTokenExpired as e:
+            return jsonify({"error": str(e)}), 410
+
+        metadata = {"resourceVersion": str(page.revision)}
+        if page.next_key is not None:
+            metadata["continue"] = encode_continue(page.revision, page.next_key)
+            metadata["remainingItemCount"] = page.remaining
+        return jsonify({"data": [kv.key.decode() for kv in page.kvs], "metadata": metadata}), 200
+
+    pages = scan_prefix(etcd, prefix, keys_only=True)
+    # Read the first page before answering, so that etcd errors still give a 500
+    first = next(pages)
+    return Response(stream_key_list(first, itertools.chain([first], pages)), mimetype="application/json")
+
+def stream_key_list(first, pages):
+    """
+    Yield `{"data": [keys...], "metadata": {...}}` one page at a time.
+    """
+    yield '{"data": ['
+    separator = ""
+    for page in pages:
+        if page.kvs:
+            yield separator + ", ".join(json.dumps(kv.key.decode()) for kv in page.kvs)
+            separator = ", "
+    yield '], "metadata": {"resourceVersion": "%d"}}' % first.revision
+
+def select_resources(resource, namespace):
+    """
+    Return the decoded resources that match the label and field selectors,
+    answered from the in-memory index of the resource type.
+    """
+    try:
+        label_requirements = parse_label_selector(request.args.get("labelSelector"))
+        field_requirements = parse_field_selector(request.args.get("fieldSelector"))
+    except SelectorError as e:
+        return jsonify({"error": str(e)}), 400
+
+    objects, revision = watch_hub.get(resource).select(namespace, label_requirements, field_requirements)
+    return jsonify({"data": objects, "metadata": {"resourceVersion": str(revision)}}), 200
+
+def watch_resources(resource, namespace):
+    """
+    Stream changes to the resources of a type as newline-delimited JSON
+    events (ADDED, MODIFIED, DELETED), starting after `resourceVersion` or
+    with the current objects when it is not given.
+    """
+    try:
+        resource_version = int(request.args.get("resourceVersion") or 0)
+        timeout_seconds = float(request.args.get("timeoutSeconds") or 0)
+    except ValueError:
+        return jsonify({"error": "resourceVersion and timeoutSeconds must be numbers"}), 400
+
+    cache = watch_hub.get(resource)
+    try:
+        initial, watcher = cache.watch(namespace, resource_version)
+    except WatchExpired as e:
+        # Same as Kubernetes: the stream opens and reports 410 Gone, the client lists again
+        return Response([event_line("ERROR", status_object(410, "Expired", str(e)))], mimetype="application/x-ndjson")
+
+    return Response(cache.stream(initial, watcher, timeout_seconds), mimetype="application/x-ndjson")
+
+@app.route('/api/v1/<resource>', methods=['DELETE'])
+def delete_resources(resource):
+    """
+    Delete many resources of a type at once, given as `{"names": [...]}`,
+    in batched etcd transactions.
+    """
+    try:
+        namespace = request.args.get("namespace", "default")
+        names = (request.get_json(silent=True) or {}).get("names")
+        if not isinstance(names, list) or not names or not all(isinstance(name, str) and name for name in names):
+            return jsonify({"error": "Expect a non-empty list of resource names in 'names'"}), 400
+
+        names = list(dict.fromkeys(names))
+        etcd_keys = [f"/registry/{resource}/{namespace}/{name}" for name in names]
+        deleted = set(delete_many(etcd, etcd_keys))
+        for etcd_key in deleted:
+            object_cache.invalidate(etcd_key)
+
+        return jsonify({
+            "message": f"{len(deleted)} of {len(names)} {resource} deleted successfully",
+            "deleted": [name for name, etcd_key in zip(names, etcd_keys) if etcd_key in deleted],
+            "not_found": [name for name, etcd_key in zip(names, etcd_keys) if etcd_key not in deleted]
+        }), 200
+    except Exception as error:
+        traceback.print_exc()
+        return jsonify({"error": "Internal System Error"}), 500
+
+def load_yaml_documents(stream):
+    """
+    Parse a multi-document YAML stream, skipping empty documents.
+    """
+    import yaml
+
+    return [document for document in yaml.safe_load_all(stream) if document is not None]
+
+def created_pod_response(pod_name, data, result):
+    """
+    Respond to a single Pod create from the Scheduler's create-and-bind result.
+    """
+    if result["status"] == "success":
+        return jsonify({
+            "message": f"Pods '{pod_name}' created and scheduled successfully",
+            "assigned_node": result["assigned_node"],
+            "data": data
+        }), 201
+    if result.get("reason") == "AlreadyExists":
+        return jsonify({"error": f"Pods '{pod_name}' already exists"}), 409
+    if result.get("reason") == "EncodeFailed":
+        return jsonify({"error": "Failed to encode resource"}), 500
+    if result.get("reason") == "Invalid":
+        return jsonify({"error": result.get("error")}), 400
+    if result.get("reason") == "NotStored":
+        return jsonify({
+            "error": "Resource was not created",
+            "details": {"status": "failure", "error": result.get("error")}
+        }), 503
+    # Unschedulable: stored unbound, the Scheduler's shard worker retries it
+    return jsonify({
+        "error": "Failed to schedule resource",
+        "details": {"status": "failure", "error": result.get("error")}
+    }), 500
+
+def create_resources(resource, objects):
+    """
+    Create many resources at once: validate all of them, encode them in
+    parallel, persist them in batched etcd transactions and hand them to the
+    Scheduler as one batch. The response reports the status of every object.
+    """
+    if not objects:
+        return jsonify({"error": "No resources in request"}), 400
+
+    # Step 1: Validate every object before writing anything
+    etcd_keys = []
+    errors = []
+    for index, data in enumerate(objects):
+        metadata = data.get("metadata") if isinstance(data, dict) else None
+        if not isinstance(metadata, dict) or not metadata.get("name"):
+            errors.append({"index": index, "error": "Resource name is required"})
+            continue
+        etcd_key = f"/registry/{resource}/{metadata.get('namespace', 'default')}/{metadata['name']}"
+        if etcd_key in etcd_keys:
+            errors.append({"index": index, "error": f"Duplicate resource '{metadata['name']}'"})
+            continue
+        etcd_keys.append(etcd_key)
+
+    if errors:
+        return jsonify({"error": "Invalid resources", "details": errors}), 400
+
+    # Step 2: Generate a UUID for every resource and encode them in parallel
+    for data in objects:
+        data["metadata"]["uid"] = create_uid()
+
+    # Pods are bound by the Scheduler and written to etcd once, by the Scheduler
+    if resource == "pods" and not use_async_scheduling():
+        scheduled = trigger_scheduler_create(list(zip(etcd_keys, objects)))
+        if scheduled is not None:
+            return created_pods_response(etcd_keys, objects, scheduled)
+
+    encoded = encode_many(zip(etcd_keys, objects))
+
+    results = []
+    created_keys = []
+    writes = []
+    for etcd_key, data, value in zip(etcd_keys, objects, encoded):
+        result = {"name": data["metadata"]["name"], "key": etcd_key}
+        if value is None:
+            result.update(status="failure", stored=False, reason="EncodeFailed", error="Failed to encode resource")
+        else:
+            result.update(status="created", stored=True)
+            created_keys.append(etcd_key)
+            writes.append((etcd_key, value))
+        results.append(result)
+
+    # Step 3: Store all resources in batched etcd transactions
+    if use_async_scheduling():
+        # Each resource is followed by its pending binding so that both land
+        # in the same transaction
+        put_many(etcd, [
+            write for etcd_key, value in writes
+            for write in ((etcd_key, value), (pending_key(etcd_key), pending_entry(etcd_key)))
+        ])
+        for etcd_key in created_keys:
+            object_cache.invalidate(etcd_key)
+        pending_bindings.enqueue(created_keys)
+
+        if resource == "deployments":
+            for etcd_key in created_keys:
+                notify_controller(resource, etcd_key.split("/")[-1])
+
+        for result in results:
+            if result["status"] == "created":
+                result["status"] = "pending"
+        return jsonify({
+            "message": f"{len(created_keys)} of {len(results)} {resource} created, scheduling is pending",
+            "results": results
+        }), 202 if len(created_keys) == len(results) else 207
+
+    put_many(etcd, writes)
+    for etcd_key in created_keys:
+        object_cache.invalidate(etcd_key)
+
+    # Step 4: Trigger the Scheduler once for the whole batch
+    if created_keys:
+        scheduling_response = trigger_scheduler_batch(created_keys)
+        scheduled = {item["pod_key"]: item for item in scheduling_response.get("results", [])}
+        for result in results:
+            if result["status"] != "created":
+                continue
+            item = scheduled.get(result["key"])
+            if item and item.get("status") == "success":
+                result.update(status="scheduled", assigned_node=item["assigned_node"])
+            else:
+                result.update(
+                    status="failure",
+                    error=(item or scheduling_response).get("error", "Failed to schedule resource")
+                )
+
+    if resource == "deployments":
+        for result in results:
+            if result["status"] == "scheduled":
+                notify_controller(resource, result["name"])
+
+    succeeded = sum(1 for result in results if result["status"] == "scheduled")
+    return jsonify({
+        "message": f"{succeeded} of {len(results)} {resource} created and scheduled successfully",
+        "results": results
+    }), 201 if succeeded == len(results) else 207
+
+def created_pods_response(etcd_keys, objects, scheduled):
+    """
+    Respond to a bulk Pod create from the Scheduler's create-and-bind results.
+    Every result says whether the pod was `stored`, and a failure its `reason`.
+    """
+    results = []
+    for etcd_key, data, item in zip(etcd_keys, objects, scheduled):
+        result = {"name": data["metadata"]["name"], "key": etcd_key}
+        if item["status"] == "success":
+            result.update(status="scheduled", stored=True, assigned_node=item["assigned_node"])
+        else:
+            reason = item.get("reason")
+            if reason == "EncodeFailed":
+                error = "Failed to encode resource"
+            else:
+                error = item.get("error", "Failed to schedule resource")
+            result.update(status="failure", stored=reason not in NOT_STORED_REASONS, reason=reason, error=error)
+        results.append(result)
+
+    succeeded = sum(1 for result in results if result["status"] == "scheduled")
+    return jsonify({
+        "message": f"{succeeded} of {len(results)} pods created and scheduled successfully",
+        "results": results
+    }), 201 if succeeded == len(results) else 207
+
+def use_async_scheduling():
+    """
+    Whether the current create request should be scheduled in the background.
+    """
+    mode = request.args.get("async")
+    if mode is None:
+        return ASYNC_SCHEDULING
+    return mode.lower() == "true"
+
 def create_uid():
     """Generate a unique UID for a resource."""
     return str(uuid.uuid4())
@@ -241,7 +630,7 @@ def trigger_scheduler(pod_key):
     Trigger the Scheduler Knative Service to assign the Pod to a node.
     """
     try:
-        response = requests.post(f"{SCHEDULER_URL}/schedule", json={"pod_key": pod_key})
+        response = scheduler_client.post("/schedule", json={"pod_key": pod_key})
         if response.status_code == 200:
             return {"status": "success", "assigned_node": response.json()["assigned_node"]}
         else:
@@ -249,77 +638,119 @@ def trigger_scheduler(pod_key):
     except Exception as e:
         return {"status": "failure", "error": str(e)}
     
-def trigger_controller(resource_type, resource_name):
+def trigger_scheduler_batch(pod_keys):
     """
-    Trigger the Controller Knative Service to for reconcile requests and perform actions.
+    Trigger the Scheduler Knative Service to assign many Pods in one call.
     """
     try:
-        response = requests.post(f"{CONTROLLER_URL}/reconcile", json={ "resource_type": resource_type, "resource_name": resource_name })
+        # Safe to retry: pods that are already bound are left alone
+        response = scheduler_client.post("/schedule/batch", json={"pod_keys": pod_keys}, idempotent=True)
         if response.status_code == 200:
-            return {"status": "success", "message": response.json()["message"]}
+            return {"status": "success", "results": response.json()["results"]}
         else:
-            return {"status": "failure", "error": "Failed to reconcile resource"}
+            return {"status": "failure", "error": "Failed to schedule Pods"}
     except Exception as e:
         return {"status": "failure", "error": str(e)}
 
-def detect_and_parse(value):
+def trigger_scheduler_create(pods):
     """
-    Detect and parse the format of the data (Protobuf, JSON).
-    Returns a Python dictionary or None if parsing fails.
+    Send new Pods ([(etcd_key, object)]) to the Scheduler, which binds them
+    and writes each to etcd once. Returns the result of every pod, or None if
+    the request never reached the Scheduler (or it does not offer this yet)
+    and the pods have to be stored here and scheduled afterwards.
     """
     try:
-        # Try parsing as JSON
-        return json.loads(value.decode("utf-8"))
-    except Exception:
-        pass
-    
-    try:
-        # Try parsing as Protobuf
-        return yaml.safe_load(auger_decode(value))
-    except Exception:
+        # Not retried: a pod that was created must not be reported as existing
+        response = scheduler_client.post(
+            "/schedule/create",
+            json={"pods": [{"key": etcd_key, "object": data} for etcd_key, data in pods]}
+        )
+    except Exception as e:
+        if http_client.not_sent(e):
+            return None
+        # e.g. a read timeout: the Scheduler may have created some of the pods
         traceback.print_exc()
-        pass
-
-    return None
+        return stored_results(pods, f"No answer from the Scheduler ({type(e).__name__})")
 
-def auger_decode(data: bytes) -> str:
-    try:
-        # Run the Auger subprocess, simulating the CLI behavior
-        process = subprocess.run(
-            ["./auger/build/auger", "decode"],
-            input=data,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-        return process.stdout.decode('utf-8')
-    except subprocess.CalledProcessError as e:
-        print("Auger error:", e.stderr.decode('utf-8'))
+    if response.status_code == 200:
+        for etcd_key, _ in pods:
+            object_cache.invalidate(etcd_key)
+        return response.json()["results"]
+    if response.status_code in (404, 405):
         return None
+    return stored_results(pods, f"The Scheduler returned {response.status_code}")
 
-def auger_encode(data_dict: dict) -> bytes:
+def stored_results(pods, error):
     """
-    Encode a Python dictionary to Protobuf format using Auger.
-    The dictionary is first converted to YAML, then encoded to Protobuf.
+    Results of Pods ([(etcd_key, object)]) that the Scheduler may or may not
+    have created before its call failed, read back from etcd. A pod counts
+    as ours if it carries the uid we gave it.
+    """
+    found = get_many(etcd, [etcd_key for etcd_key, _ in pods])
+    results = []
+    for etcd_key, data in pods:
+        object_cache.invalidate(etcd_key)
+        result = {"pod_key": etcd_key, "status": "failure"}
+        if etcd_key not in found:
+            result.update(reason="NotStored", error=f"{error}, the Pod was not created")
+        else:
+            value, metadata = found[etcd_key]
+            stored = parse_cached(etcd_key, value, metadata.mod_revision) or {}
+            node_name = (stored.get("spec") or {}).get("nodeName")
+            if (stored.get("metadata") or {}).get("uid") != data["metadata"]["uid"]:
+                result.update(reason="AlreadyExists", error="Pod already exists")
+            elif node_name:
+                result.update(status="success", assigned_node=node_name)
+            else:
+                result.update(reason="Unschedulable", error=f"{error}, the Pod is stored unbound")
+        results.append(result)
+    return results
+
+def trigger_controller(resource_type, resource_name):
+    """
+    Trigger the Controller Knative Service to for reconcile requests and perform actions.
     """
     try:
-        # Convert the dictionary to YAML format
-        yaml_data = yaml.dump(data_dict, default_flow_style=False).encode("utf-8")
-
-        # Use Auger to encode the YAML into Protobuf
-        process = subprocess.run(
-            ["./auger/build/auger", "encode"],
-            input=yaml_data,  # Provide YAML as input
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
+        # Reconciling is level-triggered, so it is safe to retry
+        response = controller_client.post(
+            "/reconcile",
+            json={ "resource_type": resource_type, "resource_name": resource_name },
+            idempotent=True
         )
+        if response.status_code in (200, 202):
+            return {"status": "success", "message": response.json()["message"]}
+        else:
+            return {"status": "failure", "error": "Failed to reconcile resource"}
+    except Exception as e:
+        return {"status": "failure", "error": str(e)}
+
+def notify_controller(resource_type, resource_name):
+    """
+    Trigger the Controller in the background. The Controller watches the
+    resources itself, the request only wakes it up if it was scaled to zero,
+    so the client does not have to wait for it.
+    """
+    controller_notifier.submit(tracing.bind(trigger_controller), resource_type, resource_name)
+
+# Background dispatchers drain the pending bindings to the Scheduler in batches
+pending_bindings = PendingBindings(etcd, trigger_scheduler_batch)
+
+def start():
+    """
+    Start the background work and warm up, then mark the service as serving.
+    """
+    if ASYNC_SCHEDULING:
+        # Pick up bindings left behind by replicas that went away
+        pending_bindings.start()
+
+    # The readiness probe passes once etcd is connected and the codec is running
+    startup.warm_up([
+        ("etcd connected", etcd.ping),
+        ("codec workers started", get_pool),
+    ])
+    startup.mark("serving")
 
-        # The output of the Auger process is the Protobuf encoded data
-        return process.stdout
-    except subprocess.CalledProcessError as e:
-        print("Auger encoding error:", e.stderr.decode('utf-8'))
-        return None
 
 if __name__ == '__main__':
+    start()
     app.run(host='0.0.0.0', port=8080)
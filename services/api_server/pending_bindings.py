@@ -0,0 +1,183 @@
+"""
+Durable queue of resources waiting to be scheduled.
+
+In async mode the API server stores a resource together with an entry under
+PENDING_PREFIX (in the same etcd transaction) and answers right away. Background
+dispatchers drain the queue to the Scheduler in batches and delete the entries
+once the Scheduler has handled them. Entries left behind by a replica that
+went away (e.g. scaled to zero by Knative) are picked up by the recovery loop.
+"""
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+
+from common.batch import chunked
+
+PENDING_PREFIX = "/serverless-k8s/pending-bindings"
+
+ASYNC_DISPATCHERS = int(os.environ.get("ASYNC_DISPATCHERS", "2"))
+ASYNC_BATCH_SIZE = int(os.environ.get("ASYNC_BATCH_SIZE", "100"))
+# How long a dispatcher waits for more keys before sending a batch (seconds)
+ASYNC_BATCH_LINGER = float(os.environ.get("ASYNC_BATCH_LINGER", "0.01"))
+# Entries older than this that no dispatcher owns are recovered (seconds)
+ASYNC_RECOVERY_AGE = float(os.environ.get("ASYNC_RECOVERY_AGE", "30"))
+ASYNC_RECOVERY_INTERVAL = float(os.environ.get("ASYNC_RECOVERY_INTERVAL", "15"))
+ASYNC_MAX_BACKOFF = 30.0
+
+
+def pending_key(etcd_key):
+    return f"{PENDING_PREFIX}{etcd_key}"
+
+
+def pending_entry(etcd_key):
+    """
+    Value stored in the queue for etcd_key.
+    """
+    return json.dumps({"key": etcd_key, "enqueued_at": time.time()})
+
+
+class PendingBindings:
+    """
+    Dispatches queued resource keys to the Scheduler in batches.
+
+    schedule_batch(keys) must return the Scheduler's per-key results as
+    {"status": "success", "results": [{"pod_key", "status", ...}]}.
+    """
+
+    def __init__(self, etcd, schedule_batch, dispatchers=ASYNC_DISPATCHERS, batch_size=ASYNC_BATCH_SIZE):
+        self.etcd = etcd
+        self.schedule_batch = schedule_batch
+        self.dispatchers = dispatchers
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._owned = set()  # keys queued or in flight in this process
+        self._failures = {}  # key -> consecutive failures
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        for i in range(self.dispatchers):
+            threading.Thread(target=self._dispatch_loop, name=f"pending-dispatcher-{i}", daemon=True).start()
+        threading.Thread(target=self._recovery_loop, name="pending-recovery", daemon=True).start()
+
+    def put_ops(self, etcd_key):
+        """
+        Transaction operations that enqueue etcd_key, to be written together
+        with the resource itself.
+        """
+        return [self.etcd.transactions.put(pending_key(etcd_key), pending_entry(etcd_key))]
+
+    def enqueue(self, etcd_keys):
+        """
+        Hand keys whose entries were just written to the local dispatchers.
+        """
+        self.start()
+        with self._lock:
+            for etcd_key in etcd_keys:
+                if etcd_key not in self._owned:
+                    self._owned.add(etcd_key)
+                    self._queue.put(etcd_key)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + ASYNC_BATCH_LINGER
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch_loop(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._dispatch(batch)
+            except Exception:
+                traceback.print_exc()
+                self._retry(batch)
+
+    def _dispatch(self, batch):
+        response = self.schedule_batch(batch)
+        if response.get("status") != "success":
+            print(f"Failed to dispatch {len(batch)} pending bindings: {response.get('error')}")
+            self._retry(batch)
+            return
+
+        results = {item["pod_key"]: item for item in response["results"]}
+        done = []
+        retry = []
+        for etcd_key in batch:
+            item = results.get(etcd_key)
+            # A resource that no longer exists will never be scheduled
+            if item and (item.get("status") == "success" or item.get("error") == "Pod not found"):
+                done.append(etcd_key)
+            else:
+                retry.append(etcd_key)
+
+        self._complete(done)
+        self._retry(retry)
+
+    def _complete(self, etcd_keys):
+        if not etcd_keys:
+            return
+        for chunk in chunked(etcd_keys):
+            self.etcd.transaction(
+                compare=[],
+                success=[self.etcd.transactions.delete(pending_key(etcd_key)) for etcd_key in chunk]
+            )
+        with self._lock:
+            for etcd_key in etcd_keys:
+                self._owned.discard(etcd_key)
+                self._failures.pop(etcd_key, None)
+
+    def _retry(self, etcd_keys):
+        for etcd_key in etcd_keys:
+            with self._lock:
+                failures = self._failures[etcd_key] = self._failures.get(etcd_key, 0) + 1
+            delay = min(0.1 * 2 ** failures, ASYNC_MAX_BACKOFF)
+            timer = threading.Timer(delay, self._queue.put, args=(etcd_key,))
+            timer.daemon = True
+            timer.start()
+
+    def _recovery_loop(self):
+        while True:
+            try:
+                self.recover()
+            except Exception:
+                traceback.print_exc()
+            time.sleep(ASYNC_RECOVERY_INTERVAL)
+
+    def recover(self):
+        """
+        Enqueue entries that nobody has dispatched for ASYNC_RECOVERY_AGE.
+        """
+        now = time.time()
+        recovered = []
+        for value, _ in self.etcd.get_prefix(PENDING_PREFIX + "/"):
+            try:
+                entry = json.loads(value)
+            except ValueError:
+                continue
+            if now - entry.get("enqueued_at", 0) >= ASYNC_RECOVERY_AGE:
+                recovered.append(entry["key"])
+
+        with self._lock:
+            recovered = [etcd_key for etcd_key in recovered if etcd_key not in self._owned]
+            for etcd_key in recovered:
+                self._owned.add(etcd_key)
+                self._queue.put(etcd_key)
+        if recovered:
+            print(f"Recovered {len(recovered)} pending bindings")
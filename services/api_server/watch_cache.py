@@ -0,0 +1,353 @@
+"""
+Watch streams for the API server.
+
+A WatchCache follows one resource type with a single etcd watch (through an
+Informer) and fans every change out to all HTTP watchers of that type, so N
+clients cost one watch instead of N pollers. Every watcher has a bounded
+buffer: a watcher that falls behind is ended with an ERROR event instead of
+holding memory or slowing the others down, and can resume from the last
+resourceVersion it received. Recent events are kept so that a resumed watch
+does not have to list again.
+
+The same watch keeps a SelectorIndex current, which answers label and field
+selector queries without scanning the prefix.
+
+Caches are only made for the built-in types and for types that have objects
+in etcd, and a cache nobody watched or read for WATCH_CACHE_IDLE_SECONDS is
+dropped with its etcd watch, so made-up resource names in URLs cannot add up.
+"""
+import collections
+import json
+import os
+import queue
+import threading
+import time
+
+from common.batch import get_many
+from common.cache import object_cache, parse_cached
+from common.index import SelectorIndex
+from common.informer import Informer
+from common.pagination import list_page
+from common.selector import matches, object_fields, object_labels
+
+# Events buffered per watcher before it is considered too slow
+WATCH_BUFFER_SIZE = int(os.environ.get("WATCH_BUFFER_SIZE", "1000"))
+# Events kept per resource type for watches that resume from a resourceVersion
+WATCH_HISTORY_SIZE = int(os.environ.get("WATCH_HISTORY_SIZE", "10000"))
+# A BOOKMARK event is sent when nothing happened for this long (seconds)
+WATCH_BOOKMARK_INTERVAL = float(os.environ.get("WATCH_BOOKMARK_INTERVAL", "30"))
+
+# Types that can be watched before any object of them exists
+WATCH_BUILTIN_RESOURCES = frozenset(os.environ.get("WATCH_BUILTIN_RESOURCES", "pods,replicasets,deployments").split(","))
+# Seconds a cache without watchers is kept after its last use
+WATCH_CACHE_IDLE_SECONDS = float(os.environ.get("WATCH_CACHE_IDLE_SECONDS", "300"))
+
+Event = collections.namedtuple("Event", ["revision", "key", "line"])
+
+
+class WatchExpired(Exception):
+    """The watch cannot continue from the requested or reached resourceVersion."""
+
+
+class UnknownResource(Exception):
+    """The resource type is not built in and has no objects."""
+
+
+def event_line(event_type, obj):
+    return (json.dumps({"type": event_type, "object": obj}, default=str) + "\n").encode("utf-8")
+
+
+def with_resource_version(obj, revision):
+    metadata = obj.get("metadata")
+    if not isinstance(metadata, dict):
+        metadata = obj["metadata"] = {}
+    metadata["resourceVersion"] = str(revision)
+    return obj
+
+
+def deleted_object(key, revision):
+    # etcd delete events carry no value, so identify the object by its key
+    namespace, name = key.rsplit("/", 2)[-2:]
+    return {"metadata": {"name": name, "namespace": namespace, "resourceVersion": str(revision)}}
+
+
+def status_object(code, reason, message):
+    return {"kind": "Status", "status": "Failure", "code": code, "reason": reason, "message": message}
+
+
+class Watcher:
+    """
+    One HTTP watch: the events of one namespace, buffered until the client
+    reads them.
+    """
+
+    def __init__(self, key_prefix, buffer_size):
+        self.key_prefix = key_prefix
+        self.overflowed = False
+        # Events at or before this revision are already covered by the initial list
+        self.skip_until = 0
+        self._queue = queue.Queue(maxsize=buffer_size)
+
+    def offer(self, event):
+        """
+        Buffer an event without blocking. Returns False once the watcher has
+        fallen behind and must not receive more events.
+        """
+        if not event.key.startswith(self.key_prefix):
+            return True
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.overflowed = True
+            return False
+
+    def next(self, timeout):
+        """
+        Return the next event, or None if nothing happened within timeout.
+        A watcher that fell behind first delivers what it has buffered, then
+        raises WatchExpired.
+        """
+        while True:
+            try:
+                event = self._queue.get(block=not self.overflowed, timeout=timeout)
+            except queue.Empty:
+                if self.overflowed:
+                    raise WatchExpired("Watcher fell behind, resume from the last resourceVersion received")
+                return None
+            if event.revision > self.skip_until:
+                return event
+
+
+class WatchCache:
+    """
+    Shared watch of `/registry/<resource>/`, started on first use.
+    """
+
+    def __init__(self, etcd, resource, history_size=WATCH_HISTORY_SIZE, buffer_size=WATCH_BUFFER_SIZE):
+        self.etcd = etcd
+        self.prefix = f"/registry/{resource}/"
+        self.buffer_size = buffer_size
+        self.informer = Informer(etcd, self.prefix)
+        self.informer.add_handler(self._on_put, self._on_delete)
+        self.index = SelectorIndex()
+        self.informer.add_handler(self.index.on_put, self.index.on_delete)
+        self._history = collections.deque(maxlen=history_size)
+        # The history holds every event after this revision (None until started)
+        self._complete_from = None
+        self._present = set()
+        self._watchers = set()
+        self._lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    def start(self):
+        self.informer.start()
+        with self._lock:
+            if self._complete_from is None:
+                # Events that raced with the start were not recorded but are
+                # before this revision, so no watch can resume across them
+                self._complete_from = self.informer.revision
+
+    def _on_put(self, key, obj, mod_revision):
+        with self._lock:
+            event_type = "MODIFIED" if key in self._present else "ADDED"
+            self._present.add(key)
+            if self._complete_from is not None:
+                self._publish(Event(mod_revision, key, event_line(event_type, with_resource_version(obj, mod_revision))))
+
+    def _on_delete(self, key):
+        with self._lock:
+            self._present.discard(key)
+            if self._complete_from is not None:
+                revision = self.informer.revision
+                self._publish(Event(revision, key, event_line("DELETED", deleted_object(key, revision))))
+
+    def _publish(self, event):
+        """
+        Record an event and hand it to every watcher. Called with _lock held.
+        The event is serialized once, however many watchers receive it.
+        """
+        if len(self._history) == self._history.maxlen:
+            self._complete_from = self._history[0].revision
+        self._history.append(event)
+
+        for watcher in list(self._watchers):
+            if not watcher.offer(event):
+                self._watchers.discard(watcher)
+
+    def watch(self, namespace, resource_version=0):
+        """
+        Register a watcher for one namespace and return (initial lines, watcher).
+
+        With a resource_version the watch resumes with the kept events after
+        it, or raises WatchExpired if they are no longer kept. Without one it
+        starts with an ADDED event for every object that exists now.
+        """
+        self.start()
+        key_prefix = f"{self.prefix}{namespace}/"
+        watcher = Watcher(key_prefix, self.buffer_size)
+
+        with self._lock:
+            if resource_version:
+                if resource_version < self._complete_from:
+                    raise WatchExpired(f"resourceVersion {resource_version} is too old")
+                initial = [
+                    event.line for event in self._history
+                    if event.revision > resource_version and event.key.startswith(key_prefix)
+                ]
+                self._watchers.add(watcher)
+                return initial, watcher
+            self._watchers.add(watcher)
+
+        # Listed after registering, so nothing is missed between the list and
+        # the first event; events already covered by the list are skipped
+        try:
+            response = self.etcd.get_prefix_response(key_prefix)
+        except Exception:
+            self.unwatch(watcher)
+            raise
+        watcher.skip_until = response.header.revision
+
+        initial = []
+        for kv in response.kvs:
+            key = kv.key.decode()
+            obj = parse_cached(key, kv.value, kv.mod_revision)
+            if obj is not None:
+                initial.append(event_line("ADDED", with_resource_version(obj, kv.mod_revision)))
+        return initial, watcher
+
+    def select_keys(self, namespace, label_requirements, field_requirements):
+        """
+        Return (revision, {key: mod_revision}) of the keys in namespace that
+        match the selectors, as of revision.
+        """
+        self.start()
+        revision = self.informer.revision
+        return revision, self.index.select(namespace, label_requirements, field_requirements)
+
+    def select(self, namespace, label_requirements, field_requirements):
+        """
+        Return (objects, revision): the decoded objects in namespace that match
+        the selectors, sorted by key, and the revision they are current to.
+        Objects come from the object cache; only misses are read from etcd.
+        """
+        revision, selected = self.select_keys(namespace, label_requirements, field_requirements)
+
+        objects = {}
+        missing = []
+        for key, mod_revision in selected.items():
+            obj = object_cache.get(key, mod_revision)
+            if obj is None:
+                missing.append(key)
+            else:
+                objects[key] = with_resource_version(obj, mod_revision)
+
+        for key, (value, metadata) in get_many(self.etcd, missing).items():
+            obj = parse_cached(key, value, metadata.mod_revision)
+            # The object changed after it was indexed, keep it only if it still matches
+            if obj is not None and matches(label_requirements, field_requirements, object_labels(obj), object_fields(key, obj)):
+                objects[key] = with_resource_version(obj, metadata.mod_revision)
+                revision = max(revision, metadata.mod_revision)
+
+        return [objects[key] for key in sorted(objects)], revision
+
+    def unwatch(self, watcher):
+        with self._lock:
+            self._watchers.discard(watcher)
+            self.last_used = time.monotonic()
+
+    def idle(self, now, idle_seconds):
+        with self._lock:
+            return not self._watchers and now - self.last_used >= idle_seconds
+
+    def stop(self):
+        self.informer.stop()
+
+    def stream(self, initial, watcher, timeout_seconds=None):
+        """
+        Yield the watch as newline-delimited JSON. Ends after timeout_seconds,
+        when the watcher falls behind or when the client goes away.
+        """
+        deadline = time.monotonic() + timeout_seconds if timeout_seconds else None
+        try:
+            yield from initial
+            while True:
+                timeout = WATCH_BOOKMARK_INTERVAL
+                if deadline is not None:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        return
+                    timeout = min(timeout, WATCH_BOOKMARK_INTERVAL)
+
+                try:
+                    event = watcher.next(timeout)
+                except WatchExpired as e:
+                    yield event_line("ERROR", status_object(410, "Expired", str(e)))
+                    return
+
+                if event is not None:
+                    yield event.line
+                elif deadline is None or time.monotonic() < deadline:
+                    # Tells the client how far it is up to date and detects
+                    # clients that went away
+                    yield event_line("BOOKMARK", {"metadata": {"resourceVersion": str(self.informer.revision)}})
+        finally:
+            self.unwatch(watcher)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "watchers": len(self._watchers),
+                "history": len(self._history),
+                "revision": self.informer.revision,
+            }
+
+
+class WatchHub:
+    """
+    One WatchCache per resource type.
+    """
+
+    def __init__(self, etcd, builtin_resources=WATCH_BUILTIN_RESOURCES, idle_seconds=WATCH_CACHE_IDLE_SECONDS):
+        self.etcd = etcd
+        self.builtin_resources = builtin_resources
+        self.idle_seconds = idle_seconds
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def get(self, resource):
+        """
+        The cache of a resource type. Raises UnknownResource for a type that
+        is not built in and has no objects.
+        """
+        self.evict_idle()
+        with self._lock:
+            cache = self._caches.get(resource)
+        if cache is None and resource not in self.builtin_resources and not self._exists(resource):
+            raise UnknownResource(f"The server could not find the requested resource '{resource}'")
+
+        with self._lock:
+            cache = self._caches.get(resource)
+            if cache is None:
+                cache = self._caches[resource] = WatchCache(self.etcd, resource)
+            cache.last_used = time.monotonic()
+        return cache
+
+    def evict_idle(self):
+        """
+        Drop the caches nobody watched or read for idle_seconds, with their etcd watches.
+        """
+        now = time.monotonic()
+        with self._lock:
+            idle = [resource for resource, cache in self._caches.items() if cache.idle(now, self.idle_seconds)]
+            evicted = [self._caches.pop(resource) for resource in idle]
+        for cache in evicted:
+            cache.stop()
+
+    def _exists(self, resource):
+        return bool(list_page(self.etcd, f"/registry/{resource}/", 1, keys_only=True).kvs)
+
+    def stats(self):
+        with self._lock:
+            caches = dict(self._caches)
+        return {resource: cache.stats() for resource, cache in caches.items()}
@@ -1,19 +1,37 @@
 import os
 import json
-import requests
-import etcd3
 from flask import Flask, jsonify, request
 import traceback
+import threading
 from datetime import datetime
-import subprocess
-import yaml
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from common import http_client, metrics, tracing
+from common.batch import chunked
+from common.cache import object_cache, parse_cached
+from common.cas import conflict_stats, update_object
+from common.codec import get_pool
+from common.etcd_client import LazyClient
+from common.index import LabelIndex
+from common.informer import Informer
+from common.startup import StartupTimeline
+from expectations import CreationExpectations
+from workqueue import WorkQueue
 
 # Initialize Flask App
 app = Flask(__name__)
-
-# etcd Configuration
-ETCD_HOST = "172.18.0.2"
-ETCD_PORT = 2379
+startup = StartupTimeline("controller")
+startup.install(app)
+metrics.install(app)
+tracing.install(app, "controller")
+startup.mark("imported")
+
+# etcd Configuration, STORAGE_BACKEND=memory keeps the data in this process
+# instead (see common.memory_etcd) and ETCD_TLS=false connects without certificates
+ETCD_HOST = os.environ.get("ETCD_HOST", "172.18.0.2")
+ETCD_PORT = int(os.environ.get("ETCD_PORT", "2379"))
+ETCD_TLS = os.environ.get("ETCD_TLS", "true").lower() == "true"
 
 # Path to certificates (assumes they're present in 'certs' directory)
 dirname = os.path.dirname(__file__)
@@ -21,18 +39,52 @@ ca_cert = os.path.join(dirname, 'certs/ca.crt')
 cert_cert = os.path.join(dirname, 'certs/client.crt')
 cert_key = os.path.join(dirname, 'certs/client.key')
 
-# Initialize etcd3 Client
-etcd = etcd3.client(
+# etcd3 Client, connected on first use (see common.etcd_client)
+etcd = LazyClient(
     host=ETCD_HOST,
     port=ETCD_PORT,
-    ca_cert=ca_cert,
-    cert_cert=cert_cert,
-    cert_key=cert_key
+    ca_cert=ca_cert if ETCD_TLS else None,
+    cert_cert=cert_cert if ETCD_TLS else None,
+    cert_key=cert_key if ETCD_TLS else None
+)
+
+# Pods by their `replicaset` label, kept current by an etcd watch
+pod_label_index = LabelIndex("replicaset")
+pod_informer = Informer(etcd, "/registry/pods/")
+pod_informer.add_handler(pod_label_index.on_put, pod_label_index.on_delete)
+
+# Reconcile loop: watches on the managed resources feed a deduplicating work
+# queue of `<resource_type>/<namespace>/<name>` keys drained by the workers
+RECONCILE_WORKERS = int(os.environ.get("RECONCILE_WORKERS", "4"))
+RECONCILED_TYPES = ("deployments", "replicasets", "pods")
+reconcile_queue = WorkQueue()
+metrics.callback_gauge(
+    "reconcile_queue_depth", "Keys waiting in the reconcile queue, by state.",
+    lambda: {(state,): reconcile_queue.stats()[state] for state in ("queued", "processing", "waiting")},
+    ["state"],
 )
+deployment_informer = Informer(etcd, "/registry/deployments/")
+replicaset_informer = Informer(etcd, "/registry/replicasets/")
 
 # Constant
-API_SERVER_URL = "http://api-server.default.svc.cluster.local"
-SCHEDULER_URL = "http://knative-scheduler.default.svc.cluster.local"
+API_SERVER_URL = os.environ.get("API_SERVER_URL", "http://api-server.default.svc.cluster.local")
+SCHEDULER_URL = os.environ.get("SCHEDULER_URL", "http://knative-scheduler.default.svc.cluster.local")
+
+# Pooled keep-alive clients for the other services
+api_server_client = http_client.get_client(API_SERVER_URL)
+scheduler_client = http_client.get_client(SCHEDULER_URL)
+
+# Scale-up sends the new pods to the API server in batches of this size,
+# with at most SCALE_CONCURRENCY batches in flight
+SCALE_BATCH_SIZE = int(os.environ.get("SCALE_BATCH_SIZE", "50"))
+SCALE_CONCURRENCY = int(os.environ.get("SCALE_CONCURRENCY", "4"))
+
+# Same alphabet as Kubernetes generateName: no vowels, no confusable characters
+NAME_SUFFIX_ALPHABET = "bcdfghjklmnpqrstvwxz2456789"
+NAME_SUFFIX_LENGTH = 5
+
+# Pods created by this instance that the pod watch has not delivered yet
+replica_expectations = CreationExpectations()
 
 @app.route('/')
 def health_check():
@@ -41,59 +93,191 @@ def health_check():
     """
     return jsonify({"status": "Controller service is running"}), 200
 
+@app.route('/debug/stats', methods=['GET'])
+def debug_stats():
+    """Connection pool, cache, write conflict and startup statistics of this instance."""
+    return jsonify({
+        "http_clients": http_client.stats(),
+        "object_cache": object_cache.stats(),
+        "reconcile_queue": reconcile_queue.stats(),
+        "conflicts": conflict_stats.stats(),
+        "startup": startup.stats(),
+        "tracing": tracing.exporter.stats(),
+    }), 200
+
 @app.route('/reconcile', methods=['POST'])
 def reconcile():
     """
-    The controller listens for reconciliation requests and performs actions
-    like scaling, pod scheduling, or resource management.
+    The controller listens for reconciliation requests and queues them for
+    the reconcile loop, which performs actions like scaling, pod scheduling,
+    or resource management. Requests for a resource that is already queued
+    are merged.
     """
     try:
         resource_type = request.json.get("resource_type")
         resource_name = request.json.get("resource_name")
         namespace = request.json.get("namespace", "default")
 
-        # Fetch resource details dynamically from etcd based on type
-        resource_key = f"/registry/{resource_type}/{namespace}/{resource_name}"
-        value, _ = etcd.get(resource_key)
-        
-        if not value:
-            return jsonify({"error": f"{resource_type.capitalize()} '{resource_name}' not found in etcd"}), 404
-
-        resource_data = detect_and_parse(value)
-
-        # Perform reconciliation (scale, create, or update resources)
-        if resource_type == "replicasets":
-            scale_replicaset(resource_data, namespace)
-        elif resource_type == "deployments":
-            handle_deployment(resource_data, namespace)
-        elif resource_type == "pods":
-            handle_pod(resource_data, namespace)
-        else:
+        if resource_type not in RECONCILED_TYPES:
             return jsonify({"error": f"Unsupported resource type '{resource_type}'"}), 400
+        if not resource_name:
+            return jsonify({"error": "Resource name is required"}), 400
+
+        start_reconcile_loop()
+        key = f"{resource_type}/{namespace}/{resource_name}"
+        # The reconcile continues the trace of the request that queued it
+        reconcile_origins[key] = tracing.current_traceparent()
+        reconcile_queue.add(key)
 
-        return jsonify({"message": f"Resource {resource_name} reconciled successfully"}), 200
+        return jsonify({"message": f"Resource {resource_name} queued for reconciliation"}), 202
 
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+_reconcile_loop_lock = threading.Lock()
+_reconcile_loop_started = False
+
+def start_reconcile_loop():
+    """
+    Start the watches and the workers. Safe to call more than once.
+    Existing deployments and replicasets are all reconciled once on start.
+    """
+    global _reconcile_loop_started
+    with _reconcile_loop_lock:
+        if _reconcile_loop_started:
+            return
+        _reconcile_loop_started = True
+
+        # Pods first, so that replicas are counted correctly from the start
+        pod_informer.add_handler(on_pod_put, on_pod_delete)
+        pod_informer.start()
+        for resource_type, informer in (("deployments", deployment_informer), ("replicasets", replicaset_informer)):
+            informer.add_handler(
+                lambda key, obj, mod_revision, resource_type=resource_type: enqueue_key(resource_type, key),
+                lambda key, resource_type=resource_type: enqueue_key(resource_type, key)
+            )
+            informer.start()
+
+        for i in range(RECONCILE_WORKERS):
+            threading.Thread(target=reconcile_worker, name=f"reconcile-worker-{i}", daemon=True).start()
+
+def enqueue_key(resource_type, etcd_key):
+    namespace, name = etcd_key.rsplit("/", 2)[-2:]
+    reconcile_queue.add(f"{resource_type}/{namespace}/{name}")
+
+# Owner name by pod key, so that deleted pods (whose value is gone) can be
+# traced back to their owner
+pod_owners = {}
+
+def on_pod_put(pod_key, pod, mod_revision):
+    owner = ((pod.get("metadata") or {}).get("labels") or {}).get("replicaset")
+    if owner:
+        pod_owners[pod_key] = owner
+        enqueue_owner(pod_key, owner)
+    else:
+        pod_owners.pop(pod_key, None)
+
+def on_pod_delete(pod_key):
+    owner = pod_owners.pop(pod_key, None)
+    if owner:
+        enqueue_owner(pod_key, owner)
+
+def enqueue_owner(pod_key, owner):
+    """
+    Queue the ReplicaSet or Deployment named by a pod's `replicaset` label.
+    """
+    namespace, _ = pod_key.rsplit("/", 2)[-2:]
+    # Pods of a Deployment carry the Deployment's name
+    for resource_type, informer in (("replicasets", replicaset_informer), ("deployments", deployment_informer)):
+        if informer.has(f"/registry/{resource_type}/{namespace}/{owner}"):
+            reconcile_queue.add(f"{resource_type}/{namespace}/{owner}")
+
+# traceparent of the last /reconcile request for a key, by key
+reconcile_origins = {}
+
+def reconcile_worker():
+    while True:
+        key = reconcile_queue.get()
+        if key is None:
+            return
+        try:
+            with tracing.start_trace("reconcile", reconcile_origins.pop(key, None), key=key):
+                reconcile_key(key)
+            reconcile_queue.forget(key)
+        except Exception:
+            traceback.print_exc()
+            reconcile_queue.add_rate_limited(key)
+        finally:
+            reconcile_queue.done(key)
+
+def reconcile_key(key):
+    """
+    Reconcile one `<resource_type>/<namespace>/<name>` key. A resource that
+    no longer exists needs nothing.
+    """
+    resource_type, namespace, resource_name = key.split("/", 2)
+
+    # Fetch resource details dynamically from etcd based on type
+    resource_key = f"/registry/{resource_type}/{namespace}/{resource_name}"
+    value, metadata = etcd.get(resource_key)
+    if not value:
+        return
+
+    resource_data = parse_cached(resource_key, value, metadata.mod_revision)
+
+    # Perform reconciliation (scale, create, or update resources)
+    if resource_type == "replicasets":
+        scale_replicaset(resource_data, namespace)
+    elif resource_type == "deployments":
+        handle_deployment(resource_data, namespace)
+    elif resource_type == "pods":
+        handle_pod(resource_data, namespace, metadata.mod_revision)
+
 def scale_replicaset(replicaset, namespace):
     """
-    Scale the ReplicaSet to the desired number of replicas.
+    Scale the ReplicaSet to the desired number of replicas. Missing pods are
+    created in parallel batches, excess pods are deleted in one call.
     """
+    replicaset_name = replicaset["metadata"]["name"]
+    owner = f"{namespace}/{replicaset_name}"
     desired_replicas = replicaset["spec"]["replicas"]
-    current_pods = fetch_current_pods(namespace, replicaset["metadata"]["name"])
-
-    current_replicas = len(current_pods)
+    pods = fetch_current_pods(namespace, replicaset_name)
+    current_pods = [pod for pod in pods if is_active(pod)]
+
+    # Pods created recently that the watch has not delivered yet count as well,
+    # so that reconciling twice does not create them twice
+    observed = {pod["metadata"]["name"] for pod in pods}
+    expected = replica_expectations.pending(owner, observed)
+    current_replicas = len(current_pods) + len(expected)
     
     # Scale up if needed
     if current_replicas < desired_replicas:
-        for _ in range(desired_replicas - current_replicas):
-            create_and_schedule_pod(namespace, replicaset)
-    # Optionally, scale down if needed (not implemented here)
+        create_pods(namespace, replicaset, desired_replicas - current_replicas, observed | expected)
+    # Scale down if needed
     elif current_replicas > desired_replicas:
-        for excess_pod in current_pods[:current_replicas - desired_replicas]:
-            delete_pod(excess_pod)
+        excess_pods = rank_for_deletion(current_pods)[:current_replicas - desired_replicas]
+        delete_pods(namespace, excess_pods)
+
+def is_active(pod):
+    """
+    Whether a pod counts as a replica: not terminating and not finished.
+    """
+    if (pod.get("metadata") or {}).get("deletionTimestamp"):
+        return False
+    return (pod.get("status") or {}).get("phase") not in ("Succeeded", "Failed")
+
+def rank_for_deletion(pods):
+    """
+    Order pods for scale-down like Kubernetes: unscheduled pods before
+    scheduled ones, pods that are not running before running ones, and the
+    newest first.
+    """
+    pods = sorted(pods, key=lambda pod: (pod.get("metadata") or {}).get("creationTimestamp") or "", reverse=True)
+    return sorted(pods, key=lambda pod: (
+        bool((pod.get("spec") or {}).get("nodeName")),
+        (pod.get("status") or {}).get("phase") == "Running",
+    ))
 
 def handle_deployment(deployment, namespace):
     """
@@ -102,55 +286,108 @@ def handle_deployment(deployment, namespace):
     # Assume scaling logic or rollout logic for Deployments
     scale_replicaset(deployment, namespace)  # Simplifying for this example
 
-def handle_pod(pod, namespace):
+def handle_pod(pod, namespace, mod_revision):
     """
     Handle Pod operations such as scheduling a pod if it's not scheduled yet.
     """
     if "nodeName" not in pod["spec"]:  # Check if pod is unscheduled
-        schedule_pod_on_node(pod, namespace)
+        schedule_pod_on_node(pod, namespace, mod_revision)
 
 def fetch_current_pods(namespace, replicaset_name):
     """
     Fetch the current Pods managed by the ReplicaSet from etcd.
     """
-    prefix = f"/registry/pods/{namespace}/"
+    # The index is seeded on first use and then kept current by the watch
+    pod_informer.start()
     pods = []
 
-    for value, metadata in etcd.get_prefix(prefix):
-        pod_key = metadata.key.decode()
-        pod_data = detect_and_parse(value)
-        if pod_data.get("metadata", {}).get("labels", {}).get("replicaset", "") == replicaset_name:
+    for pod_key, mod_revision in pod_label_index.lookup(namespace, replicaset_name).items():
+        pod_data = object_cache.get(pod_key, mod_revision)
+        if pod_data is None:
+            pod_data = fetch_pod(pod_key)
+        if pod_data:
             pods.append(pod_data)
     
     return pods
 
-def create_and_schedule_pod(namespace, replicaset):
+def generate_pod_name(replicaset_name, taken_names):
     """
-    Dynamically create a Pod based on the ReplicaSet's spec and assign a node.
+    `<replicaset>-<random suffix>`, like Kubernetes generateName, avoiding
+    the names already in use.
     """
-    pod_name = f"{replicaset['metadata']['name']}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    
-    pod_data = {
+    while True:
+        suffix = "".join(random.choice(NAME_SUFFIX_ALPHABET) for _ in range(NAME_SUFFIX_LENGTH))
+        pod_name = f"{replicaset_name}-{suffix}"
+        if pod_name not in taken_names:
+            taken_names.add(pod_name)
+            return pod_name
+
+def new_pod(namespace, replicaset, pod_name):
+    """
+    Build a Pod from the ReplicaSet's template, labelled with the ReplicaSet.
+    """
+    template = replicaset['spec']['template']
+    labels = dict((template.get('metadata') or {}).get('labels') or {})
+    labels["replicaset"] = replicaset['metadata']['name']
+
+    return {
         "apiVersion": "v1",
         "kind": "Pod",
-        "metadata": {"name": pod_name, "namespace": namespace},
+        "metadata": {"name": pod_name, "namespace": namespace, "labels": labels},
         "spec": {
-            "containers": replicaset['spec']['template']['spec']['containers'],  # Using ReplicaSet's container spec
-            # "nodeName": assign_node_to_pod()  # Assign the Pod to a node
+            "containers": template['spec']['containers'],  # Using ReplicaSet's container spec
         }
     }
 
-    # Create the Pod using API Server
-    response = requests.post(f"{API_SERVER_URL}/api/v1/pods", json=pod_data)
-    if response.status_code == 201:
-        return jsonify({
-            "message": f"Pod {pod_name} created and scheduled successfully",
-            "assigned_node": response["assigned_node"]
-        })
-    else:
-        return jsonify({"error": "Failed to create and schedule pod"}), 500
+def create_pods(namespace, replicaset, count, taken_names):
+    """
+    Create `count` Pods for the ReplicaSet through the API Server, which
+    stores and schedules each batch in bulk. Batches are sent concurrently.
+    """
+    replicaset_name = replicaset['metadata']['name']
+    owner = f"{namespace}/{replicaset_name}"
+    taken_names = set(taken_names)
+    pods = [new_pod(namespace, replicaset, generate_pod_name(replicaset_name, taken_names)) for _ in range(count)]
+    replica_expectations.expect(owner, [pod["metadata"]["name"] for pod in pods])
+
+    batches = list(chunked(pods, SCALE_BATCH_SIZE))
+    with ThreadPoolExecutor(max_workers=min(SCALE_CONCURRENCY, len(batches))) as executor:
+        failed = [pod_name for names in executor.map(tracing.bind(create_pod_batch), batches) for pod_name in names]
 
-def schedule_pod_on_node(pod, namespace):
+    replica_expectations.forget(owner, failed)
+    if failed:
+        print(f"Failed to create {len(failed)} of {count} pods for ReplicaSet {owner}")
+
+def create_pod_batch(pods):
+    """
+    Create a batch of Pods with one API Server call. Returns the names of
+    the pods that were certainly not created.
+    """
+    try:
+        response = api_server_client.post("/api/v1/pods", json=pods)
+    except Exception:
+        traceback.print_exc()
+        # The pods may or may not exist, their expectations expire if not
+        return []
+
+    if len(pods) == 1:
+        # The API Server creates a single pod on its single-object path,
+        # where only 201 and 202 (stored, scheduling pending) mean it was stored
+        if response.status_code in (201, 202):
+            return []
+        return [pods[0]["metadata"]["name"]]
+    if 400 <= response.status_code < 500:
+        return [pod["metadata"]["name"] for pod in pods]
+    if response.status_code == 207:
+        # Every result says whether its pod was stored, bound or not
+        return [
+            result["name"] for result in response.json().get("results", [])
+            if result.get("stored") is False
+        ]
+    # Created, or stored but not scheduled yet
+    return []
+
+def schedule_pod_on_node(pod, namespace, mod_revision):
     """
     Schedule the Pod on a node if it is not already scheduled.
     This will trigger the Scheduler Knative Service to assign the Pod to a node.
@@ -158,73 +395,42 @@ def schedule_pod_on_node(pod, namespace):
     # Check if the Pod already has a node assigned
     if "nodeName" not in pod["spec"]:
         # Call the Scheduler Service to assign a node
-        pod_key = pod["metadata"]["name"]
+        pod_key = f"/registry/pods/{namespace}/{pod['metadata']['name']}"
         schedule_response = trigger_scheduler(pod_key)
 
         if schedule_response.get("status") == "success":
-            # Update the Pod with the assigned node
-            pod["spec"]["nodeName"] = schedule_response["assigned_node"]
-            # Update the Pod in etcd
-            update_pod(pod_key, pod)
-
-def assign_node_to_pod(pod_key, pod):
-    """
-    Assign a node to a specific Pod (by pod_key) and update it in etcd.
-    """
-    # Fetch real available nodes from etcd dynamically
-    available_nodes = fetch_available_nodes_from_etcd()
-
-    if not available_nodes:
-        raise Exception("No available nodes found for scheduling.")
-
-    # Round-robin scheduling (simple, could be expanded based on actual resource availability)
-    node_name = available_nodes[0]  # Just assign the first node for simplicity
+            # The scheduler normally stored the binding already, this only
+            # writes if the Pod is still unbound
+            update_pod(pod_key, pod, mod_revision, schedule_response["assigned_node"])
 
-    # Update the Pod's nodeName field
-    pod["spec"]["nodeName"] = node_name
-    # Add creationTimestamp to the metadata of the resource
-    pod["metadata"]["creationTimestamp"] = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
-    update_pod(pod_key, pod)
-
-    return node_name
-
-def fetch_available_nodes_from_etcd():
+def update_pod(key, pod, mod_revision, node_name):
     """
-    Fetch the list of available nodes from etcd.
-    Assuming the nodes are stored in '/registry/nodes' in etcd.
+    Bind a Pod read at mod_revision to node_name in etcd, unless it is bound
+    by then. Retries on conflicting writes (see common.cas.update_object).
     """
-    available_nodes = []
-    for nodes_prefix in ['/registry/nodes/', '/registry/csinodes/', '/registry/minions/']:
-        try:
-            # Query etcd for available node names
-            for value, metadata in etcd.get_prefix(nodes_prefix):
-                node_name = metadata.key.decode().split('/')[-1]  # Extract node name from the key
-                available_nodes.append(node_name)
-            if available_nodes:
-                break
-        except Exception as e:
-            print(f"Error fetching nodes from etcd: {e}")
-    
-    return available_nodes
+    def apply(latest):
+        if latest["spec"].get("nodeName"):
+            return False
+        latest["spec"]["nodeName"] = node_name
+        return True
 
-def update_pod(key, pod):
-    """
-    Update a Pod in etcd as Protobuf encoded yaml.
-    """
-    etcd.put(key, auger_encode(pod))
+    return update_object(etcd, key, pod, mod_revision, apply)
 
-def delete_pod(pod_data):
+def delete_pods(namespace, pods):
     """
-    Delete a Pod from etcd by calling the API Server's DELETE API.
+    Delete Pods from etcd with one call to the API Server's bulk DELETE API.
     """
-    pod_key = pod_data["metadata"]["name"]
+    pod_names = [pod["metadata"]["name"] for pod in pods]
     
-    # Call the API Server's DELETE API to delete the Pod
-    response = requests.delete(f"{API_SERVER_URL}/api/v1/pods/{pod_key}")
+    response = api_server_client.delete(
+        "/api/v1/pods",
+        params={"namespace": namespace},
+        json={"names": pod_names}
+    )
     if response.status_code == 200:
-        return jsonify({"message": f"Pod {pod_key} deleted successfully"}), 200
+        return response.json()
     else:
-        return jsonify({"error": f"Failed to delete Pod {pod_key}"}), 500
+        raise Exception(f"Failed to delete {len(pod_names)} Pods")
 
 def fetch_pod(key):
     """
@@ -233,79 +439,19 @@ def fetch_pod(key):
     """
     value, metadata = etcd.get(key)
     if value:
-        pod_dict = detect_and_parse(value)
-        print(pod_dict)
+        pod_dict = parse_cached(key, value, metadata.mod_revision)
         if pod_dict:
             return pod_dict
         else:
             print(f"Error: Unable to parse Pod at key {key}")
     return None
 
-def detect_and_parse(value):
-    """
-    Detect and parse the format of the data (Protobuf, JSON).
-    Returns a Python dictionary or None if parsing fails.
-    """
-    try:
-        # Try parsing as JSON
-        return json.loads(value.decode("utf-8"))
-    except Exception:
-        pass
-    
-    try:
-        # Try parsing as Protobuf
-        return yaml.safe_load(auger_decode(value))
-    except Exception:
-        traceback.print_exc()
-        pass
-
-    return None
-
-def auger_decode(data):
-    """Simulates decoding Protobuf using Auger."""
-    try:
-        process = subprocess.run(
-            ["./auger/build/auger", "decode"],
-            input=data,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-        return process.stdout.decode('utf-8')
-    except subprocess.CalledProcessError as e:
-        print("Auger error:", e.stderr.decode('utf-8'))
-        return None
-    
-def auger_encode(data_dict):
-    """
-    Encode a Python dictionary to Protobuf format using Auger.
-    The dictionary is first converted to YAML, then encoded to Protobuf.
-    """
-    try:
-        # Convert the dictionary to YAML format
-        yaml_data = yaml.dump(data_dict, default_flow_style=False)
-
-        # Use Auger to encode the YAML into Protobuf
-        process = subprocess.run(
-            ["./auger/build/auger", "encode"],
-            input=yaml_data.encode("utf-8"),  # Provide YAML as input
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-
-        # The output of the Auger process is the Protobuf encoded data
-        return process.stdout
-    except subprocess.CalledProcessError as e:
-        print("Auger encoding error:", e.stderr.decode('utf-8'))
-        return None
-    
 def trigger_scheduler(pod_key):
     """
     Trigger the Scheduler Knative Service to assign a node to the Pod.
     """
     try:
-        response = requests.post(f"{SCHEDULER_URL}/schedule", json={ "pod_key": pod_key })
+        response = scheduler_client.post("/schedule", json={ "pod_key": pod_key })
         if response.status_code == 200:
             return {"status": "success", "assigned_node": response.json()["assigned_node"]}
         else:
@@ -313,5 +459,19 @@ def trigger_scheduler(pod_key):
     except Exception as e:
         return {"status": "failure", "error": str(e)}
 
+def start():
+    """
+    Warm up and start the reconcile loop, then mark the service as serving.
+    """
+    # The readiness probe passes once the reconcile loop follows its watches
+    startup.warm_up([
+        ("etcd connected", etcd.ping),
+        ("codec workers started", get_pool),
+        ("reconcile loop started", start_reconcile_loop),
+    ])
+    startup.mark("serving")
+
+
 if __name__ == "__main__":
+    start()
     app.run(host="0.0.0.0", port=8082)
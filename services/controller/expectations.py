@@ -0,0 +1,58 @@
+"""
+Pods a controller has created but not seen yet.
+
+The controller counts the pods of a ReplicaSet from its watch-fed index,
+which lags a little behind the API server. Without remembering the pods it
+just created, a reconcile right after a scale-up would find them missing
+and create them again. Expected pods count as existing until the watch
+delivers them or SCALE_EXPECTATION_TIMEOUT passes (e.g. when a create
+failed in a way we could not tell).
+"""
+import os
+import threading
+import time
+
+SCALE_EXPECTATION_TIMEOUT = float(os.environ.get("SCALE_EXPECTATION_TIMEOUT", "60"))
+
+
+class CreationExpectations:
+    """
+    Names of expected pods, by owner (e.g. `default/web`).
+    """
+
+    def __init__(self, timeout=SCALE_EXPECTATION_TIMEOUT):
+        self.timeout = timeout
+        self._expected = {}  # owner -> {name: deadline}
+        self._lock = threading.Lock()
+
+    def expect(self, owner, names):
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            expected = self._expected.setdefault(owner, {})
+            for name in names:
+                expected[name] = deadline
+
+    def forget(self, owner, names):
+        """
+        Stop expecting pods that are known not to have been created.
+        """
+        with self._lock:
+            expected = self._expected.get(owner, {})
+            for name in names:
+                expected.pop(name, None)
+            if not expected:
+                self._expected.pop(owner, None)
+
+    def pending(self, owner, observed):
+        """
+        Return the expected names that are not in observed yet. Observed and
+        expired names are no longer expected.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expected = self._expected.get(owner, {})
+            for name in [name for name, deadline in expected.items() if name in observed or deadline <= now]:
+                del expected[name]
+            if not expected:
+                self._expected.pop(owner, None)
+            return set(expected)
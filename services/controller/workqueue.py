@@ -0,0 +1,193 @@
+"""
+Keyed work queue for the reconcile loop, modelled on client-go's workqueue.
+
+A key is queued at most once, however often it is added, and a key added
+while a worker processes it is queued again only when that worker is done.
+A burst of changes to one resource therefore collapses into one reconcile,
+and no resource is reconciled by two workers at the same time. Failed keys
+are retried with per-key exponential backoff. A global token bucket limits
+the overall retry rate, so a storm of failures cannot become a storm of
+retries.
+"""
+import collections
+import heapq
+import os
+import threading
+import time
+
+WORKQUEUE_BASE_DELAY = float(os.environ.get("WORKQUEUE_BASE_DELAY", "0.005"))
+WORKQUEUE_MAX_DELAY = float(os.environ.get("WORKQUEUE_MAX_DELAY", "300"))
+# Global limit on retries (per second) and the burst allowed above it
+WORKQUEUE_QPS = float(os.environ.get("WORKQUEUE_QPS", "10"))
+WORKQUEUE_BURST = int(os.environ.get("WORKQUEUE_BURST", "100"))
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations instead of blocking.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token and return how long to wait (seconds) before using it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class RateLimiter:
+    """
+    Per-key exponential backoff combined with a global token bucket: a retry
+    waits for whichever of the two is longer.
+    """
+
+    def __init__(self, base_delay=WORKQUEUE_BASE_DELAY, max_delay=WORKQUEUE_MAX_DELAY,
+                 qps=WORKQUEUE_QPS, burst=WORKQUEUE_BURST):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = TokenBucket(qps, burst)
+        self._failures = {}  # key -> consecutive failures
+        self._lock = threading.Lock()
+
+    def when(self, key):
+        with self._lock:
+            failures = self._failures.get(key, 0)
+            self._failures[key] = failures + 1
+        backoff = min(self.base_delay * 2 ** failures, self.max_delay)
+        return max(backoff, self.bucket.reserve())
+
+    def forget(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+    def retries(self, key):
+        with self._lock:
+            return self._failures.get(key, 0)
+
+
+class WorkQueue:
+    """
+    Deduplicating queue of keys with delayed and rate limited adds.
+
+    Workers call get() to take a key and must call done(key) when they are
+    finished with it.
+    """
+
+    def __init__(self, rate_limiter=None):
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self._queue = collections.deque()  # keys in FIFO order
+        self._dirty = set()  # keys that need processing
+        self._processing = set()  # keys held by a worker
+        self._waiting = []  # heap of (ready_at, sequence, key)
+        self._sequence = 0
+        self._shutting_down = False
+        # Reentrant, so that the delay thread can add() while holding it
+        self._cond = threading.Condition(threading.RLock())
+        self.adds = 0
+        self.deduplicated = 0
+        self.retries = 0
+        threading.Thread(target=self._wait_loop, name="workqueue-delay", daemon=True).start()
+
+    def add(self, key):
+        with self._cond:
+            if self._shutting_down:
+                return
+            self.adds += 1
+            if key in self._dirty:
+                self.deduplicated += 1
+                return
+            self._dirty.add(key)
+            # A key being processed is queued again by done()
+            if key not in self._processing:
+                self._queue.append(key)
+                self._cond.notify_all()
+
+    def add_after(self, key, delay):
+        if delay <= 0:
+            self.add(key)
+            return
+        with self._cond:
+            if self._shutting_down:
+                return
+            self._sequence += 1
+            heapq.heappush(self._waiting, (time.monotonic() + delay, self._sequence, key))
+            self._cond.notify_all()
+
+    def add_rate_limited(self, key):
+        with self._cond:
+            self.retries += 1
+        self.add_after(key, self.rate_limiter.when(key))
+
+    def forget(self, key):
+        """
+        Reset the backoff of a key, e.g. after it was processed successfully.
+        """
+        self.rate_limiter.forget(key)
+
+    def get(self):
+        """
+        Block until a key is available and return it, or None on shutdown.
+        """
+        with self._cond:
+            while not self._queue and not self._shutting_down:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            key = self._queue.popleft()
+            self._processing.add(key)
+            self._dirty.discard(key)
+            return key
+
+    def done(self, key):
+        with self._cond:
+            self._processing.discard(key)
+            if key in self._dirty:
+                self._queue.append(key)
+                self._cond.notify_all()
+
+    def shutdown(self):
+        with self._cond:
+            self._shutting_down = True
+            self._cond.notify_all()
+
+    def _wait_loop(self):
+        # Moves delayed keys into the queue when they are due
+        with self._cond:
+            while not self._shutting_down:
+                if not self._waiting:
+                    self._cond.wait()
+                    continue
+                timeout = self._waiting[0][0] - time.monotonic()
+                if timeout > 0:
+                    self._cond.wait(timeout)
+                    continue
+                _, _, key = heapq.heappop(self._waiting)
+                self.add(key)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._queue)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "processing": len(self._processing),
+                "waiting": len(self._waiting),
+                "adds": self.adds,
+                "deduplicated": self.deduplicated,
+                "retries": self.retries,
+            }
@@ -0,0 +1,115 @@
+"""
+Watch-backed inventory of the cluster's nodes.
+
+The inventory lists the node prefixes once and then follows them with etcd
+watches, so scheduling never has to range over etcd. Readers get an immutable
+snapshot that is swapped atomically whenever a node changes.
+"""
+import threading
+from collections import namedtuple
+
+from common.informer import Informer
+from quantity import parse_cpu, parse_memory
+
+# In order of preference, the first prefix that has nodes wins
+NODE_PREFIXES = ['/registry/nodes/', '/registry/csinodes/', '/registry/minions/']
+
+# allocatable is a dict with `cpu` (millicores), `memory` (bytes) and `pods`;
+# a missing entry means the node does not report that resource
+NodeInfo = namedtuple("NodeInfo", ["name", "ready", "schedulable", "labels", "allocatable"])
+
+
+def node_info_from_object(key, node):
+    """
+    Build a NodeInfo from a decoded Node (or CSINode) object.
+    """
+    name = key.split('/')[-1]
+    spec = node.get("spec") or {}
+    status = node.get("status") or {}
+
+    # Objects without conditions (e.g. CSINodes) are treated as ready
+    ready = True
+    for condition in status.get("conditions") or []:
+        if condition.get("type") == "Ready":
+            ready = condition.get("status") == "True"
+
+    allocatable = {}
+    raw = status.get("allocatable") or {}
+    try:
+        if "cpu" in raw:
+            allocatable["cpu"] = parse_cpu(raw["cpu"])
+        if "memory" in raw:
+            allocatable["memory"] = parse_memory(raw["memory"])
+        if "pods" in raw:
+            allocatable["pods"] = int(raw["pods"])
+    except ValueError as e:
+        print(f"Ignoring allocatable of node {name}: {e}")
+
+    return NodeInfo(
+        name=name,
+        ready=ready,
+        schedulable=not spec.get("unschedulable", False),
+        labels=dict((node.get("metadata") or {}).get("labels") or {}),
+        allocatable=allocatable,
+    )
+
+
+class NodeInventory:
+    """
+    Nodes known to the scheduler, kept current by etcd watches.
+    """
+
+    def __init__(self, etcd, prefixes=NODE_PREFIXES):
+        self.prefixes = prefixes
+        self._nodes = {prefix: {} for prefix in prefixes}
+        self._snapshot = ()
+        self._lock = threading.Lock()
+        self._informers = []
+        for prefix in prefixes:
+            informer = Informer(etcd, prefix)
+            informer.add_handler(
+                lambda key, obj, _, prefix=prefix: self._on_put(prefix, key, obj),
+                lambda key, prefix=prefix: self._on_delete(prefix, key),
+            )
+            self._informers.append(informer)
+
+    def start(self):
+        for informer in self._informers:
+            informer.start()
+
+    def stop(self):
+        for informer in self._informers:
+            informer.stop()
+
+    def snapshot(self):
+        """
+        Return a consistent tuple of NodeInfo, sorted by node name.
+        """
+        return self._snapshot
+
+    def available_nodes(self):
+        """
+        Return the nodes that can take new pods.
+        """
+        return [node for node in self._snapshot if node.ready and node.schedulable]
+
+    def _on_put(self, prefix, key, obj):
+        node = node_info_from_object(key, obj)
+        with self._lock:
+            self._nodes[prefix][node.name] = node
+            self._publish()
+
+    def _on_delete(self, prefix, key):
+        with self._lock:
+            self._nodes[prefix].pop(key.split('/')[-1], None)
+            self._publish()
+
+    def _publish(self):
+        for prefix in self.prefixes:
+            if self._nodes[prefix]:
+                nodes = self._nodes[prefix]
+                break
+        else:
+            nodes = {}
+
+        self._snapshot = tuple(nodes[name] for name in sorted(nodes))
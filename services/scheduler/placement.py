@@ -0,0 +1,243 @@
+"""
+Resource-aware placement of pods on nodes.
+
+Nodes are filtered on the pod's `resources.requests` against their allocatable
+capacity minus the requests already committed to them, and the nodes that fit
+are scored by a configurable policy:
+
+    least_allocated  spread pods, prefer the emptiest node (default)
+    most_allocated   bin-pack, prefer the fullest node that still fits
+    balanced         prefer nodes whose cpu and memory usage stay even
+
+As in kube-scheduler, scores count containers without requests as asking for
+100m CPU and 200Mi memory, so that pods without requests still spread
+instead of all landing on the first node. Filtering uses the real requests.
+
+Committed requests are kept incrementally: they change when a pod is bound or
+released, never by scanning the pods on every call. On large clusters the
+search can stop after SCHEDULER_NODES_TO_SCORE feasible nodes (like
+kube-scheduler's percentageOfNodesToScore), starting where the previous
+search left off so all nodes get their turn.
+"""
+import os
+import threading
+
+from quantity import parse_cpu, parse_memory
+
+SCHEDULER_POLICY = os.environ.get("SCHEDULER_POLICY", "least_allocated")
+# Stop after this many feasible nodes, 0 scores every node
+SCHEDULER_NODES_TO_SCORE = int(os.environ.get("SCHEDULER_NODES_TO_SCORE", "0"))
+
+RESOURCES = ("cpu", "memory", "pods")
+# Committed per node next to RESOURCES, for scoring only
+SCORED_RESOURCES = ("nonzero_cpu", "nonzero_memory")
+
+# Requests that scores assume for containers without one (kube-scheduler's
+# DefaultMilliCPURequest and DefaultMemoryRequest)
+DEFAULT_CPU_REQUEST = 100
+DEFAULT_MEMORY_REQUEST = 200 * 1024 * 1024
+
+
+class NoFitError(Exception):
+    """Raised when no node has room for a pod."""
+
+
+def pod_requests(pod):
+    """
+    Return the pod's requests as {"cpu": millicores, "memory": bytes, "pods": 1},
+    plus `nonzero_cpu` and `nonzero_memory` with the defaults filled in for
+    scoring. Like Kubernetes, init containers run one at a time, so the pod
+    needs the larger of their biggest request and the sum of the regular
+    containers.
+    """
+    spec = pod.get("spec") or {}
+
+    def container_requests(container):
+        requests = (container.get("resources") or {}).get("requests") or {}
+        cpu = parse_cpu(requests["cpu"]) if "cpu" in requests else 0
+        memory = parse_memory(requests["memory"]) if "memory" in requests else 0
+        return cpu, memory, cpu or DEFAULT_CPU_REQUEST, memory or DEFAULT_MEMORY_REQUEST
+
+    cpu = memory = nonzero_cpu = nonzero_memory = 0
+    for container in spec.get("containers") or []:
+        container_cpu, container_memory, container_nonzero_cpu, container_nonzero_memory = container_requests(container)
+        cpu += container_cpu
+        memory += container_memory
+        nonzero_cpu += container_nonzero_cpu
+        nonzero_memory += container_nonzero_memory
+
+    for container in spec.get("initContainers") or []:
+        container_cpu, container_memory, container_nonzero_cpu, container_nonzero_memory = container_requests(container)
+        cpu = max(cpu, container_cpu)
+        memory = max(memory, container_memory)
+        nonzero_cpu = max(nonzero_cpu, container_nonzero_cpu)
+        nonzero_memory = max(nonzero_memory, container_nonzero_memory)
+
+    return {
+        "cpu": cpu,
+        "memory": memory,
+        "pods": 1,
+        "nonzero_cpu": nonzero_cpu or DEFAULT_CPU_REQUEST,
+        "nonzero_memory": nonzero_memory or DEFAULT_MEMORY_REQUEST,
+    }
+
+
+# Scores take the cpu and memory fraction a node would be at after placing the
+# pod (0 for resources the node does not report); higher is better.
+def score_least_allocated(cpu_fraction, memory_fraction):
+    return 2.0 - cpu_fraction - memory_fraction
+
+
+def score_most_allocated(cpu_fraction, memory_fraction):
+    return cpu_fraction + memory_fraction
+
+
+def score_balanced(cpu_fraction, memory_fraction):
+    return 1.0 - abs(cpu_fraction - memory_fraction)
+
+
+POLICIES = {
+    "least_allocated": score_least_allocated,
+    "most_allocated": score_most_allocated,
+    "balanced": score_balanced,
+}
+
+
+class PlacementEngine:
+    """
+    Picks nodes for pods and keeps track of the requests committed to each node.
+    """
+
+    def __init__(self, policy=SCHEDULER_POLICY, nodes_to_score=SCHEDULER_NODES_TO_SCORE):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy '{policy}', expected one of {sorted(POLICIES)}")
+        self.policy = policy
+        self._score = POLICIES[policy]
+        self.nodes_to_score = nodes_to_score
+        self._next_start = 0
+        self._committed = {}  # node name -> {"cpu", "memory", "pods"}
+        self._bound = {}  # pod key -> (node name, requests)
+        self._lock = threading.Lock()
+
+    def reserve(self, pod_key, pod, nodes):
+        """
+        Choose a node for the pod and commit its requests to it.
+        Raises NoFitError if none of the nodes has room.
+        """
+        requests = pod_requests(pod)
+        with self._lock:
+            # A pod being rescheduled should not count against its old node
+            self._release(pod_key)
+            node_name = self._select(requests, nodes)
+            self._bind(pod_key, node_name, requests)
+        return node_name
+
+    def bind(self, pod_key, node_name, pod):
+        """
+        Record a pod that is (already) bound to node_name.
+        """
+        requests = pod_requests(pod)
+        with self._lock:
+            if self._bound.get(pod_key) == (node_name, requests):
+                return
+            self._release(pod_key)
+            self._bind(pod_key, node_name, requests)
+
+    def release(self, pod_key, node_name=None):
+        """
+        Give back the requests of a deleted or finished pod. With node_name,
+        only if the pod is still accounted to that node: a reservation that
+        lost to another scheduler replica must not undo the binding the
+        watch has recorded since.
+        """
+        with self._lock:
+            if node_name is not None and (self._bound.get(pod_key) or (None,))[0] != node_name:
+                return
+            self._release(pod_key)
+
+    def node_of(self, pod_key):
+        """
+        The node a pod is accounted to, or None.
+        """
+        with self._lock:
+            return (self._bound.get(pod_key) or (None,))[0]
+
+    def committed(self, node_name):
+        with self._lock:
+            used = self._committed.get(node_name)
+            return {resource: used[resource] if used else 0 for resource in RESOURCES}
+
+    def _select(self, requests, nodes):
+        # This is the hot loop of the scheduler, keep it free of allocations
+        request_cpu = requests["cpu"]
+        request_memory = requests["memory"]
+        request_pods = requests["pods"]
+        scored_cpu = requests["nonzero_cpu"]
+        scored_memory = requests["nonzero_memory"]
+        committed = self._committed
+        score = self._score
+        best_name = None
+        best_score = None
+        feasible = 0
+
+        count = len(nodes)
+        start = self._next_start % count if count and self.nodes_to_score else 0
+        for i in range(count):
+            node = nodes[(start + i) % count] if start else nodes[i]
+            used = committed.get(node.name)
+            if used is None:
+                cpu, memory, pods = request_cpu, request_memory, request_pods
+                nonzero_cpu, nonzero_memory = scored_cpu, scored_memory
+            else:
+                cpu = used["cpu"] + request_cpu
+                memory = used["memory"] + request_memory
+                pods = used["pods"] + request_pods
+                nonzero_cpu = used["nonzero_cpu"] + scored_cpu
+                nonzero_memory = used["nonzero_memory"] + scored_memory
+
+            allocatable = node.allocatable
+            cpu_capacity = allocatable.get("cpu")
+            memory_capacity = allocatable.get("memory")
+            pods_capacity = allocatable.get("pods")
+            if cpu_capacity is not None and cpu > cpu_capacity:
+                continue
+            if memory_capacity is not None and memory > memory_capacity:
+                continue
+            if pods_capacity is not None and pods > pods_capacity:
+                continue
+
+            node_score = score(
+                nonzero_cpu / cpu_capacity if cpu_capacity else 0.0,
+                nonzero_memory / memory_capacity if memory_capacity else 0.0,
+            )
+            if best_score is None or node_score > best_score:
+                best_name, best_score = node.name, node_score
+
+            feasible += 1
+            if feasible == self.nodes_to_score:
+                self._next_start = start + i + 1
+                break
+
+        if best_name is None:
+            raise NoFitError(
+                f"No node fits requests cpu={request_cpu}m memory={request_memory} "
+                f"({count} nodes considered)"
+            )
+        return best_name
+
+    def _bind(self, pod_key, node_name, requests):
+        committed = self._committed.setdefault(node_name, dict.fromkeys(RESOURCES + SCORED_RESOURCES, 0))
+        for resource in RESOURCES + SCORED_RESOURCES:
+            committed[resource] += requests[resource]
+        self._bound[pod_key] = (node_name, requests)
+
+    def _release(self, pod_key):
+        bound = self._bound.pop(pod_key, None)
+        if bound is None:
+            return
+        node_name, requests = bound
+        committed = self._committed[node_name]
+        for resource in RESOURCES + SCORED_RESOURCES:
+            committed[resource] -= requests[resource]
+        if not committed["pods"]:
+            del self._committed[node_name]
@@ -0,0 +1,60 @@
+"""
+Parse Kubernetes resource quantities (e.g. `500m`, `0.01`, `128Mi`).
+"""
+from decimal import Decimal, InvalidOperation
+
+_BINARY_SUFFIXES = {
+    "Ki": 2 ** 10,
+    "Mi": 2 ** 20,
+    "Gi": 2 ** 30,
+    "Ti": 2 ** 40,
+    "Pi": 2 ** 50,
+    "Ei": 2 ** 60,
+}
+
+_DECIMAL_SUFFIXES = {
+    "n": Decimal("1e-9"),
+    "u": Decimal("1e-6"),
+    "m": Decimal("1e-3"),
+    "": Decimal(1),
+    "k": Decimal("1e3"),
+    "M": Decimal("1e6"),
+    "G": Decimal("1e9"),
+    "T": Decimal("1e12"),
+    "P": Decimal("1e15"),
+    "E": Decimal("1e18"),
+}
+
+
+def parse_quantity(value):
+    """
+    Convert a quantity to a Decimal in base units. Raises ValueError.
+    """
+    if isinstance(value, (int, float)):
+        return Decimal(str(value))
+
+    text = str(value).strip()
+    for suffix, factor in _BINARY_SUFFIXES.items():
+        if text.endswith(suffix):
+            return _to_decimal(text[:-len(suffix)]) * factor
+
+    suffix = text[-1:] if text[-1:] in _DECIMAL_SUFFIXES and not text[-1:].isdigit() else ""
+    number = text[:-1] if suffix else text
+    return _to_decimal(number) * _DECIMAL_SUFFIXES[suffix]
+
+
+def _to_decimal(text):
+    try:
+        return Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"Invalid quantity '{text}'")
+
+
+def parse_cpu(value):
+    """CPU quantity in millicores."""
+    return int((parse_quantity(value) * 1000).to_integral_value(rounding="ROUND_CEILING"))
+
+
+def parse_memory(value):
+    """Memory quantity in bytes."""
+    return int(parse_quantity(value).to_integral_value(rounding="ROUND_CEILING"))
@@ -1,18 +1,45 @@
 from flask import Flask, jsonify, request
-import etcd3
 import json
 import os
+import threading
+import time
 import traceback
-import subprocess
-import yaml
 from datetime import datetime
 
+from common import metrics, tracing
+from common.cache import object_cache, parse_cached
+from common.batch import get_many
+from common.cas import ConflictError, conflict_stats, put_many_if_unchanged, update_object
+from common.codec import encode_many, get_pool
+from common.etcd_client import LazyClient
+from common.informer import Informer
+from common.startup import StartupTimeline
+from node_inventory import NodeInventory
+from placement import NoFitError, PlacementEngine
+from sharding import ShardMembership, ShardQueue
+
 # Initialize Flask App
 app = Flask(__name__)
+startup = StartupTimeline("scheduler")
+startup.install(app)
+metrics.install(app)
+tracing.install(app, "scheduler")
+startup.mark("imported")
+
+# Watch for unbound pods and schedule this replica's shard of them
+SCHEDULER_SHARDING = os.environ.get("SCHEDULER_SHARDING", "true").lower() == "true"
+# Pods the shard worker schedules at once
+SCHEDULER_SHARD_BATCH_SIZE = int(os.environ.get("SCHEDULER_SHARD_BATCH_SIZE", "100"))
+# Seconds a request waits for the owner of a pod before scheduling it here
+SCHEDULER_SHARD_WAIT = float(os.environ.get("SCHEDULER_SHARD_WAIT", "5"))
+# Seconds between retries of pods that could not be scheduled
+SCHEDULER_RETRY_INTERVAL = float(os.environ.get("SCHEDULER_RETRY_INTERVAL", "30"))
 
-# etcd Configuration
-ETCD_HOST = "172.18.0.2"
-ETCD_PORT = 2379
+# etcd Configuration, STORAGE_BACKEND=memory keeps the data in this process
+# instead (see common.memory_etcd) and ETCD_TLS=false connects without certificates
+ETCD_HOST = os.environ.get("ETCD_HOST", "172.18.0.2")
+ETCD_PORT = int(os.environ.get("ETCD_PORT", "2379"))
+ETCD_TLS = os.environ.get("ETCD_TLS", "true").lower() == "true"
 
 # Path to certificates (assumes they're present in 'certs' directory)
 dirname = os.path.dirname(__file__)
@@ -20,14 +47,39 @@ ca_cert = os.path.join(dirname, 'certs/ca.crt')
 cert_cert = os.path.join(dirname, 'certs/client.crt')
 cert_key = os.path.join(dirname, 'certs/client.key')
 
-# Initialize etcd3 Client
-etcd = etcd3.client(
+# etcd3 Client, connected on first use (see common.etcd_client)
+etcd = LazyClient(
     host=ETCD_HOST,
     port=ETCD_PORT,
-    ca_cert=ca_cert,
-    cert_cert=cert_cert,
-    cert_key=cert_key
+    ca_cert=ca_cert if ETCD_TLS else None,
+    cert_cert=cert_cert if ETCD_TLS else None,
+    cert_key=cert_key if ETCD_TLS else None
+)
+
+# Nodes are loaded once and then kept current by etcd watches
+node_inventory = NodeInventory(etcd)
+
+# Requests committed to each node, kept current from the bound pods in etcd
+placement = PlacementEngine()
+pod_informer = Informer(etcd, "/registry/pods/")
+
+# Replicas split the pods by consistent hashing over the live members
+membership = ShardMembership(etcd)
+shard_queue = ShardQueue(membership.owns)
+metrics.callback_gauge(
+    "shard_queue_depth", "Pods of this replica's shard waiting to be scheduled, by state.",
+    lambda: {(state,): count for state, count in shard_queue.stats().items()},
+    ["state"],
 )
+membership.add_listener(shard_queue.requeue)
+# Notified whenever the pod watch sees a pod get bound or deleted. The watch
+# thread notifies while holding the informer's lock, so nothing may call into
+# the informer with binding_changed held; binding_version tells waiters whether
+# they missed a notification while they were not holding it.
+binding_changed = threading.Condition()
+binding_version = 0
+shard_worker_lock = threading.Lock()
+shard_worker_started = False
 
 @app.route('/', methods=['GET'])
 def health_check():
@@ -36,10 +88,24 @@ def health_check():
     """
     return jsonify({"status": "Scheduler is running"}), 200
 
+@app.route('/debug/stats', methods=['GET'])
+def debug_stats():
+    """
+    Cache and write conflict statistics of this instance.
+    """
+    return jsonify({
+        "object_cache": object_cache.stats(),
+        "conflicts": conflict_stats.stats(),
+        "shard": {**membership.stats(), **shard_queue.stats()},
+        "startup": startup.stats(),
+        "tracing": tracing.exporter.stats(),
+    }), 200
+
 @app.route('/schedule', methods=['POST'])
 def schedule_pod():
     """
     Endpoint to trigger Pod scheduling. This endpoint receives a pod_key and schedules the pod on an available node.
+    A pod of another replica's shard is left to that replica, and reported once it is bound.
     """
     try:
         # Get the pod_key from the request payload
@@ -47,13 +113,23 @@ def schedule_pod():
         if not pod_key:
             return jsonify({"error": "pod_key is required"}), 400
 
-        # Fetch the pod from etcd using the pod_key
-        pod_dict = fetch_pod(pod_key)
-        if not pod_dict:
-            return jsonify({"error": f"Pod with key {pod_key} not found"}), 404
+        claimed, assigned = claim_or_wait([pod_key])
+        node_name = assigned.get(pod_key)
+        if node_name is None:
+            if not claimed:
+                return jsonify({"error": f"Timed out waiting for Pod {pod_key} to be scheduled"}), 504
+            try:
+                # Fetch the pod from etcd using the pod_key
+                pod_dict, mod_revision = fetch_pod(pod_key)
+                if not pod_dict:
+                    return jsonify({"error": f"Pod with key {pod_key} not found"}), 404
 
-        # Assign a node to the Pod
-        node_name = assign_node_to_pod(pod_key, pod_dict)
+                # Assign a node to the Pod
+                node_name = assign_node_to_pod(pod_key, pod_dict, mod_revision)
+                if node_name is None:
+                    return jsonify({"error": f"Pod with key {pod_key} not found"}), 404
+            finally:
+                shard_queue.done(claimed)
 
         # Return the scheduling result
         return jsonify({
@@ -62,153 +138,508 @@ def schedule_pod():
             "assigned_node": node_name
         }), 200
 
+    except (NoFitError, ConflictError) as error:
+        return jsonify({"error": str(error)}), 409
+    except Exception as error:
+        traceback.print_exc()
+        return jsonify({"error": "Internal system error during scheduling"}), 500
+
+@app.route('/schedule/batch', methods=['POST'])
+def schedule_pods():
+    """
+    Schedule many pods at once. The pods are read with one multi-key read,
+    placed one after another so that capacity taken earlier in the batch is
+    respected, and all bindings are written in one etcd transaction that
+    only succeeds for pods that did not change since they were read. Pods
+    that did change are re-read and bound one by one. Pods that are already
+    bound are reported with their node and left alone, so a batch can safely
+    be retried or race with another scheduler replica. Pods of another
+    replica's shard are left to that replica. Results are reported per pod,
+    in request order.
+    """
+    try:
+        pod_keys = request.json.get("pod_keys")
+        if not pod_keys or not isinstance(pod_keys, list):
+            return jsonify({"error": "pod_keys must be a non-empty list"}), 400
+
+        claimed, assigned = claim_or_wait(list(dict.fromkeys(pod_keys)))
+        try:
+            scheduled = {result["pod_key"]: result for result in schedule_batch(claimed)}
+        finally:
+            shard_queue.done(claimed)
+        for pod_key, node_name in assigned.items():
+            scheduled[pod_key] = {"pod_key": pod_key, "status": "success", "assigned_node": node_name}
+
+        results = []
+        seen = set()
+        for pod_key in pod_keys:
+            if pod_key in seen:
+                results.append({"pod_key": pod_key, "status": "failure", "error": "Duplicate pod_key"})
+                continue
+            seen.add(pod_key)
+            results.append(scheduled.get(pod_key) or {
+                "pod_key": pod_key, "status": "failure", "error": "Timed out waiting for the Pod to be scheduled"
+            })
+
+        succeeded = sum(1 for result in results if result["status"] == "success")
+        return jsonify({
+            "message": f"Scheduled {succeeded} of {len(pod_keys)} pods",
+            "results": results
+        }), 200
+
+    except Exception as error:
+        traceback.print_exc()
+        return jsonify({"error": "Internal system error during scheduling"}), 500
+
+@app.route('/schedule/create', methods=['POST'])
+def create_and_schedule_pods():
+    """
+    Fast path for new pods. The API server sends the pod objects instead of
+    storing them first, so each pod is placed, encoded once and written to
+    etcd once, already bound. A pod is only created if its key does not
+    exist yet. Pods that do not fit anywhere are stored unbound, so that the
+    shard worker retries them. Results are reported per pod, in request order.
+    """
+    try:
+        pods = request.json.get("pods")
+        if not pods or not isinstance(pods, list) or not all(
+            isinstance(item, dict) and isinstance(item.get("key"), str) and isinstance(item.get("object"), dict)
+            for item in pods
+        ):
+            return jsonify({"error": "pods must be a non-empty list of {key, object}"}), 400
+
+        results = create_bound([(item["key"], item["object"]) for item in pods])
+        succeeded = sum(1 for result in results if result["status"] == "success")
+        return jsonify({
+            "message": f"Created and scheduled {succeeded} of {len(pods)} pods",
+            "results": results
+        }), 200
+
     except Exception as error:
         traceback.print_exc()
         return jsonify({"error": "Internal system error during scheduling"}), 500
 
+def create_bound(items):
+    """
+    Place new pods ([(pod_key, pod)]) and create them in etcd bound to their
+    node, with one create-if-absent transaction per chunk. Failed results
+    carry a `reason`: AlreadyExists, Unschedulable (stored unbound), Invalid
+    or EncodeFailed (both not stored).
+    """
+    available_nodes = fetch_available_nodes()
+
+    results = []
+    reserved = {}
+    seen = set()
+    try:
+        for pod_key, pod in items:
+            result = {"pod_key": pod_key, "status": "success"}
+            if pod_key in seen:
+                result.update(status="failure", reason="AlreadyExists", error="Duplicate pod_key")
+            elif pod_informer.has(pod_key):
+                result.update(status="failure", reason="AlreadyExists", error="Pod already exists")
+            else:
+                seen.add(pod_key)
+                try:
+                    node_name = placement.reserve(pod_key, pod, available_nodes)
+                    reserved[pod_key] = node_name
+                    bind_pod(pod, node_name)
+                    result["assigned_node"] = node_name
+                except NoFitError as error:
+                    result.update(status="failure", reason="Unschedulable", error=str(error))
+                except ValueError as error:
+                    # e.g. a malformed resource quantity
+                    result.update(status="failure", reason="Invalid", error=f"Invalid Pod: {error}")
+            results.append(result)
+
+        # Existing, duplicate and invalid pods are the only results so far that are not written
+        writes = [
+            (pod_key, pod) for (pod_key, pod), result in zip(items, results)
+            if result.get("reason") not in ("AlreadyExists", "Invalid")
+        ]
+        encoded = encode_many(writes)
+        # mod_revision 0: only if the key does not exist
+        existing = put_many_if_unchanged(
+            etcd,
+            [(pod_key, value, 0) for (pod_key, _), value in zip(writes, encoded) if value is not None]
+        )
+    except Exception:
+        for pod_key, node_name in reserved.items():
+            placement.release(pod_key, node_name)
+        raise
+    not_encoded = {pod_key for (pod_key, _), value in zip(writes, encoded) if value is None}
+
+    for result in results:
+        pod_key = result["pod_key"]
+        if result.get("reason") in ("AlreadyExists", "Invalid"):
+            continue
+        object_cache.invalidate(pod_key)
+        if pod_key in existing or pod_key in not_encoded:
+            if pod_key in reserved:
+                placement.release(pod_key, reserved.pop(pod_key))
+            result.pop("assigned_node", None)
+            if pod_key in existing:
+                result.update(status="failure", reason="AlreadyExists", error="Pod already exists")
+                # Created since the watch last looked, account for it in its place
+                if existing[pod_key] is not None:
+                    value, metadata = existing[pod_key]
+                    current = parse_cached(pod_key, value, metadata.mod_revision)
+                    if current:
+                        on_pod_put(pod_key, current, metadata.mod_revision)
+            else:
+                result.update(status="failure", reason="EncodeFailed", error="Failed to encode Pod")
+
+    return results
+
+def claim_or_wait(pod_keys):
+    """
+    Claim the pods this replica should schedule and wait, at most
+    SCHEDULER_SHARD_WAIT seconds, for the others to be bound by the replica
+    that owns them (or by this replica's shard worker). Pods that are still
+    unbound after that are claimed as well, e.g. when their owner just left.
+    Returns (claimed keys, {pod_key: node} of the pods bound meanwhile).
+    The caller must pass the claimed keys to shard_queue.done().
+    """
+    start_informers()
+    # Pods the watch has not seen yet are scheduled here rather than waited for
+    claimed = shard_queue.claim([
+        pod_key for pod_key in pod_keys
+        if membership.owns(pod_key) or not pod_informer.has(pod_key)
+    ])
+    waiting = [pod_key for pod_key in pod_keys if pod_key not in set(claimed)]
+    if not waiting:
+        return claimed, {}
+
+    assigned = wait_for_bindings(waiting, SCHEDULER_SHARD_WAIT)
+    claimed += shard_queue.claim([pod_key for pod_key in waiting if pod_key not in assigned])
+    return claimed, assigned
+
+def wait_for_bindings(pod_keys, timeout):
+    """
+    Wait until the pod watch has seen the pods bound, for at most timeout
+    seconds. Returns {pod_key: node} of the pods that are bound. Pods that
+    were deleted are not waited for.
+    """
+    deadline = time.monotonic() + timeout
+    assigned = {}
+    while True:
+        with binding_changed:
+            version = binding_version
+        waiting = []
+        for pod_key in pod_keys:
+            node_name = assigned.get(pod_key) or placement.node_of(pod_key)
+            if node_name:
+                assigned[pod_key] = node_name
+            elif pod_informer.has(pod_key):
+                waiting.append(pod_key)
+        remaining = deadline - time.monotonic()
+        if not waiting or remaining <= 0:
+            return assigned
+        pod_keys = waiting
+        with binding_changed:
+            if binding_version == version:
+                binding_changed.wait(remaining)
+
+def notify_binding_changed():
+    global binding_version
+    with binding_changed:
+        binding_version += 1
+        binding_changed.notify_all()
+
+def schedule_batch(pod_keys):
+    """
+    Schedule the given pods (see schedule_pods) and return the result of each.
+    """
+    if not pod_keys:
+        return []
+
+    pods = fetch_pods(pod_keys)
+    available_nodes = fetch_available_nodes()
+
+    results = []
+    bound = {}
+    try:
+        for pod_key in pod_keys:
+            pod, mod_revision = pods.get(pod_key, (None, None))
+            if pod is None:
+                results.append({"pod_key": pod_key, "status": "failure", "error": "Pod not found"})
+                continue
+            if pod_key in bound:
+                results.append({"pod_key": pod_key, "status": "failure", "error": "Duplicate pod_key"})
+                continue
+            if pod.get("spec", {}).get("nodeName"):
+                results.append({"pod_key": pod_key, "status": "success", "assigned_node": pod["spec"]["nodeName"]})
+                continue
+            try:
+                node_name = placement.reserve(pod_key, pod, available_nodes)
+            except NoFitError as error:
+                results.append({"pod_key": pod_key, "status": "failure", "error": str(error)})
+                continue
+            except ValueError as error:
+                # e.g. a malformed resource quantity, which must not fail the other pods
+                results.append({"pod_key": pod_key, "status": "failure", "error": f"Invalid Pod: {error}"})
+                continue
+
+            bind_pod(pod, node_name)
+            bound[pod_key] = (pod, mod_revision)
+            results.append({"pod_key": pod_key, "status": "success", "assigned_node": node_name})
+
+        failed, conflicts = update_pods(bound)
+    except Exception:
+        for pod_key, (pod, _) in bound.items():
+            placement.release(pod_key, pod["spec"]["nodeName"])
+        raise
+
+    for result in results:
+        pod_key = result["pod_key"]
+        if result["status"] != "success" or pod_key not in bound:
+            continue
+        if pod_key in failed:
+            placement.release(pod_key, result["assigned_node"])
+            bound.pop(pod_key)
+            result.update(status="failure", error="Failed to encode Pod")
+            del result["assigned_node"]
+        elif pod_key in conflicts:
+            # Changed since it was read, e.g. bound by another replica
+            try:
+                node_name = resolve_conflict(pod_key, conflicts[pod_key], result["assigned_node"])
+            except Exception as error:
+                traceback.print_exc()
+                bound.pop(pod_key)
+                result.update(status="failure", error=str(error))
+                del result["assigned_node"]
+                continue
+            if node_name is None:
+                bound.pop(pod_key)
+                result.update(status="failure", error="Pod not found")
+                del result["assigned_node"]
+            else:
+                result["assigned_node"] = node_name
+
+    return results
+
 def fetch_pod(key):
     """
     Fetch and parse a Pod from etcd.
     Handles Protobuf, JSON formats.
+    Returns (pod, mod_revision), or (None, None) if it does not exist.
     """
     value, metadata = etcd.get(key)
     if value:
-        pod_dict = detect_and_parse(value)
+        pod_dict = parse_cached(key, value, metadata.mod_revision)
         if pod_dict:
-            return pod_dict
+            return pod_dict, metadata.mod_revision
         else:
             print(f"Error: Unable to parse Pod at key {key}")
-    return None
+    return None, None
 
-def detect_and_parse(value):
+def fetch_pods(keys):
     """
-    Detect and parse the format of the data (Protobuf, JSON).
-    Returns a Python dictionary or None if parsing fails.
+    Fetch and parse many Pods with one multi-key read.
+    Returns {pod_key: (pod, mod_revision)} for the pods that exist and could be parsed.
     """
-    try:
-        # Try parsing as JSON
-        return json.loads(value.decode("utf-8"))
-    except Exception:
-        pass
-    
-    try:
-        # Try parsing as Protobuf
-        return yaml.safe_load(auger_decode(value))
-    except Exception:
-        traceback.print_exc()
-        pass
+    pods = {}
+    for key, (value, metadata) in get_many(etcd, keys).items():
+        pod_dict = parse_cached(key, value, metadata.mod_revision)
+        if pod_dict:
+            pods[key] = (pod_dict, metadata.mod_revision)
+        else:
+            print(f"Error: Unable to parse Pod at key {key}")
+    return pods
 
-    return None
-    
-def auger_encode(data_dict):
+def assign_node_to_pod(pod_key, pod, mod_revision):
     """
-    Encode a Python dictionary to Protobuf format using Auger.
-    The dictionary is first converted to YAML, then encoded to Protobuf.
+    Assign a node to a specific Pod (by pod_key) and update it in etcd.
+    Returns the node the Pod is bound to, or None if it was deleted.
     """
-    try:
-        # Convert the dictionary to YAML format
-        yaml_data = yaml.dump(data_dict, default_flow_style=False)
-
-        # Use Auger to encode the YAML into Protobuf
-        process = subprocess.run(
-            ["./auger/build/auger", "encode"],
-            input=yaml_data.encode("utf-8"),  # Provide YAML as input
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
+    # Already bound, e.g. by another scheduler replica
+    if pod.get("spec", {}).get("nodeName"):
+        return pod["spec"]["nodeName"]
 
-        # The output of the Auger process is the Protobuf encoded data
-        return process.stdout
-    except subprocess.CalledProcessError as e:
-        print("Auger encoding error:", e.stderr.decode('utf-8'))
-        return None
+    # Fetch available nodes from the node inventory
+    available_nodes = fetch_available_nodes()
+
+    if not available_nodes:
+        raise Exception("No available nodes found for scheduling.")
+
+    # Pick the best node that fits the Pod's requests and commit them to it
+    node_name = placement.reserve(pod_key, pod, available_nodes)
 
-def assign_node_to_pod(pod_key, pod):
+    return persist_binding(pod_key, pod, mod_revision, node_name)
+
+def persist_binding(pod_key, pod, mod_revision, node_name):
     """
-    Assign a node to a specific Pod (by pod_key) and update it in etcd.
+    Bind the Pod read at mod_revision to node_name in etcd, retrying on
+    conflicts. Returns the node the Pod ends up bound to: another scheduler
+    replica may have bound it first. Returns None if the Pod was deleted.
     """
-    # Fetch real available nodes from etcd dynamically
-    available_nodes = fetch_available_nodes_from_etcd()
+    def apply(latest):
+        if latest.get("spec", {}).get("nodeName"):
+            return False
+        bind_pod(latest, node_name)
+        return True
 
-    if not available_nodes:
-        raise Exception("No available nodes found for scheduling.")
+    try:
+        stored = update_pod(pod_key, pod, mod_revision, apply)
+    except Exception:
+        placement.release(pod_key, node_name)
+        raise
 
-    # Round-robin scheduling (simple, could be expanded based on actual resource availability)
-    node_name = available_nodes[0]  # Just assign the first node for simplicity
+    assigned_node = stored["spec"]["nodeName"] if stored else None
+    if assigned_node != node_name:
+        # Our reservation lost, account for the binding that won instead
+        placement.release(pod_key, node_name)
+        if assigned_node:
+            placement.bind(pod_key, assigned_node, stored)
+    return assigned_node
 
+def resolve_conflict(pod_key, current, node_name):
+    """
+    Finish a batch binding whose Pod changed after it was read. current is
+    the (value, metadata) found in etcd, or None if the Pod was deleted.
+    """
+    if current is None:
+        placement.release(pod_key, node_name)
+        return None
+
+    value, metadata = current
+    pod = parse_cached(pod_key, value, metadata.mod_revision)
+    if pod is None:
+        placement.release(pod_key, node_name)
+        raise Exception(f"Unable to parse Pod at key {pod_key}")
+    return persist_binding(pod_key, pod, metadata.mod_revision, node_name)
+
+def bind_pod(pod, node_name):
+    """
+    Set the fields of a Pod that record its binding.
+    """
     # Update the Pod's nodeName field
     pod["spec"]["nodeName"] = node_name
     # Add creationTimestamp to the metadata of the resource
     pod["metadata"]["creationTimestamp"] = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
-    update_pod(pod_key, pod)
 
-    return node_name
+def fetch_available_nodes():
+    """
+    Return the nodes that can take new pods.
+    Served from the watch-backed node inventory, no etcd round trip.
+    """
+    start_informers()
+    return node_inventory.available_nodes()
 
-def fetch_available_nodes_from_etcd():
+def start_informers():
     """
-    Fetch the list of available nodes from etcd.
-    Assuming the nodes are stored in '/registry/nodes' in etcd.
+    Load nodes and bound pods once, then follow them with etcd watches.
+    With sharding, also join the scheduler ring and schedule this replica's
+    shard of the unbound pods as they appear.
     """
-    available_nodes = []
-    for nodes_prefix in ['/registry/nodes/', '/registry/csinodes/', '/registry/minions/']:
+    node_inventory.start()
+    if SCHEDULER_SHARDING:
+        # Before the pods, so that the initial pods are split by the full ring
+        membership.start()
+    pod_informer.start()
+    if SCHEDULER_SHARDING:
+        start_shard_worker()
+
+def start_shard_worker():
+    global shard_worker_started
+    with shard_worker_lock:
+        if shard_worker_started:
+            return
+        shard_worker_started = True
+    threading.Thread(target=run_shard_worker, name="shard-worker", daemon=True).start()
+
+def run_shard_worker():
+    """
+    Schedule the unbound pods of this replica's shard in batches. Pods that
+    could not be scheduled are retried every SCHEDULER_RETRY_INTERVAL seconds.
+    """
+    next_retry = time.monotonic() + SCHEDULER_RETRY_INTERVAL
+    while True:
+        now = time.monotonic()
+        if now >= next_retry:
+            shard_queue.requeue()
+            next_retry = now + SCHEDULER_RETRY_INTERVAL
+
+        pod_keys = shard_queue.take(SCHEDULER_SHARD_BATCH_SIZE, next_retry - now)
+        if not pod_keys:
+            continue
         try:
-            # Query etcd for available node names
-            for value, metadata in etcd.get_prefix(nodes_prefix):
-                node_name = metadata.key.decode().split('/')[-1]  # Extract node name from the key
-                available_nodes.append(node_name)
-            if available_nodes:
-                break
-        except Exception as e:
-            print(f"Error fetching nodes from etcd: {e}")
-    
-    return available_nodes
+            with tracing.start_trace("schedule shard batch", pods=len(pod_keys)):
+                results = schedule_batch(pod_keys)
+            for result in results:
+                if result["status"] != "success":
+                    print(f"Could not schedule {result['pod_key']}: {result['error']}")
+        except Exception:
+            traceback.print_exc()
+        finally:
+            shard_queue.done(pod_keys)
 
-def update_pod(key, pod):
+def on_pod_put(key, pod, mod_revision):
     """
-    Update a Pod in etcd as Protobuf encoded yaml.
+    Commit the requests of bound pods, release them once a pod has finished.
+    A pod's nodeName never changes once set. Unbound pods are queued for
+    scheduling if they belong to this replica's shard.
     """
-    etcd.put(key, auger_encode(pod))
-    
-def auger_decode(data):
-    """Simulates decoding Protobuf using Auger."""
-    try:
-        process = subprocess.run(
-            ["./auger/build/auger", "decode"],
-            input=data,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-        return process.stdout.decode('utf-8')
-    except subprocess.CalledProcessError as e:
-        print("Auger error:", e.stderr.decode('utf-8'))
-        return None
+    node_name = (pod.get("spec") or {}).get("nodeName")
+    phase = (pod.get("status") or {}).get("phase")
+    if phase in ("Succeeded", "Failed"):
+        placement.release(key)
+    elif node_name:
+        placement.bind(key, node_name, pod)
+        notify_binding_changed()
+
+    if SCHEDULER_SHARDING:
+        terminating = bool((pod.get("metadata") or {}).get("deletionTimestamp"))
+        shard_queue.set_unbound(key, not node_name and not terminating and phase not in ("Succeeded", "Failed"))
+
+def on_pod_delete(key):
+    placement.release(key)
+    shard_queue.set_unbound(key, False)
+    notify_binding_changed()
+
+pod_informer.add_handler(on_pod_put, on_pod_delete)
+
+def update_pod(key, pod, mod_revision, apply):
+    """
+    Update a Pod in etcd in the codec of its type, if it did not change since
+    mod_revision. apply(pod) makes the change and is applied again to the
+    latest version after a conflict (see common.cas.update_object).
+    """
+    return update_object(etcd, key, pod, mod_revision, apply)
+
+def update_pods(pods):
+    """
+    Write many Pods ({key: (pod, mod_revision)}) in one etcd transaction,
+    encoding them in parallel. Pods that changed since mod_revision are not
+    written. Returns (keys that could not be encoded, {key: current (value,
+    metadata) or None} of the pods that changed).
+    """
+    keys = list(pods)
+    encoded = encode_many((key, pods[key][0]) for key in keys)
+    conflicts = put_many_if_unchanged(
+        etcd,
+        [(key, value, pods[key][1]) for key, value in zip(keys, encoded) if value is not None]
+    )
+    for key in keys:
+        object_cache.invalidate(key)
+    return [key for key, value in zip(keys, encoded) if value is None], conflicts
     
-def auger_encode(data_dict):
+def start():
     """
-    Encode a Python dictionary to Protobuf format using Auger.
-    The dictionary is first converted to YAML, then encoded to Protobuf.
+    Warm up and load nodes and bound pods, then mark the service as serving.
     """
-    try:
-        # Convert the dictionary to YAML format
-        yaml_data = yaml.dump(data_dict, default_flow_style=False)
-
-        # Use Auger to encode the YAML into Protobuf
-        process = subprocess.run(
-            ["./auger/build/auger", "encode"],
-            input=yaml_data.encode("utf-8"),  # Provide YAML as input
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
+    # Connect, start the codec workers and load nodes and bound pods while
+    # the server starts; the readiness probe passes once this is done
+    startup.warm_up([
+        ("etcd connected", etcd.ping),
+        ("codec workers started", get_pool),
+        ("informers synced", start_informers),
+    ])
+    startup.mark("serving")
 
-        # The output of the Auger process is the Protobuf encoded data
-        return process.stdout
-    except subprocess.CalledProcessError as e:
-        print("Auger encoding error:", e.stderr.decode('utf-8'))
-        return None
 
 if __name__ == "__main__":
+    start()
+
     # Running the Flask app on port 8081
     app.run(host="0.0.0.0", port=8081)
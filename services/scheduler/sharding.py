@@ -0,0 +1,244 @@
+"""
+Split the pods between scheduler replicas.
+
+Every replica registers itself under SCHEDULER_MEMBER_PREFIX with a key bound
+to an etcd lease that it keeps alive. All replicas watch that prefix and place
+the live members on a consistent hash ring, so they agree on which replica
+owns which pod key without talking to each other. When a replica joins, or
+its lease expires because it stopped, only the keys next to it on the ring
+move to another replica.
+"""
+import bisect
+import collections
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+from common.informer import Informer
+
+SCHEDULER_MEMBER_PREFIX = os.environ.get("SCHEDULER_MEMBER_PREFIX", "/serverless-k8s/schedulers/")
+# Seconds a replica stays a member after its last keep-alive
+SCHEDULER_LEASE_TTL = int(os.environ.get("SCHEDULER_LEASE_TTL", "10"))
+# Points per member on the hash ring, more points spread the keys more evenly
+SCHEDULER_VIRTUAL_NODES = int(os.environ.get("SCHEDULER_VIRTUAL_NODES", "64"))
+
+
+def ring_hash(value):
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Immutable consistent hash ring over member ids.
+    """
+
+    def __init__(self, members=(), virtual_nodes=SCHEDULER_VIRTUAL_NODES):
+        self.members = frozenset(members)
+        points = sorted(
+            (ring_hash(f"{member}#{replica}"), member)
+            for member in self.members
+            for replica in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, key):
+        """
+        Return the member that owns key, or None if the ring is empty.
+        """
+        if not self._owners:
+            return None
+        index = bisect.bisect(self._hashes, ring_hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class ShardMembership:
+    """
+    This replica's membership and the ring of all live members.
+
+    Until the replica has registered (or if registering keeps failing), the
+    ring is empty and the replica owns every key, like a single scheduler.
+    """
+
+    def __init__(self, etcd, member_id=None, prefix=SCHEDULER_MEMBER_PREFIX, ttl=SCHEDULER_LEASE_TTL):
+        self.etcd = etcd
+        self.member_id = member_id or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self.key = f"{prefix}{self.member_id}"
+        self.ttl = ttl
+        self.ring = HashRing()
+        self.rebalances = 0
+        self._lease = None
+        self._listeners = []
+        self._members = set()
+        self._started = False
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self.informer = Informer(etcd, prefix)
+        self.informer.add_handler(self._on_member_put, self._on_member_delete)
+
+    def add_listener(self, on_change):
+        """
+        Call on_change() from the watch thread whenever the ring changes.
+        """
+        self._listeners.append(on_change)
+
+    def start(self):
+        """
+        Register this replica and follow the other members. Safe to call more than once.
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        try:
+            self._register()
+        except Exception:
+            traceback.print_exc()
+        self.informer.start()
+        threading.Thread(target=self._keep_alive, name="shard-lease", daemon=True).start()
+
+    def stop(self):
+        """
+        Leave the ring right away instead of waiting for the lease to expire.
+        """
+        self._stopped.set()
+        self.informer.stop()
+        if self._lease is not None:
+            try:
+                self._lease.revoke()
+            except Exception:
+                traceback.print_exc()
+
+    def owns(self, key):
+        owner = self.ring.owner(key)
+        return owner is None or owner == self.member_id
+
+    def _register(self):
+        lease = self.etcd.lease(self.ttl)
+        value = json.dumps({"id": self.member_id, "registered": time.time()})
+        self.etcd.put(self.key, value, lease=lease)
+        self._lease = lease
+
+    def _keep_alive(self):
+        # Refresh well within the TTL, and register again with a new lease if
+        # the old one expired (e.g. the process was paused or etcd restarted)
+        while not self._stopped.wait(self.ttl / 3):
+            try:
+                if self._lease is None:
+                    self._register()
+                    continue
+                responses = self._lease.refresh()
+                if not responses or responses[0].TTL <= 0:
+                    print(f"Scheduler lease {self._lease.id} expired, registering again")
+                    self._register()
+            except Exception:
+                traceback.print_exc()
+
+    def _on_member_put(self, key, member, mod_revision):
+        self._set_members(self._members | {key[len(self.informer.prefix):]})
+
+    def _on_member_delete(self, key):
+        self._set_members(self._members - {key[len(self.informer.prefix):]})
+
+    def _set_members(self, members):
+        # Called with the informer's lock held, so never concurrently
+        if members == self._members:
+            return
+        self._members = members
+        self.ring = HashRing(members)
+        self.rebalances += 1
+        print(f"Scheduler shard ring changed, members: {sorted(members)}")
+        for on_change in self._listeners:
+            try:
+                on_change()
+            except Exception:
+                traceback.print_exc()
+
+    def stats(self):
+        return {
+            "member_id": self.member_id,
+            "members": sorted(self.ring.members),
+            "rebalances": self.rebalances,
+        }
+
+
+class ShardQueue:
+    """
+    Unbound pods, and the ones of this replica's shard waiting to be
+    scheduled. A key is handed to one caller at a time, either the shard
+    worker or a scheduling request.
+    """
+
+    def __init__(self, owns):
+        self.owns = owns
+        self._unbound = set()
+        self._pending = collections.OrderedDict()  # key -> None, oldest first
+        self._claimed = set()
+        self._cond = threading.Condition()
+
+    def set_unbound(self, key, unbound):
+        with self._cond:
+            if not unbound:
+                self._unbound.discard(key)
+                self._pending.pop(key, None)
+                return
+            self._unbound.add(key)
+            if key not in self._claimed and self.owns(key):
+                self._pending[key] = None
+                self._cond.notify()
+
+    def requeue(self):
+        """
+        Queue every unbound pod this replica owns now and drop the others,
+        e.g. after the ring changed or to retry pods that did not fit.
+        """
+        with self._cond:
+            for key in self._unbound:
+                if not self.owns(key):
+                    self._pending.pop(key, None)
+                elif key not in self._claimed:
+                    self._pending.setdefault(key, None)
+            if self._pending:
+                self._cond.notify()
+
+    def claim(self, keys):
+        """
+        Take the keys nobody else is scheduling and return them.
+        """
+        with self._cond:
+            claimed = [key for key in keys if key not in self._claimed]
+            for key in claimed:
+                self._pending.pop(key, None)
+            self._claimed.update(claimed)
+            return claimed
+
+    def take(self, max_keys, timeout):
+        """
+        Claim up to max_keys pending keys, waiting at most timeout seconds
+        for the first one. Returns an empty list on timeout.
+        """
+        with self._cond:
+            if not self._pending:
+                self._cond.wait(timeout)
+            keys = []
+            while self._pending and len(keys) < max_keys:
+                keys.append(self._pending.popitem(last=False)[0])
+            self._claimed.update(keys)
+            return keys
+
+    def done(self, keys):
+        with self._cond:
+            self._claimed.difference_update(keys)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "unbound": len(self._unbound),
+                "pending": len(self._pending),
+                "claimed": len(self._claimed),
+            }
@@ -0,0 +1,17 @@
+"""
+The services import their own modules top-level (e.g. `import placement`),
+as they do in their containers, so their directories go on sys.path next to
+the repo root. Tests run on the in-memory etcd (common/memory_etcd.py) with
+JSON values, which needs neither a cluster nor an Auger build.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The services read these at import
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("STORAGE_CODEC", "json")
+os.environ.setdefault("SCHEDULER_SHARDING", "false")
+
+sys.path[:0] = [ROOT] + [os.path.join(ROOT, "services", name) for name in ("api_server", "scheduler", "controller")]
@@ -0,0 +1,81 @@
+"""
+The API server on the in-memory etcd, without the other services.
+"""
+import pytest
+
+import api_server
+
+NAMESPACE = "test-api-server"
+
+
+@pytest.fixture
+def client():
+    return api_server.app.test_client()
+
+
+def resource(name):
+    return {"kind": "Widget", "metadata": {"name": name, "namespace": NAMESPACE}, "spec": {}}
+
+
+@pytest.mark.parametrize("query", ["?async=true", "?async=false"])
+def test_create_fails_without_a_value_when_encoding_fails(client, monkeypatch, query):
+    monkeypatch.setattr(api_server, "encode", lambda key, obj: None)
+
+    response = client.post(f"/api/v1/widgets{query}", json=resource("unencodable"))
+
+    assert response.status_code == 500
+    assert response.get_json()["error"] == "Failed to encode resource"
+    key = f"/registry/widgets/{NAMESPACE}/unencodable"
+    assert api_server.etcd.get(key) == (None, None)
+    assert api_server.etcd.get(api_server.pending_key(key)) == (None, None)
+
+
+def test_an_unknown_resource_type_is_not_watched(client):
+    response = client.get(f"/api/v1/nosuchthings?namespace={NAMESPACE}&labelSelector=app%3Dweb")
+
+    assert response.status_code == 404
+    assert "nosuchthings" not in api_server.watch_hub.stats()
+
+
+def test_a_resource_type_with_objects_can_be_selected(client):
+    obj = resource("labelled")
+    obj["metadata"]["labels"] = {"app": "web"}
+    key = f"/registry/gadgets/{NAMESPACE}/labelled"
+    api_server.etcd.put(key, api_server.encode(key, obj))
+
+    response = client.get(f"/api/v1/gadgets?namespace={NAMESPACE}&labelSelector=app%3Dweb")
+
+    assert response.status_code == 200
+    assert "gadgets" in api_server.watch_hub.stats()
+
+
+def test_idle_caches_are_evicted():
+    hub = api_server.WatchHub(api_server.etcd, builtin_resources={"pods"}, idle_seconds=0)
+    cache = hub.get("pods")
+    cache.start()
+
+    hub.evict_idle()
+
+    assert hub.stats() == {}
+    assert not cache.informer._started
+
+
+def test_bulk_pod_create_reports_which_pods_were_stored(client, monkeypatch):
+    scheduled = [
+        {"status": "success", "assigned_node": "node-1"},
+        {"status": "failure", "reason": "Unschedulable", "error": "No node fits"},
+        {"status": "failure", "reason": "AlreadyExists", "error": "Pod already exists"},
+        {"status": "failure", "reason": "EncodeFailed", "error": "Failed to encode Pod"},
+    ]
+    monkeypatch.setattr(api_server, "trigger_scheduler_create", lambda pods: scheduled)
+    pods = [resource(name) for name in ("bound", "unbound", "existing", "unencodable")]
+
+    response = client.post("/api/v1/pods?async=false", json=pods)
+
+    assert response.status_code == 207
+    results = {result["name"]: result for result in response.get_json()["results"]}
+    assert {name: result["stored"] for name, result in results.items()} == {
+        "bound": True, "unbound": True, "existing": False, "unencodable": False,
+    }
+    assert results["existing"]["reason"] == "AlreadyExists"
+    assert results["unencodable"]["error"] == "Failed to encode resource"
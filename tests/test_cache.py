@@ -0,0 +1,87 @@
+import json
+
+from common.cache import ObjectCache, object_cache, parse_cached
+
+
+def test_get_requires_the_stored_revision():
+    cache = ObjectCache()
+    cache.put("/registry/pods/default/a", 5, {"metadata": {"name": "a"}})
+
+    assert cache.get("/registry/pods/default/a", 5) == {"metadata": {"name": "a"}}
+    assert cache.get("/registry/pods/default/a", 6) is None
+    assert cache.get("/registry/pods/default/b", 5) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_get_returns_a_copy():
+    cache = ObjectCache()
+    cache.put("key", 1, {"spec": {}})
+
+    cache.get("key", 1)["spec"]["nodeName"] = "node-0"
+
+    assert cache.get("key", 1) == {"spec": {}}
+
+
+def test_put_never_replaces_a_newer_revision():
+    cache = ObjectCache()
+    cache.put("key", 7, {"v": 7})
+    cache.put("key", 3, {"v": 3})
+
+    assert cache.get("key", 7) == {"v": 7}
+    assert cache.get("key", 3) is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_evicts_least_recently_used_entry():
+    cache = ObjectCache(max_entries=2)
+    cache.put("a", 1, {})
+    cache.put("b", 1, {})
+    cache.get("a", 1)
+    cache.put("c", 1, {})
+
+    assert cache.get("a", 1) == {}
+    assert cache.get("b", 1) is None
+    assert cache.get("c", 1) == {}
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_limit():
+    obj = {"data": "x" * 100}
+    size = len(json.dumps(obj))
+    cache = ObjectCache(max_bytes=2 * size)
+    for key in ("a", "b", "c"):
+        cache.put(key, 1, obj)
+
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] == 2 * size
+
+    # An object larger than the whole cache is not stored at all
+    cache.put("big", 1, {"data": "x" * 1000})
+    assert cache.get("big", 1) is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_invalidate_and_clear():
+    cache = ObjectCache()
+    cache.put("a", 1, {})
+    cache.put("b", 1, {})
+
+    cache.invalidate("a")
+    assert cache.get("a", 1) is None
+    assert cache.stats()["entries"] == 1
+
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bytes"] == 0
+
+
+def test_parse_cached_decodes_once_per_revision():
+    key = b"/registry/pods/test-cache/parse"
+    value = json.dumps({"metadata": {"name": "parse"}}).encode()
+    object_cache.invalidate(key.decode())
+    hits = object_cache.stats()["hits"]
+
+    assert parse_cached(key, value, 10) == {"metadata": {"name": "parse"}}
+    assert parse_cached(key, b"not decoded again", 10) == {"metadata": {"name": "parse"}}
+    assert object_cache.stats()["hits"] == hits + 1
@@ -0,0 +1,37 @@
+"""
+The Controller's calls to the API server, with the API server replaced.
+"""
+import controller
+
+
+class Response:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body or {}
+
+    def json(self):
+        return self.body
+
+
+def pod(name):
+    return {"kind": "Pod", "metadata": {"name": name, "namespace": "default"}, "spec": {}}
+
+
+def test_create_pod_batch_returns_the_pods_that_were_not_stored(monkeypatch):
+    results = [
+        {"name": "bound", "status": "scheduled", "stored": True},
+        {"name": "unbound", "status": "failure", "stored": True, "reason": "Unschedulable"},
+        {"name": "existing", "status": "failure", "stored": False, "reason": "AlreadyExists"},
+        {"name": "invalid", "status": "failure", "stored": False, "reason": "Invalid"},
+    ]
+    monkeypatch.setattr(controller.api_server_client, "post", lambda path, json: Response(207, {"results": results}))
+
+    not_created = controller.create_pod_batch([pod(result["name"]) for result in results])
+
+    assert not_created == ["existing", "invalid"]
+
+
+def test_create_pod_batch_counts_every_pod_of_a_rejected_batch(monkeypatch):
+    monkeypatch.setattr(controller.api_server_client, "post", lambda path, json: Response(400))
+
+    assert controller.create_pod_batch([pod("a"), pod("b")]) == ["a", "b"]
@@ -0,0 +1,305 @@
+"""
+Integration tests of the in-memory etcd, also through the helpers of
+common/ that the services use on top of it.
+"""
+import json
+import queue
+import threading
+import time
+
+import pytest
+
+from common.cas import put_if_unchanged, put_many_if_unchanged, update_object
+from common.etcd_client import LazyClient, RevisionCompacted
+from common.informer import Informer
+from common.memory_etcd import DeleteEvent, MemoryEtcd, PutEvent, shared_store
+
+TIMEOUT = 5
+
+
+@pytest.fixture
+def etcd():
+    return MemoryEtcd()
+
+
+def watch(etcd, prefix, start_revision=None):
+    """
+    Watch prefix and return a queue of the responses.
+    """
+    responses = queue.Queue()
+    etcd.add_watch_prefix_callback(prefix, responses.put, start_revision=start_revision)
+    return responses
+
+
+def test_writes_take_revisions(etcd):
+    first = etcd.put("/a", "1").header.revision
+    second = etcd.put("/a", "2").header.revision
+
+    value, metadata = etcd.get("/a")
+    assert value == b"2"
+    assert second == first + 1
+    assert metadata.create_revision == first
+    assert metadata.mod_revision == second
+    assert metadata.version == 2
+
+    assert etcd.delete("/a")
+    assert etcd.get("/a") == (None, None)
+    # Deleting a missing key changes nothing and takes no revision
+    assert not etcd.delete("/a")
+    assert etcd.status().revision == second + 1
+
+
+def test_reads_at_an_older_revision(etcd):
+    revision = etcd.put("/pods/a", "1").header.revision
+    etcd.put("/pods/a", "2")
+    etcd.put("/pods/b", "1")
+    etcd.delete("/pods/a")
+
+    old = etcd.range(b"/pods/", b"/pods0", revision=revision)
+    assert [(kv.key, kv.value) for kv in old.kvs] == [(b"/pods/a", b"1")]
+
+    latest = etcd.range(b"/pods/", b"/pods0")
+    assert [kv.key for kv in latest.kvs] == [b"/pods/b"]
+
+    with pytest.raises(ValueError):
+        etcd.range(b"/pods/", b"/pods0", revision=latest.header.revision + 1)
+
+
+def test_range_limit(etcd):
+    for name in "cab":
+        etcd.put(f"/pods/{name}", name)
+    etcd.put("/podsx", "outside")
+
+    response = etcd.range(b"/pods/", b"/pods0", limit=2)
+
+    assert [kv.key for kv in response.kvs] == [b"/pods/a", b"/pods/b"]
+    assert response.more
+    assert response.count == 3
+    assert [value for value, _ in etcd.get_prefix("/pods/")] == [b"a", b"b", b"c"]
+
+
+def test_transaction_is_atomic(etcd):
+    etcd.put("/a", "1")
+    txn = etcd.transactions
+    revision = etcd.status().revision
+
+    succeeded, _ = etcd.transaction(
+        compare=[txn.value("/a") == "1"],
+        success=[txn.put("/a", "2"), txn.put("/b", "2")],
+        failure=[],
+    )
+
+    assert succeeded
+    assert etcd.status().revision == revision + 1
+    assert etcd.get("/a")[1].mod_revision == etcd.get("/b")[1].mod_revision
+
+    succeeded, responses = etcd.transaction(
+        compare=[txn.value("/a") == "1"],
+        success=[txn.put("/a", "3")],
+        failure=[txn.get("/a")],
+    )
+    assert not succeeded
+    assert responses[0][0][0] == b"2"
+    assert not etcd.replace("/missing", "x", "y")
+
+
+def test_none_values_are_rejected(etcd):
+    with pytest.raises(TypeError):
+        etcd.put("/a", None)
+    with pytest.raises(TypeError):
+        etcd.transaction(compare=[], success=[etcd.transactions.put("/a", "1"), etcd.transactions.put("/b", None)])
+
+    assert etcd.get("/a") == (None, None)
+
+
+def test_failed_transaction_leaves_nothing_behind(etcd):
+    responses = watch(etcd, "/")
+    lease = etcd.lease(60)
+    etcd.put("/a", "1", lease=lease)
+    etcd.put("/b", "1")
+    revision = etcd.status().revision
+    txn = etcd.transactions
+
+    # The put of /c fails on the unknown lease after /a, /b and /d were written
+    with pytest.raises(ValueError):
+        etcd.transaction(compare=[], success=[
+            txn.put("/a", "2"), txn.delete("/b"), txn.put("/d", "2"), txn.put("/c", "2", lease=12345),
+        ])
+
+    assert etcd.status().revision == revision
+    assert etcd.get("/a")[0] == b"1"
+    assert etcd.get("/b")[0] == b"1"
+    assert etcd.get("/d") == (None, None)
+    assert [kv.key for kv in etcd.range(b"/", b"0").kvs] == [b"/a", b"/b"]
+    assert lease.keys == [b"/a"]
+    assert etcd.put("/e", "1").header.revision == revision + 1
+    # Only the two puts before the transaction and the one after it are watched
+    assert [responses.get(timeout=TIMEOUT).events[0].key for _ in range(3)] == [b"/a", b"/b", b"/e"]
+
+
+def test_put_if_unchanged(etcd):
+    etcd.put("/a", "1")
+    mod_revision = etcd.get("/a")[1].mod_revision
+
+    assert put_if_unchanged(etcd, "/a", "2", mod_revision) == (True, None)
+
+    succeeded, current = put_if_unchanged(etcd, "/a", "3", mod_revision)
+    assert not succeeded
+    assert current[0] == b"2"
+
+    # mod_revision 0 creates a key only if it does not exist
+    assert put_if_unchanged(etcd, "/new", "1", 0) == (True, None)
+    assert not put_if_unchanged(etcd, "/new", "2", 0)[0]
+
+
+def test_put_many_if_unchanged_writes_the_unchanged_keys(etcd):
+    etcd.put("/a", "1")
+    etcd.put("/b", "1")
+    a = etcd.get("/a")[1].mod_revision
+    b = etcd.get("/b")[1].mod_revision
+    etcd.put("/b", "changed")
+
+    conflicts = put_many_if_unchanged(etcd, [("/a", "2", a), ("/b", "2", b), ("/c", "2", 0)])
+
+    assert list(conflicts) == ["/b"]
+    assert conflicts["/b"][0] == b"changed"
+    assert etcd.get("/a")[0] == b"2"
+    assert etcd.get("/b")[0] == b"changed"
+    assert etcd.get("/c")[0] == b"2"
+
+
+def test_update_object_retries_on_conflict(etcd):
+    key = "/registry/pods/test-memory-etcd/update"
+    etcd.put(key, json.dumps({"metadata": {"labels": {}}}))
+    stale = etcd.get(key)[1].mod_revision
+    etcd.put(key, json.dumps({"metadata": {"labels": {"a": "1"}}}))
+
+    def apply(obj):
+        obj["metadata"]["labels"]["b"] = "2"
+        return True
+
+    stored = update_object(etcd, key, {"metadata": {"labels": {}}}, stale, apply)
+
+    assert stored["metadata"]["labels"] == {"a": "1", "b": "2"}
+    assert json.loads(etcd.get(key)[0]) == stored
+
+
+def test_watch_delivers_events_in_order(etcd):
+    responses = watch(etcd, "/pods/")
+    etcd.put("/pods/a", "1")
+    etcd.put("/other", "1")
+    etcd.delete("/pods/a")
+
+    put = responses.get(timeout=TIMEOUT)
+    delete = responses.get(timeout=TIMEOUT)
+
+    assert [type(event) for event in put.events] == [PutEvent]
+    assert [type(event) for event in delete.events] == [DeleteEvent]
+    assert delete.header.revision == put.header.revision + 2
+    assert responses.empty()
+
+
+def test_watch_replays_from_a_revision(etcd):
+    revision = etcd.put("/pods/a", "1").header.revision
+    etcd.put("/pods/b", "1")
+
+    responses = watch(etcd, "/pods/", start_revision=revision + 1)
+
+    assert responses.get(timeout=TIMEOUT).events[0].key == b"/pods/b"
+
+
+def test_watch_from_a_compacted_revision(etcd):
+    revision = etcd.put("/pods/a", "1").header.revision
+    etcd.put("/pods/a", "2")
+    etcd.compact(revision + 1)
+
+    responses = watch(etcd, "/pods/", start_revision=revision)
+
+    assert isinstance(responses.get(timeout=TIMEOUT), RevisionCompacted)
+    with pytest.raises(RevisionCompacted):
+        etcd.range(b"/pods/", b"/pods0", revision=revision)
+
+
+def test_compaction_keeps_the_latest_versions():
+    etcd = MemoryEtcd(history=10)
+    first = etcd.put("/a", "0").header.revision
+    for i in range(1, 50):
+        etcd.put("/a", str(i))
+    etcd.put("/b", "1")
+    etcd.delete("/b")
+
+    assert etcd.get("/a")[0] == b"49"
+    assert etcd.get("/b") == (None, None)
+    with pytest.raises(RevisionCompacted):
+        etcd.range(b"/a", b"/a\0", revision=first)
+    latest = etcd.status().revision
+    assert etcd.range(b"/a", b"/a\0", revision=latest - 10).kvs[0].value == b"41"
+
+
+def test_callback_may_write_to_the_store(etcd):
+    # Callbacks run on the dispatcher thread, so a callback that writes
+    # does not deadlock the store
+    done = threading.Event()
+
+    def on_put(response):
+        for event in response.events:
+            if event.key == b"/pods/a":
+                etcd.put("/pods/b", "1")
+            else:
+                done.set()
+
+    etcd.add_watch_prefix_callback("/pods/", on_put)
+    etcd.put("/pods/a", "1")
+
+    assert done.wait(TIMEOUT)
+
+
+def test_revoking_a_lease_deletes_its_keys(etcd):
+    lease = etcd.lease(60)
+    etcd.put("/leader", "me", lease=lease)
+    etcd.put("/other", "1")
+
+    assert lease.keys == [b"/leader"]
+    assert 0 < lease.remaining_ttl <= 60
+
+    lease.revoke()
+
+    assert etcd.get("/leader") == (None, None)
+    assert etcd.get("/other")[0] == b"1"
+    assert lease.remaining_ttl == -1
+
+
+def test_expired_lease_deletes_its_keys(etcd):
+    lease = etcd.lease(0.1)
+    etcd.put("/leader", "me", lease=lease)
+
+    deadline = time.monotonic() + TIMEOUT
+    while etcd.get("/leader")[0] is not None and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert etcd.get("/leader") == (None, None)
+    with pytest.raises(ValueError):
+        etcd.put("/leader", "me", lease=lease)
+
+
+def test_informer_lists_then_watches():
+    client = LazyClient(backend="memory")
+    prefix = "/registry/pods/test-memory-etcd-informer/"
+    client.put(prefix + "a", json.dumps({"metadata": {"name": "a"}}))
+    puts = queue.Queue()
+    deletes = queue.Queue()
+    informer = Informer(client, prefix)
+    informer.add_handler(lambda key, obj, mod_revision: puts.put(key), deletes.put)
+
+    informer.start()
+    try:
+        assert puts.get(timeout=TIMEOUT) == prefix + "a"
+        client.put(prefix + "b", json.dumps({"metadata": {"name": "b"}}))
+        client.delete(prefix + "a")
+
+        assert puts.get(timeout=TIMEOUT) == prefix + "b"
+        assert deletes.get(timeout=TIMEOUT) == prefix + "a"
+        assert sorted(informer.keys()) == [prefix + "b"]
+    finally:
+        informer.stop()
+        shared_store().delete_prefix(prefix)
@@ -0,0 +1,97 @@
+import pytest
+
+from common.memory_etcd import MemoryEtcd
+from common.pagination import (
+    ContinueTokenExpired, InvalidContinueToken, decode_continue, encode_continue, list_page, prefix_end, scan_prefix,
+)
+
+PREFIX = "/registry/pods/default/"
+
+
+@pytest.fixture
+def etcd():
+    etcd = MemoryEtcd()
+    for i in range(5):
+        etcd.put(f"{PREFIX}pod-{i}", f"value-{i}")
+    # Neighbouring prefixes must not leak into the listing
+    etcd.put("/registry/pods/default", "x")
+    etcd.put("/registry/pods/kube-system/pod-0", "x")
+    return etcd
+
+
+def keys(pages):
+    return [kv.key.decode() for page in pages for kv in page.kvs]
+
+
+def test_prefix_end():
+    assert prefix_end("/a/") == b"/a0"
+    assert prefix_end(b"ab") == b"ac"
+
+
+def test_continue_token_round_trip():
+    token = encode_continue(42, (PREFIX + "pod-1\0").encode())
+
+    assert decode_continue(token, PREFIX) == (42, (PREFIX + "pod-1\0").encode())
+
+
+@pytest.mark.parametrize("token", ["", "not base64!", encode_continue(0, PREFIX.encode())])
+def test_invalid_continue_token(token):
+    with pytest.raises(InvalidContinueToken):
+        decode_continue(token, PREFIX)
+
+
+def test_continue_token_of_another_prefix():
+    token = encode_continue(5, b"/registry/services/x")
+
+    with pytest.raises(InvalidContinueToken):
+        decode_continue(token, PREFIX)
+
+
+def test_list_page_limit_and_continue(etcd):
+    first = list_page(etcd, PREFIX, 2)
+
+    assert keys([first]) == [PREFIX + "pod-0", PREFIX + "pod-1"]
+    assert first.remaining == 3
+    assert first.next_key == (PREFIX + "pod-1\0").encode()
+
+    token = encode_continue(first.revision, first.next_key)
+    second = list_page(etcd, PREFIX, 2, token)
+    assert keys([second]) == [PREFIX + "pod-2", PREFIX + "pod-3"]
+    assert second.revision == first.revision
+
+
+def test_last_page_has_no_next_key(etcd):
+    page = list_page(etcd, PREFIX, 10)
+
+    assert len(page.kvs) == 5
+    assert page.next_key is None
+    assert page.remaining == 0
+
+
+def test_keys_only(etcd):
+    page = list_page(etcd, PREFIX, 10, keys_only=True)
+
+    assert all(kv.value == b"" for kv in page.kvs)
+
+
+def test_scan_prefix_reads_one_snapshot(etcd):
+    pages = scan_prefix(etcd, PREFIX, page_size=2)
+    first = next(pages)
+    # Writes after the first page do not show up in later pages
+    etcd.put(PREFIX + "pod-9", "new")
+    etcd.delete(PREFIX + "pod-4")
+
+    rest = list(pages)
+
+    assert keys([first] + rest) == [PREFIX + f"pod-{i}" for i in range(5)]
+    assert [len(page.kvs) for page in rest] == [2, 1]
+
+
+def test_compacted_revision_expires_the_token(etcd):
+    first = list_page(etcd, PREFIX, 2)
+    token = encode_continue(first.revision, first.next_key)
+    etcd.put(PREFIX + "pod-9", "new")
+    etcd.compact(first.revision + 1)
+
+    with pytest.raises(ContinueTokenExpired):
+        list_page(etcd, PREFIX, 2, token)
@@ -0,0 +1,143 @@
+import pytest
+
+from node_inventory import NodeInfo
+from placement import DEFAULT_CPU_REQUEST, DEFAULT_MEMORY_REQUEST, NoFitError, PlacementEngine, pod_requests
+
+GI = 1024 ** 3
+
+
+def node(name, cpu=4000, memory=8 * GI, pods=110):
+    return NodeInfo(name, True, True, {}, {"cpu": cpu, "memory": memory, "pods": pods})
+
+
+def pod(cpu=None, memory=None, init=None):
+    requests = {}
+    if cpu is not None:
+        requests["cpu"] = cpu
+    if memory is not None:
+        requests["memory"] = memory
+    spec = {"containers": [{"name": "app", "resources": {"requests": requests}}]}
+    if init is not None:
+        spec["initContainers"] = [{"name": "init", "resources": {"requests": init}}]
+    return {"metadata": {"name": "pod"}, "spec": spec}
+
+
+def test_pod_requests_sums_containers():
+    spec = {"containers": [
+        {"resources": {"requests": {"cpu": "250m", "memory": "64Mi"}}},
+        {"resources": {"requests": {"cpu": "1"}}},
+    ]}
+
+    requests = pod_requests({"spec": spec})
+
+    assert requests["cpu"] == 1250
+    assert requests["memory"] == 64 * 1024 ** 2
+    assert requests["pods"] == 1
+    # The container without a memory request counts with the default for scoring
+    assert requests["nonzero_memory"] == 64 * 1024 ** 2 + DEFAULT_MEMORY_REQUEST
+
+
+def test_pod_requests_takes_the_largest_init_container():
+    assert pod_requests(pod(cpu="500m", init={"cpu": "2"}))["cpu"] == 2000
+    assert pod_requests(pod(cpu="500m", init={"cpu": "100m"}))["cpu"] == 500
+
+
+def test_pod_requests_defaults_only_for_scoring():
+    requests = pod_requests({"spec": {"containers": [{"name": "app"}]}})
+
+    assert requests["cpu"] == 0
+    assert requests["memory"] == 0
+    assert requests["nonzero_cpu"] == DEFAULT_CPU_REQUEST
+    assert requests["nonzero_memory"] == DEFAULT_MEMORY_REQUEST
+
+
+def test_least_allocated_spreads_pods_without_requests():
+    engine = PlacementEngine(policy="least_allocated")
+    nodes = [node(f"node-{i}") for i in range(4)]
+
+    placed = [engine.reserve(f"pod-{i}", {"spec": {"containers": [{"name": "app"}]}}, nodes) for i in range(8)]
+
+    assert sorted(placed) == sorted([n.name for n in nodes] * 2)
+    assert engine.committed("node-0") == {"cpu": 0, "memory": 0, "pods": 2}
+
+
+def test_most_allocated_packs_pods():
+    engine = PlacementEngine(policy="most_allocated")
+    nodes = [node("node-0"), node("node-1")]
+
+    placed = {engine.reserve(f"pod-{i}", pod(cpu="1"), nodes) for i in range(4)}
+
+    assert len(placed) == 1
+
+
+def test_filters_nodes_without_room():
+    engine = PlacementEngine()
+    nodes = [node("small", cpu=500), node("large", cpu=4000)]
+
+    assert engine.reserve("a", pod(cpu="1"), nodes) == "large"
+    with pytest.raises(NoFitError):
+        engine.reserve("b", pod(cpu="8"), nodes)
+
+
+def test_pod_capacity():
+    engine = PlacementEngine()
+    nodes = [node("node-0", pods=1)]
+
+    engine.reserve("a", pod(), nodes)
+    with pytest.raises(NoFitError):
+        engine.reserve("b", pod(), nodes)
+
+
+def test_release_gives_back_requests():
+    engine = PlacementEngine()
+    nodes = [node("node-0")]
+    engine.reserve("a", pod(cpu="1", memory="1Gi"), nodes)
+
+    engine.release("a")
+
+    assert engine.committed("node-0") == {"cpu": 0, "memory": 0, "pods": 0}
+    assert engine.node_of("a") is None
+
+
+def test_release_ignores_another_node():
+    engine = PlacementEngine()
+    engine.bind("a", "node-1", pod(cpu="1"))
+
+    engine.release("a", "node-0")
+
+    assert engine.node_of("a") == "node-1"
+    assert engine.committed("node-1")["cpu"] == 1000
+
+
+def test_bind_moves_a_pod():
+    engine = PlacementEngine()
+    engine.bind("a", "node-0", pod(cpu="1"))
+    engine.bind("a", "node-0", pod(cpu="1"))
+    assert engine.committed("node-0")["cpu"] == 1000
+
+    engine.bind("a", "node-1", pod(cpu="1"))
+
+    assert engine.committed("node-0")["cpu"] == 0
+    assert engine.committed("node-1")["cpu"] == 1000
+
+
+def test_reserve_releases_the_previous_node():
+    engine = PlacementEngine()
+    engine.bind("a", "node-0", pod(cpu="3"))
+
+    assert engine.reserve("a", pod(cpu="3"), [node("node-0")]) == "node-0"
+    assert engine.committed("node-0")["cpu"] == 3000
+
+
+def test_nodes_to_score_rotates_the_start():
+    engine = PlacementEngine(nodes_to_score=1)
+    nodes = [node(f"node-{i}") for i in range(3)]
+
+    placed = [engine.reserve(f"pod-{i}", pod(cpu="1"), nodes) for i in range(3)]
+
+    assert placed == ["node-0", "node-1", "node-2"]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        PlacementEngine(policy="random")
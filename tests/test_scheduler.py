@@ -0,0 +1,125 @@
+"""
+The scheduler on the in-memory etcd.
+"""
+import json
+import threading
+import time
+
+import pytest
+
+import scheduler
+
+PREFIX = "/registry/pods/test-scheduler/"
+TIMEOUT = 5
+
+
+def pod(name, node_name=None, cpu=None):
+    container = {"name": "app"}
+    if cpu is not None:
+        container["resources"] = {"requests": {"cpu": cpu}}
+    spec = {"containers": [container]}
+    if node_name:
+        spec["nodeName"] = node_name
+    return json.dumps({"metadata": {"name": name, "namespace": "test-scheduler"}, "spec": spec})
+
+
+def wait_until(predicate):
+    deadline = time.monotonic() + TIMEOUT
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def add_nodes(*names):
+    for name in names:
+        scheduler.etcd.put(f"/registry/minions/{name}", json.dumps({
+            "metadata": {"name": name},
+            "status": {
+                "allocatable": {"cpu": "4", "memory": "8Gi", "pods": "110"},
+                "conditions": [{"type": "Ready", "status": "True"}],
+            },
+        }))
+    assert wait_until(lambda: set(names) <= {node.name for node in scheduler.fetch_available_nodes()})
+
+
+def test_wait_for_bindings_does_not_block_the_pod_watch():
+    # wait_for_bindings used to hold binding_changed while it took the
+    # informer's lock, and the pod watch takes them in the other order
+    scheduler.start_informers()
+    unbound = [f"{PREFIX}unbound-{i}" for i in range(300)]
+    for key in unbound:
+        scheduler.etcd.put(key, pod(key))
+
+    stop = time.monotonic() + 1
+
+    def wait():
+        while time.monotonic() < stop:
+            scheduler.wait_for_bindings(unbound, 0.05)
+
+    def bind():
+        i = 0
+        while time.monotonic() < stop:
+            scheduler.etcd.put(f"{PREFIX}bound-{i % 50}", pod("bound", "node-0"))
+            i += 1
+
+    threads = [threading.Thread(target=wait, daemon=True) for _ in range(8)]
+    threads.append(threading.Thread(target=bind, daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(TIMEOUT)
+
+    assert not any(thread.is_alive() for thread in threads)
+
+    # The watch still delivers, and a waiter sees a pod bound after it started waiting
+    key = f"{PREFIX}late"
+    scheduler.etcd.put(key, pod("late"))
+    assert wait_until(lambda: scheduler.pod_informer.has(key))
+    threading.Timer(0.2, lambda: scheduler.etcd.put(key, pod("late", "node-1"))).start()
+    assert scheduler.wait_for_bindings([key], TIMEOUT) == {key: "node-1"}
+
+
+def test_schedule_batch_reports_a_malformed_pod_alone():
+    add_nodes("test-scheduler-batch")
+    keys = [f"{PREFIX}batch-{i}" for i in range(3)]
+    scheduler.etcd.put(keys[0], pod("batch-0", cpu="100m"))
+    scheduler.etcd.put(keys[1], pod("batch-1", cpu="abc"))
+    scheduler.etcd.put(keys[2], pod("batch-2", cpu="100m"))
+
+    results = scheduler.schedule_batch(keys)
+
+    assert [result["status"] for result in results] == ["success", "failure", "success"]
+    assert "abc" in results[1]["error"]
+    assert scheduler.placement.node_of(keys[1]) is None
+    for key, result in zip(keys[::2], results[::2]):
+        assert scheduler.placement.node_of(key) == result["assigned_node"]
+        assert json.loads(scheduler.etcd.get(key)[0])["spec"]["nodeName"] == result["assigned_node"]
+
+
+def test_create_bound_rejects_a_malformed_pod_alone():
+    add_nodes("test-scheduler-create")
+    keys = [f"{PREFIX}create-{i}" for i in range(3)]
+    pods = [json.loads(pod(f"create-{i}", cpu=cpu)) for i, cpu in enumerate(("100m", "abc", "100m"))]
+
+    results = scheduler.create_bound(list(zip(keys, pods)))
+
+    assert [result["status"] for result in results] == ["success", "failure", "success"]
+    assert results[1]["reason"] == "Invalid"
+    assert scheduler.etcd.get(keys[1]) == (None, None)
+    assert scheduler.placement.node_of(keys[1]) is None
+    for key, result in zip(keys[::2], results[::2]):
+        assert json.loads(scheduler.etcd.get(key)[0])["spec"]["nodeName"] == result["assigned_node"]
+
+
+def test_create_bound_releases_reservations_when_the_write_fails(monkeypatch):
+    add_nodes("test-scheduler-create")
+    key = f"{PREFIX}create-failed"
+
+    def fail(*args):
+        raise RuntimeError("etcd is down")
+
+    monkeypatch.setattr(scheduler, "put_many_if_unchanged", fail)
+    with pytest.raises(RuntimeError):
+        scheduler.create_bound([(key, json.loads(pod("create-failed", cpu="100m")))])
+
+    assert scheduler.placement.node_of(key) is None
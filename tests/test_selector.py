@@ -0,0 +1,108 @@
+import pytest
+
+from common.index import SelectorIndex
+from common.selector import (
+    Requirement, SelectorError, matches, object_fields, object_labels, parse_field_selector, parse_label_selector,
+)
+
+
+def test_parse_label_selector():
+    requirements = parse_label_selector("app=web, tier==front,env!=prod,zone in (a, b),track notin (canary),gpu,!spot")
+
+    assert requirements == [
+        Requirement("app", "=", frozenset(["web"])),
+        Requirement("tier", "=", frozenset(["front"])),
+        Requirement("env", "!=", frozenset(["prod"])),
+        Requirement("zone", "in", frozenset(["a", "b"])),
+        Requirement("track", "notin", frozenset(["canary"])),
+        Requirement("gpu", "exists", frozenset()),
+        Requirement("spot", "!exists", frozenset()),
+    ]
+
+
+@pytest.mark.parametrize("selector", [None, "", " , "])
+def test_empty_selector_has_no_requirements(selector):
+    assert parse_label_selector(selector) == []
+    assert parse_field_selector(selector) == []
+
+
+@pytest.mark.parametrize("selector", ["app=web=x", "zone in (a", "a b", "=web"])
+def test_invalid_label_selector(selector):
+    with pytest.raises(SelectorError):
+        parse_label_selector(selector)
+
+
+def test_parse_field_selector():
+    requirements = parse_field_selector("spec.nodeName=,status.phase!=Running")
+
+    assert requirements == [
+        Requirement("spec.nodeName", "=", frozenset([""])),
+        Requirement("status.phase", "!=", frozenset(["Running"])),
+    ]
+
+
+@pytest.mark.parametrize("selector", ["metadata.uid=x", "status.phase in (Running)"])
+def test_invalid_field_selector(selector):
+    with pytest.raises(SelectorError):
+        parse_field_selector(selector)
+
+
+def test_object_labels_and_fields():
+    obj = {"metadata": {"labels": {"replicas": 3}}, "spec": {}, "status": {"phase": "Pending"}}
+
+    assert object_labels(obj) == {"replicas": "3"}
+    assert object_fields("/registry/pods/default/web-0", obj) == {
+        "metadata.name": "web-0",
+        "metadata.namespace": "default",
+        "spec.nodeName": "",
+        "status.phase": "Pending",
+    }
+
+
+@pytest.mark.parametrize("selector, expected", [
+    ("app=web", True),
+    ("app=db", False),
+    ("app in (db,web)", True),
+    ("app notin (web)", False),
+    ("env!=prod", True),  # missing keys match != and notin
+    ("env notin (prod)", True),
+    ("app", True),
+    ("!app", False),
+    ("env", False),
+    ("!env", True),
+])
+def test_label_matches(selector, expected):
+    assert matches(parse_label_selector(selector), [], {"app": "web"}, {}) is expected
+
+
+def test_field_matches_unscheduled_pods():
+    requirements = parse_field_selector("spec.nodeName=")
+    unscheduled = object_fields("/registry/pods/default/a", {"spec": {}})
+    scheduled = object_fields("/registry/pods/default/b", {"spec": {"nodeName": "node-0"}})
+
+    assert matches([], requirements, {}, unscheduled)
+    assert not matches([], requirements, {}, scheduled)
+
+
+def test_selector_index():
+    index = SelectorIndex()
+    index.on_put("/registry/pods/default/web-0", {"metadata": {"labels": {"app": "web"}}, "spec": {}}, 2)
+    index.on_put("/registry/pods/default/web-1", {"metadata": {"labels": {"app": "web"}},
+                                                  "spec": {"nodeName": "node-0"}}, 3)
+    index.on_put("/registry/pods/default/db-0", {"metadata": {"labels": {"app": "db"}}, "spec": {}}, 4)
+    index.on_put("/registry/pods/other/web-0", {"metadata": {"labels": {"app": "web"}}, "spec": {}}, 5)
+
+    def select(labels="", fields=""):
+        return index.select("default", parse_label_selector(labels), parse_field_selector(fields))
+
+    assert select("app=web") == {"/registry/pods/default/web-0": 2, "/registry/pods/default/web-1": 3}
+    assert select("app=web", "spec.nodeName=") == {"/registry/pods/default/web-0": 2}
+    assert select("app!=web") == {"/registry/pods/default/db-0": 4}
+    assert len(select()) == 3
+
+    # A relabelled pod leaves its old terms
+    index.on_put("/registry/pods/default/web-0", {"metadata": {"labels": {"app": "db"}}, "spec": {}}, 6)
+    assert select("app=web") == {"/registry/pods/default/web-1": 3}
+
+    index.on_delete("/registry/pods/default/web-1")
+    assert select("app=web") == {}
@@ -0,0 +1,71 @@
+import collections
+
+from sharding import HashRing, ShardQueue
+
+
+def test_empty_ring_has_no_owner():
+    assert HashRing().owner("/registry/pods/default/a") is None
+
+
+def test_ring_spreads_keys_over_members():
+    ring = HashRing(["a", "b", "c"])
+    owners = collections.Counter(ring.owner(f"/registry/pods/default/pod-{i}") for i in range(3000))
+
+    assert set(owners) == {"a", "b", "c"}
+    assert min(owners.values()) > 500
+
+
+def test_only_the_keys_of_a_leaving_member_move():
+    keys = [f"/registry/pods/default/pod-{i}" for i in range(1000)]
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b"])
+
+    moved = [key for key in keys if before.owner(key) != after.owner(key)]
+
+    assert moved
+    assert all(before.owner(key) == "c" for key in moved)
+
+
+def test_queue_holds_owned_unbound_keys():
+    queue = ShardQueue(lambda key: key != "other")
+    for key in ("a", "b", "other"):
+        queue.set_unbound(key, True)
+
+    assert queue.take(10, 0) == ["a", "b"]
+    assert queue.stats() == {"unbound": 3, "pending": 0, "claimed": 2}
+
+
+def test_claimed_keys_are_handed_out_once():
+    queue = ShardQueue(lambda key: True)
+    queue.set_unbound("a", True)
+    queue.set_unbound("b", True)
+
+    assert queue.claim(["a"]) == ["a"]
+    assert queue.claim(["a", "b"]) == ["b"]
+    assert queue.take(10, 0) == []
+
+    queue.done(["a"])
+    queue.requeue()
+    assert queue.take(10, 0) == ["a"]
+
+
+def test_bound_keys_leave_the_queue():
+    queue = ShardQueue(lambda key: True)
+    queue.set_unbound("a", True)
+    queue.set_unbound("a", False)
+    queue.requeue()
+
+    assert queue.take(10, 0) == []
+    assert queue.stats()["unbound"] == 0
+
+
+def test_requeue_follows_ownership():
+    owned = {"a", "b"}
+    queue = ShardQueue(lambda key: key in owned)
+    queue.set_unbound("a", True)
+    queue.set_unbound("b", True)
+
+    owned.discard("b")
+    queue.requeue()
+
+    assert queue.take(10, 0) == ["a"]
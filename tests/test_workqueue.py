@@ -0,0 +1,97 @@
+import threading
+import time
+
+from workqueue import RateLimiter, TokenBucket, WorkQueue
+
+
+def queue(**kwargs):
+    # No global limit unless a test asks for one
+    kwargs.setdefault("qps", 1000)
+    kwargs.setdefault("burst", 1000)
+    return WorkQueue(RateLimiter(**kwargs))
+
+
+def test_add_deduplicates():
+    work = queue()
+    for key in ("a", "b", "a", "a"):
+        work.add(key)
+
+    assert len(work) == 2
+    assert work.get() == "a"
+    assert work.get() == "b"
+    assert work.stats()["deduplicated"] == 2
+
+
+def test_key_added_while_processing_is_queued_after_done():
+    work = queue()
+    work.add("a")
+    assert work.get() == "a"
+
+    work.add("a")
+    work.add("a")
+    # Not handed to a second worker while the first one holds it
+    assert len(work) == 0
+
+    work.done("a")
+    assert len(work) == 1
+    assert work.get() == "a"
+    work.done("a")
+    assert len(work) == 0
+
+
+def test_add_after_delays_the_key():
+    work = queue()
+    work.add_after("a", 0.05)
+    assert len(work) == 0
+    assert work.stats()["waiting"] == 1
+
+    started = time.monotonic()
+    assert work.get() == "a"
+    assert time.monotonic() - started >= 0.04
+
+
+def test_get_returns_none_on_shutdown():
+    work = queue()
+    keys = []
+    worker = threading.Thread(target=lambda: keys.append(work.get()))
+    worker.start()
+
+    work.shutdown()
+    worker.join(1)
+
+    assert keys == [None]
+    work.add("a")
+    assert len(work) == 0
+
+
+def test_rate_limiter_backs_off_per_key():
+    limiter = RateLimiter(base_delay=0.01, max_delay=0.05, qps=1000, burst=1000)
+
+    assert [limiter.when("a") for _ in range(4)] == [0.01, 0.02, 0.04, 0.05]
+    assert limiter.when("b") == 0.01
+    assert limiter.retries("a") == 4
+
+    limiter.forget("a")
+    assert limiter.retries("a") == 0
+    assert limiter.when("a") == 0.01
+
+
+def test_token_bucket_limits_after_the_burst():
+    bucket = TokenBucket(rate=10, burst=2)
+
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert 0.09 <= bucket.reserve() <= 0.1
+    assert 0.19 <= bucket.reserve() <= 0.2
+
+
+def test_add_rate_limited_retries_the_key():
+    work = queue(base_delay=0.01)
+    work.add_rate_limited("a")
+
+    assert work.get() == "a"
+    assert work.stats()["retries"] == 1
+    assert work.rate_limiter.retries("a") == 1
+
+    work.forget("a")
+    assert work.rate_limiter.retries("a") == 0